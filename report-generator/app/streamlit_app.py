@@ -1,27 +1,35 @@
+import hashlib
 import json
+import os
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
 import sys
-from datetime import date
+import time
+from datetime import date, datetime
 
 import streamlit as st
 import base64
 import io
 import tempfile
-import uuid
 
 
 
 
+# start of this script run (Streamlit re-executes the whole file on every interaction)
+_RUN_STARTED = time.perf_counter()
+
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from configs.defaults import DEFAULT_CONTEXT
-from pdf.generate_report import generate_report
+from pdf.context import new_context, context_from_draft, prepare_for_render
 from configs.lasers import LASER_PRESETS
 from configs.test_setup import TEST_SETUP_PRESETS
+from storage.uploads import UploadStore, draft_references
+from storage.drafts import DraftRepository, PAGE_SIZE as DRAFT_PAGE_SIZE
+from storage.autosave import AutosaveStore
 
 
 # ---------------- Page config ----------------
@@ -36,15 +44,206 @@ st.set_page_config(
 TEMPLATE_DRAFT = ROOT / "assets" / "templates" / "test_draft.json"
 BANNER_LOGO_SVG = ROOT / "assets" / "logos" / "logo_white.svg"
 OUT_DIR = ROOT / "data" / "generated"
-OUT_PDF = OUT_DIR / "latest.pdf"
 DRAFTS_DIR = ROOT / "data" / "drafts"
+AUTOSAVE_DIR = ROOT / "data" / "autosave"
 
 UPLOAD_FOLDER = Path(__file__).resolve().parent.parent / "data" / "uploads"
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+# unreferenced uploads older than this are garbage-collected
+UPLOAD_GC_MAX_AGE_S = 7 * 24 * 3600
+# autosaves nobody has edited for this long are deleted
+AUTOSAVE_MAX_AGE_S = 30 * 24 * 3600
+
+upload_store = UploadStore(UPLOAD_FOLDER, max_age_s=UPLOAD_GC_MAX_AGE_S)
+
+# ---------------- Cached static data ----------------
+# Anything that does not depend on the session is computed once per server
+# process instead of on every rerun; file-backed entries are keyed by mtime,
+# so an edited asset or a new draft shows up on the next rerun.
+
+def _mtime_ns(path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+@st.cache_data(show_spinner=False)
+def _banner_svg_b64(path_str, mtime_ns):
+    return b64encode(Path(path_str).read_bytes()).decode("utf-8")
+
+
+@st.cache_resource(show_spinner=False)
+def _draft_repository():
+    # one index connection for all sessions; it re-syncs with the directory on every search
+    return DraftRepository(DRAFTS_DIR)
+
+
+def _draft_label(entry):
+    if entry.error:
+        return f"{entry.name} (unreadable)"
+    modified = datetime.fromtimestamp(entry.mtime_ns / 1e9)
+    details = " · ".join(v for v in (entry.customer, entry.standard, entry.laser) if v)
+    return f"{entry.sample or entry.name} — {details or entry.name} · {modified:%Y-%m-%d %H:%M}"
+
+
+@st.cache_resource(show_spinner=False)
+def _autosave_store():
+    # shared so that tabs editing the same autosave append to one journal
+    return AutosaveStore(AUTOSAVE_DIR, max_age_s=AUTOSAVE_MAX_AGE_S)
+
+
+def _start_autosave(autosave_id=None):
+    """Autosave this session's form under `autosave_id` (default: a new one) and put it in the URL."""
+    session = _autosave_store().session(autosave_id)
+    st.session_state["autosave"] = session
+    st.query_params["autosave"] = session.id
+    return session
+
+
+@st.cache_resource(show_spinner=False)
+def _laser_preset_labels():
+    return {k: v["label"] for k, v in LASER_PRESETS.items()}
+
+
+def _show_run_time():
+    """Sidebar readout of this script run's duration (and the recent median)."""
+    ms = (time.perf_counter() - _RUN_STARTED) * 1e3
+    history = st.session_state.setdefault("run_times_ms", [])
+    history.append(ms)
+    del history[:-20]
+    recent = sorted(history)[len(history) // 2]
+    st.sidebar.caption(f"Rerun: {ms:.0f} ms (median of last {len(history)}: {recent:.0f} ms)")
+
+
+def _live_upload_refs():
+    refs = draft_references(DRAFTS_DIR) | draft_references(AUTOSAVE_DIR)
+    form = st.session_state.get("form") or {}
+    image = form.get("sections_data", {}).get("test_setup", {}).get("image")
+    if image:
+        refs.add(Path(image).name)
+    return refs
+
+
+# expired autosaves first, so the uploads only they referenced can go in the same pass
+_autosave_store().maybe_prune()
+upload_store.maybe_gc(_live_upload_refs)
+
+# ---------------- Background PDF rendering ----------------
+@st.cache_resource
+def _render_executor():
+    # shared by all sessions of this server process
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-render")
+
+
+def _context_key(ctx):
+    """Content hash of a prepared report context; equal keys render equal PDFs."""
+    blob = json.dumps(ctx, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _submit_render(ctx_snapshot, key, page_store=None, quality="final"):
+    """Queue generate_report in the background; returns the job handle kept in session_state."""
+    progress = {"stage": "Queued", "done": 0, "total": 1}
+
+    def _on_progress(stage, done, total):
+        progress.update(stage=stage, done=done, total=total)
+
+    def _job():
+        # imported here, not at the top: the renderer (reportlab, PIL, fonts) is
+        # only loaded once something is rendered, so the start screen comes up fast
+        from pdf.generate_report import generate_report
+        from pdf.profiling import Profile
+
+        # rendered in memory: every session keeps its own result, nothing shared on disk
+        profile = Profile()
+        pdf = generate_report(ctx_snapshot, output_path=None, progress=_on_progress, page_store=page_store,
+                              quality=quality, profile=profile)
+        return {
+            "key": key,
+            "pdf": pdf,
+            "sample": ctx_snapshot.get("sample", ""),
+            "quality": quality,
+            "created": datetime.now(),
+            "profile": profile,
+        }
+
+    return {"future": _render_executor().submit(_job), "key": key, "progress": progress, "reported": False}
+
+
+def _render_status():
+    job = st.session_state.get("pdf_job")
+    if job is None:
+        return
+    future, progress = job["future"], job["progress"]
+    if not future.done():
+        st.progress(progress["done"] / max(progress["total"], 1), text=f"Rendering… {progress['stage']}")
+        return
+    error = future.exception()
+    if error is not None:
+        st.error(f"PDF generation failed: {error}")
+    else:
+        result = future.result()
+        st.success(f"Generated ({len(result['pdf']) / 1024:.0f} KB)")
+    if not job["reported"]:
+        job["reported"] = True
+        if error is None:
+            # one result per session; the previous one is dropped
+            st.session_state["pdf_result"] = result
+        # one full rerun so the download button picks up the new result
+        st.rerun()
+
+
+# polls only while a job runs; the rest of the page stays interactive
+_render_status_live = (
+    st.fragment(run_every=0.5)(_render_status) if hasattr(st, "fragment") else _render_status
+)
+
+# ---------------- Live preview ----------------
+@st.cache_resource
+def _preview_executor():
+    # shared by all sessions; stale previews give up at the next page
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-preview")
+
+
+def _request_preview(ctx):
+    """Queue a preview of the current form; debounced and cancelled by newer edits."""
+    from pdf.preview import PreviewScheduler
+
+    scheduler = st.session_state.get("preview")
+    if scheduler is None:
+        scheduler = st.session_state["preview"] = PreviewScheduler(_preview_executor())
+    snapshot = prepare_for_render(deepcopy(ctx), laser_preset=st.session_state.get("laser_preset"))
+    scheduler.request(snapshot, _context_key(snapshot))
+    return scheduler
+
+
+def _preview_panel():
+    scheduler = st.session_state.get("preview")
+    if scheduler is None:
+        return
+    result = scheduler.result
+    if scheduler.error is not None:
+        st.caption(f"Preview failed: {scheduler.error}")
+    if result is None:
+        st.caption("Rendering preview…")
+    else:
+        note = " · updating…" if scheduler.pending else ""
+        st.caption(f"{len(result.pages)} pages · {result.ms:.0f} ms{note}")
+        st.image(result.pages, caption=[f"Page {i}" for i in range(1, len(result.pages) + 1)])
+    if not scheduler.pending and st.session_state.pop("preview_polling", False):
+        # done: one full rerun swaps the polling fragment for the static panel
+        st.rerun()
+
+
+_preview_panel_live = (
+    st.fragment(run_every=0.5)(_preview_panel) if hasattr(st, "fragment") else _preview_panel
+)
 
 # ---------------- Fixed top banner (SVG) ----------------
-if BANNER_LOGO_SVG.exists():
-    svg_b64 = b64encode(BANNER_LOGO_SVG.read_bytes()).decode("utf-8")
+_banner_mtime = _mtime_ns(BANNER_LOGO_SVG)
+if _banner_mtime is not None:
+    svg_b64 = _banner_svg_b64(str(BANNER_LOGO_SVG), _banner_mtime)
     st.markdown(
         f"""
         <style>
@@ -77,6 +276,9 @@ else:
 # ---------------- Session init ----------------
 if "form" not in st.session_state:
     st.session_state["form"] = None
+# a browser refresh starts a new session; the URL says which autosave it was editing
+if st.session_state["form"] is None and _autosave_store().exists(st.query_params.get("autosave")):
+    st.session_state["form"] = _start_autosave(st.query_params["autosave"]).form
 if st.session_state["form"] is not None:
     st.session_state["form"].setdefault("sections_data", {})
 
@@ -107,24 +309,27 @@ if st.session_state["form"] is None:
 
     with c1:
         if st.button("Start new report", use_container_width=True):
-            ctx = deepcopy(DEFAULT_CONTEXT)
-            ctx.update({
-                "report_no": "",
-                "standard": "ISO 21254",
-                "sample": "",
-                "prepared_by": [],
-                "approved_by": "",
-                # prefill but editable
-                "institute": "HiLASE Centre, Institute of Physics ASCR",
-                "inst_address": "Za Radnici 828, 252 41 Dolni Brezany, Czech Republic",
-                "customer": "",
-                "cust_address": "",
-                "cust_contact": "",
-                "sections": []
-            })
+            ctx = new_context()
             st.session_state["form"] = ctx
+            _start_autosave()
             st.rerun()
 
+        autosaves = _autosave_store().list()
+        if autosaves:
+            st.markdown("#### Resume autosaved report")
+            resume_labels = {
+                a.id: f"{a.sample or 'Untitled'} — {a.customer or 'no customer'} · {a.modified:%Y-%m-%d %H:%M}"
+                for a in autosaves
+            }
+            selected_autosave = st.selectbox("Autosave", options=list(resume_labels), format_func=resume_labels.get)
+            r1, r2 = st.columns(2)
+            if r1.button("Resume", use_container_width=True):
+                st.session_state["form"] = _start_autosave(selected_autosave).form
+                st.rerun()
+            if r2.button("Discard", use_container_width=True):
+                _autosave_store().delete(selected_autosave)
+                st.rerun()
+
     with c2:
         if st.button("Load existing draft", use_container_width=True):
             st.session_state["show_draft_picker"] = True
@@ -132,62 +337,54 @@ if st.session_state["form"] is None:
         if st.session_state.get("show_draft_picker", False):
             st.markdown("#### Select a draft")
 
-            draft_files = []
-            if DRAFTS_DIR.exists():
-                draft_files = sorted([p.name for p in DRAFTS_DIR.glob("*.json")])
+            drafts = _draft_repository()
+            query = st.text_input(
+                "Search drafts",
+                key="draft_query",
+                placeholder="Sample ID, customer, standard, laser or author",
+                on_change=lambda: st.session_state.update(draft_page=0),
+            )
+            found = drafts.search(query, offset=st.session_state.get("draft_page", 0) * DRAFT_PAGE_SIZE)
+            pages = max(1, -(-found.total // DRAFT_PAGE_SIZE))
+            if st.session_state.get("draft_page", 0) >= pages:
+                # drafts disappeared under the current page
+                st.session_state["draft_page"] = pages - 1
+                st.rerun()
 
+            entries = {e.name: e for e in found.entries}
+            labels = {name: _draft_label(e) for name, e in entries.items()}
             selected_draft = st.selectbox(
-                "Draft file",
-                options=draft_files,
-                disabled=not draft_files
+                "Draft",
+                options=list(labels),
+                format_func=labels.get,
+                disabled=not labels
             )
 
-            if st.button("Load selected draft", disabled=not draft_files):
-                draft_path = DRAFTS_DIR / selected_draft
-                draft = json.loads(draft_path.read_text(encoding="utf-8"))
-
-                ctx = deepcopy(DEFAULT_CONTEXT)
-                ctx.update(draft)
-                st.session_state["form"] = ctx
-
-                # --- hydrate session_state from draft sections ---
-                form = st.session_state["form"]
-                form["sections_data"] = {}
-
-                for section in draft.get("sections", []):
-                    title = section.get("title", "")
-                    items = dict(section.get("items", []))
-
-                    if title == "Sample Information":
-                        form["sections_data"]["sample_information"] = {
-                            "description": items.get("Description", ""),
-                            "date_received": (
-                                date.fromisoformat(items["Date Received"])
-                                if items.get("Date Received") else date.today()
-                            ),
-                            "preparation": items.get("Preparation", ""),
-                        }
-
-                    elif title == "Test Identification":
-                        form["sections_data"]["test_identification"] = {
-                            "procedure": items.get("Procedure", ""),
-                            "objective": items.get("Objective", ""),
-                            "sites_pulses": items.get("Sites / Pulses per Site", ""),
-                            "damage_detection": items.get("Damage Detection", ""),
-                        }
-
+            page = st.session_state.get("draft_page", 0)
+            p_prev, p_info, p_next = st.columns([1, 2, 1])
+            if p_prev.button("‹ Previous", disabled=page == 0, use_container_width=True):
+                st.session_state["draft_page"] = page - 1
+                st.rerun()
+            p_info.caption(f"{found.total} draft(s) · page {page + 1} of {pages}")
+            if p_next.button("Next ›", disabled=page + 1 >= pages, use_container_width=True):
+                st.session_state["draft_page"] = page + 1
+                st.rerun()
 
+            broken = selected_draft is not None and entries[selected_draft].error
+            if broken:
+                st.caption(f"Cannot load this draft: {broken}")
+            if st.button("Load selected draft", disabled=not labels or bool(broken)):
+                draft = drafts.load(selected_draft)
 
-                for k in ["lab_image", "logo_title", "logo_inner"]:
-                    p = Path(ctx[k])
-                    if not p.is_absolute():
-                        ctx[k] = str((ROOT / p).resolve())
+                ctx = context_from_draft(draft, root=ROOT)
 
                 st.session_state["form"] = ctx
                 st.session_state["show_draft_picker"] = False
+                _start_autosave()
                 st.rerun()
 
 
+    _show_run_time()
     st.stop()
 
 
@@ -319,12 +516,12 @@ with tab2:
         "laser",
         LASER_PRESETS["manual"]["data"].copy()
         )
-    preset_labels = {
-        k: v["label"] for k, v in LASER_PRESETS.items()}
+    preset_labels = _laser_preset_labels()
 
     def _on_laser_change():
         key = st.session_state["laser_preset"]
         sec3["laser"] = LASER_PRESETS[key]["data"].copy()
+        sec3["preset"] = key
 
     selected_key = st.selectbox(
         "Which laser will be used?",
@@ -433,12 +630,13 @@ with tab3:
     elif sec5["choice"] == "Manual Upload":
         uploaded_image = st.file_uploader("Upload an image", type=["png", "jpg", "jpeg"])
         if uploaded_image:
-            file_extension = uploaded_image.name.split('.')[-1]
-            unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-            upload_path = UPLOAD_FOLDER / unique_filename
-            with open(upload_path, "wb") as f:
-                f.write(uploaded_image.read())
-            sec5["image"] = str(upload_path)
+            # content-addressed: identical bytes map to one blob. The upload is hashed once
+            # per uploaded file, not on every rerun; a new file_id means a new upload
+            stored = st.session_state.get("setup_upload")
+            if stored is None or stored[0] != uploaded_image.file_id or not Path(stored[1]).exists():
+                stored = st.session_state["setup_upload"] = (
+                    uploaded_image.file_id, str(upload_store.put(uploaded_image, uploaded_image.name)))
+            sec5["image"] = stored[1]
         else:
             sec5.pop("image", None)  # Remove image entry if none uploaded
     else:
@@ -454,99 +652,95 @@ with tab4:
     c1, c2 = st.columns([1, 1])
 
     with c1:
-        if st.button("Generate PDF", type="primary", use_container_width=True):
-            OUT_DIR.mkdir(parents=True, exist_ok=True)
-            ctx["report_no"] = "DRAFT"
-            ctx["issue_date"] = date.today().strftime("%d %B %Y")
-            ctx["sections"] = []
-        
-            form = st.session_state["form"]
-            sections_data = form.get("sections_data", {})
-            ctx["sections"].append({
-                "title": "Report Identification",
-                "items": [
-                    ["Report Number", ctx["report_no"]],
-                    ["Issue Date", ctx["issue_date"]],
-                ],
-            })
-            # Section 2
-            sec2 = sections_data.get("sample_information", {})
-            ctx["sections"].append({
-                "title": "Sample Information",
-                "items": [
-                    ["Sample ID", form.get("sample", "")],
-                    ["Description", sec2.get("description", "")],
-                    ["Date Received", (
-                        sec2["date_received"].strftime("%d %B %Y")
-                        if isinstance(sec2.get("date_received"), date)
-                        else ""
-                    )],
-                    ["Preparation", sec2.get("preparation", "")],
-                ],
-            })
-
-            sec3 = sections_data.get("laser_environmental", {})
-            laser = sec3.get("laser", {})
-            selected_laser = LASER_PRESETS.get(st.session_state.get("laser_preset"), {})
-            laser_images = selected_laser.get("images", {})
-            ctx["sections"].append({
-                "title": "Laser and Environmental Conditions",
-                "items": [
-                    ["Laser Type", laser.get("laser_type", "")],
-                    ["Wavelength (nm)", laser.get("wavelength_nm", "")],
-                    ["Repetition Frequency", laser.get("pulse_repetition_frequency", "")],
-                    ["Output Energy/Power", laser.get("output_energy_or_power", "")],
-                    ["Pulse Duration (1/e²)", laser.get("pulse_duration_1e2", "")],
-                    ["Effective Pulse Duration", laser.get("effective_pulse_duration", "")],
-                    ["Polarization", laser.get("polarization_state", "")],
-                    ["Beam Diameter (1/e²)", laser.get("beam_diameter_1e2", "")],
-                    ["Beam Profile (Near Field)", laser.get("spatial_beam_profile_near_field", "")],
-                    ["Beam Delivery", laser.get("beam_delivery", "")],
-                ],
-                "images": laser_images,
-            })
-
-            sec4 = sections_data.get("test_identification", {})
-            ctx["sections"].append({
-                "title": "Test Identification",
-                "items": [
-                    ["Procedure", sec4.get("procedure", "")],
-                    ["Objective", sec4.get("objective", "")],
-                    ["Sites / Pulses per Site", sec4.get("sites_pulses", "")],
-                    ["Damage Detection", sec4.get("damage_detection", "")],
-                ],
-            })
-
-            sec5 = sections_data.get("test_setup", {})
- 
-            if sec5.get("choice") and sec5["choice"] != "Skip":
-                ctx["sections"].append({
-                    "title": "Test Setup",
-                    "images": {
-                        "layout": "template1",
-                        "items": [
-                            {"path": sec5["image"]},
-                        ],
-                    "overlay_color": "black",
-                    "caption": "Test setup.",
-                    "width_pct": 1,
-                    "flatten_alpha_to_white": False}
-                })
-
-
-            generate_report(ctx, output_path=str(OUT_PDF))
-            st.success(f"Generated: {OUT_PDF}")
-
-        if OUT_PDF.exists():
+        dpi_options = [72, 150, 300]
+        ctx["raster_dpi"] = st.selectbox(
+            "Image resolution (dpi)",
+            options=dpi_options,
+            index=dpi_options.index(ctx.get("raster_dpi", 72)) if ctx.get("raster_dpi", 72) in dpi_options else 0,
+            help="72 dpi for quick drafts, 300 dpi for customer deliverables.",
+        )
+        quality = st.radio(
+            "Render quality",
+            options=["final", "draft"],
+            format_func=lambda q: {"final": "Final", "draft": "Draft (fast, coarse images)"}[q],
+            horizontal=True,
+            key="render_quality",
+            help="Draft keeps the exact layout but embeds low-resolution images; render Final once at the end.",
+        )
+
+        job = st.session_state.get("pdf_job")
+        job_running = job is not None and not job["future"].done()
+
+        if st.button("Generate PDF", type="primary", use_container_width=True, disabled=job_running):
+            prepare_for_render(ctx, laser_preset=st.session_state.get("laser_preset"))
+            key = f"{quality}:{_context_key(ctx)}"
+            previous = st.session_state.get("pdf_result")
+            if previous is not None and previous["key"] == key:
+                st.info("Nothing changed since the last render; reusing it.")
+            else:
+                # render a snapshot, so edits made while it runs don't race the renderer
+                # pages unchanged since the session's previous render are reused
+                from pdf.pages import PageStore
+                page_store = st.session_state.setdefault("page_store", PageStore())
+                st.session_state["pdf_job"] = _submit_render(deepcopy(ctx), key, page_store, quality)
+                job_running = True
+
+        if job_running:
+            _render_status_live()
+        else:
+            _render_status()
+
+        result = st.session_state.get("pdf_result")
+        if result is not None:
             st.download_button(
-                "Download latest PDF",
-                data=OUT_PDF.read_bytes(),
+                "Download PDF",
+                data=result["pdf"],
                 file_name="LIDT_report.pdf",
                 mime="application/pdf",
                 use_container_width=True,
             )
+            # disk persistence is opt-in
+            if st.button("Save copy to archive", use_container_width=True):
+                OUT_DIR.mkdir(parents=True, exist_ok=True)
+                sample = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in result["sample"]) or "report"
+                suffix = "_draft" if result.get("quality") == "draft" else ""
+                archived = OUT_DIR / f"LIDT_{sample}_{result['created']:%Y%m%d-%H%M%S}{suffix}.pdf"
+                tmp = archived.with_suffix(".pdf.part")
+                tmp.write_bytes(result["pdf"])
+                os.replace(tmp, archived)
+                st.success(f"Saved: {archived}")
 
     with c2:
-        with st.expander("Context preview (debug)", expanded=False):
+        # serializing the whole context is only worth it when someone looks at it
+        if st.toggle("Context preview (debug)", key="show_ctx_preview"):
             st.json(ctx)
+        profile = (st.session_state.get("pdf_result") or {}).get("profile")
+        if profile is not None and st.toggle("Render profile (debug)", key="show_render_profile"):
+            st.dataframe(profile.rows(), hide_index=True, use_container_width=True)
+            st.download_button(
+                "Download Chrome trace",
+                data=json.dumps(profile.to_chrome_trace()),
+                file_name="LIDT_render.trace.json",
+                mime="application/json",
+                help="Open in chrome://tracing or ui.perfetto.dev.",
+            )
+
+# after the tabs, so the preview sees this run's edits
+with st.sidebar:
+    if st.toggle("Live preview", key="live_preview", help="Low-resolution page thumbnails, updated as you edit."):
+        if _request_preview(ctx).pending:
+            st.session_state["preview_polling"] = True
+            _preview_panel_live()
+        else:
+            _preview_panel()
+
+# ---------------- Autosave ----------------
+# appends only the fields this run changed; compaction into the snapshot runs in the background
+autosave = st.session_state.get("autosave") or _start_autosave()
+autosave.save(ctx)
+if autosave.last_save is not None:
+    saved_at, saved_bytes = autosave.last_save
+    st.sidebar.caption(f"Autosaved {datetime.fromtimestamp(saved_at):%H:%M:%S} ({saved_bytes} B)")
+
+_show_run_time()
 
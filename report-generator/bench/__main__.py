@@ -0,0 +1,88 @@
+"""
+Rendering benchmarks on synthetic reports.
+
+    python -m bench list                                  # scenarios and their parameters
+    python -m bench run                                   # all scenarios -> data/cache/bench/results.json
+    python -m bench run baseline figures_large -r 9 -o before.json
+    python -m bench compare before.json after.json        # exit code 1 on a regression
+
+Every scenario runs in a fresh interpreter with scratch disk caches: the
+first render is cold, the others warm. Results record wall time, peak
+Python heap (tracemalloc), max RSS, PDF size and image encoding counts
+with the bytes saved over PNG; `compare` flags metrics
+that moved past their tolerance (see bench.compare.DEFAULT_TOLERANCES).
+"""
+
+# === Imports ===
+import argparse
+import json
+import sys
+
+from .compare import compare, format_changes
+from .runner import DEFAULT_RESULTS, load_results, run_suite, save_results
+from .synthetic import SCENARIOS, scenario_params
+
+
+def _cmd_list(args):
+    for name in SCENARIOS:
+        print(f"{name:<16} {json.dumps(scenario_params(name))}")
+    return 0
+
+
+def _cmd_run(args):
+    unknown = [n for n in args.scenarios if n not in SCENARIOS]
+    if unknown:
+        print(f"unknown scenario(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    def _progress(name, r):
+        print(f"{name:<16} {r['pages']:3d} pages  cold {r['cold_s'] * 1e3:8.1f} ms  "
+              f"warm {r['warm_median_s'] * 1e3:8.1f} ms  heap {r['peak_traced_mb']:6.1f} MB  "
+              f"rss {r['max_rss_mb']:6.0f} MB  {r['pdf_bytes'] / 1024:7.0f} KB  "
+              f"saved {r['encoding']['bytes_saved'] / 1024:7.0f} KB", flush=True)
+
+    results = run_suite(args.scenarios or None, args.repeat, args.quality, _progress)
+    save_results(results, args.out)
+    print(f"-> {args.out}")
+    return 0
+
+
+def _cmd_compare(args):
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    for key in ("quality", "repeat", "cpus"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"note: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)})")
+    changes = compare(baseline, current)
+    for line in format_changes(changes, show_all=args.all):
+        print(line)
+    regressions = [c for c in changes if c.status == "regression"]
+    compared = {c.scenario for c in changes if c.status != "missing"}
+    print(f"{len(regressions)} regression(s) in {len(compared)} compared scenario(s)")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark report rendering.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="show the scenarios").set_defaults(func=_cmd_list)
+
+    p_run = sub.add_parser("run", help="run scenarios and save the results as JSON")
+    p_run.add_argument("scenarios", nargs="*", help="default: all")
+    p_run.add_argument("-r", "--repeat", type=int, default=5, help="renders per scenario (first is cold)")
+    p_run.add_argument("-q", "--quality", choices=["final", "draft"], default="final")
+    p_run.add_argument("-o", "--out", default=str(DEFAULT_RESULTS), help="results JSON path")
+    p_run.set_defaults(func=_cmd_run)
+
+    p_cmp = sub.add_parser("compare", help="flag regressions of CURRENT against BASELINE")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--all", action="store_true", help="also list unchanged metrics")
+    p_cmp.set_defaults(func=_cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# === Imports ===
+from collections import namedtuple
+
+
+# metric -> (relative tolerance, absolute slack): a change counts only when it
+# exceeds both, so millisecond jitter on tiny scenarios is not a regression
+DEFAULT_TOLERANCES = {
+    "warm_median_s": (0.15, 0.005),
+    "cold_s": (0.25, 0.020),
+    "peak_traced_mb": (0.15, 1.0),
+    "pdf_bytes": (0.02, 1024),
+}
+
+Change = namedtuple("Change", "scenario metric baseline current ratio status")
+
+
+def compare(baseline, current, tolerances=None):
+    """
+    Per-scenario, per-metric changes between two result files (as loaded by
+    runner.load_results). status is "regression", "improvement", "same",
+    or "missing" for scenarios only in the baseline.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    changes = []
+    for name, base in baseline["scenarios"].items():
+        cur = current["scenarios"].get(name)
+        if cur is None:
+            changes.append(Change(name, None, None, None, None, "missing"))
+            continue
+        for metric, (rel, slack) in tolerances.items():
+            b, c = base.get(metric), cur.get(metric)
+            if b is None or c is None:
+                continue
+            ratio = c / b if b else float("inf") if c else 1.0
+            if c > b * (1 + rel) and c - b > slack:
+                status = "regression"
+            elif c < b * (1 - rel) and b - c > slack:
+                status = "improvement"
+            else:
+                status = "same"
+            changes.append(Change(name, metric, b, c, ratio, status))
+    return changes
+
+
+def _fmt(metric, v):
+    if v is None:
+        return "-"
+    if metric.endswith("_s"):
+        return f"{v * 1e3:.1f} ms"
+    if metric.endswith("_mb"):
+        return f"{v:.1f} MB"
+    return f"{v / 1024:.0f} KB"
+
+
+def format_changes(changes, show_all=False):
+    lines = []
+    for ch in changes:
+        if ch.status == "missing":
+            lines.append(f"{'missing':<12} {ch.scenario:<16} (not in the current results)")
+            continue
+        if ch.status == "same" and not show_all:
+            continue
+        flag = {"regression": "REGRESSION", "improvement": "improved", "same": ""}[ch.status]
+        lines.append(f"{flag:<12} {ch.scenario:<16} {ch.metric:<15} "
+                     f"{_fmt(ch.metric, ch.baseline):>10} -> {_fmt(ch.metric, ch.current):>10}  x{ch.ratio:.2f}")
+    return lines
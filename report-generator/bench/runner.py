@@ -0,0 +1,155 @@
+# === Imports ===
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+from .synthetic import ROOT, SCENARIOS, make_context, scenario_params
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+RESULTS_VERSION = 1
+DEFAULT_RESULTS = ROOT / "data" / "cache" / "bench" / "results.json"
+
+
+# ---------------- One scenario (in a fresh process) ----------------
+
+def _max_rss_mb():
+    # ru_maxrss of a spawned child starts at the parent's peak (it survives the
+    # fork before exec); VmHWM belongs to this interpreter alone
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(name, repeat=5, quality="final", seed=0):
+    """
+    Time `repeat` renders of scenario `name`. The first one runs with every
+    cache empty (process caches and scratch disk caches); the rest are warm.
+    Peak Python heap is measured on one extra traced render, and the image
+    encoding stats (ImagePolicy.stats with bytes_saved) on another with
+    fresh image caches, so every figure is encoded once.
+    """
+    from pdf import fonts
+    from pdf import generate_report as gr
+    from pdf.encoding import ImagePolicy
+    from pdf.imaging import pixel_budget_stats
+
+    params = scenario_params(name)
+    ctx = make_context(params, seed)
+
+    with tempfile.TemporaryDirectory(prefix="lidt-bench-") as scratch:
+        scratch = Path(scratch)
+        fonts.configure_font_cache(scratch / "fonts")
+        gr.configure_tile_cache(spill_dir=scratch / "tiles")
+        gr.configure_banner_cache(scratch / "banners")
+
+        times = []
+        pdf = b""
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            pdf = gr.generate_report(ctx, output_path=None, quality=quality)
+            times.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        gr.generate_report(ctx, output_path=None, quality=quality)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # the tracking policy PNG-encodes every JPEG once more; kept out of the timed renders
+        gr.configure_tile_cache(spill_dir=scratch / "tiles-encoding")
+        gr.configure_banner_cache(scratch / "banners-encoding")
+        policy = (ImagePolicy.draft(track_savings=True) if quality == "draft"
+                  else ImagePolicy.from_context(ctx, track_savings=True))
+        gr.generate_report(ctx, output_path=None, image_policy=policy, quality=quality)
+
+    warm = times[1:] or times
+    return {
+        "params": params,
+        "quality": quality,
+        "pages": gr.dry_run_report(ctx).page_count,
+        "pdf_bytes": len(pdf),
+        "cold_s": round(times[0], 5),
+        "warm_s": [round(t, 5) for t in warm],
+        "warm_median_s": round(statistics.median(warm), 5),
+        "peak_traced_mb": round(peak / (1024 * 1024), 2),
+        "max_rss_mb": round(_max_rss_mb(), 1),
+        "peak_decoded_mp": round(pixel_budget_stats()["peak"] / 1e6, 2),
+        "encoding": policy.stats,
+    }
+
+
+# ---------------- Suite ----------------
+
+def _git_commit():
+    head = ROOT.parent / ".git" / "HEAD"
+    try:
+        ref = head.read_text().strip()
+        if ref.startswith("ref: "):
+            return (ROOT.parent / ".git" / ref[5:]).read_text().strip()
+        return ref
+    except OSError:
+        return None
+
+
+def run_suite(names=None, repeat=5, quality="final", progress=None):
+    """Run scenarios one after another, each in its own spawned process."""
+    import reportlab
+
+    names = list(names or SCENARIOS)
+    results = {}
+    for name in names:
+        # synthetic images are generated here, so they count neither as render time nor as RSS
+        make_context(scenario_params(name))
+        # a new interpreter per scenario: cold numbers are really cold, and
+        # max RSS belongs to this scenario alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results[name] = pool.submit(run_scenario, name, repeat, quality).result()
+        if progress:
+            progress(name, results[name])
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "reportlab": reportlab.Version,
+            "repeat": repeat,
+            "quality": quality,
+        },
+        "scenarios": results,
+    }
+
+
+def save_results(results, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_results(path):
+    results = json.loads(Path(path).read_text(encoding="utf-8"))
+    if results.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {results.get('version')!r}")
+    return results
@@ -0,0 +1,174 @@
+# === Imports ===
+import random
+from copy import deepcopy
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+ROOT = Path(__file__).resolve().parents[1]
+ASSET_DIR = ROOT / "data" / "cache" / "bench" / "assets"
+
+FIGURE_LAYOUTS = ("template1", "template2", "template3")
+# images per figure for each layout
+LAYOUT_IMAGES = {"template1": 1, "template2": 4, "template3": 3}
+
+
+# ---------------- Scenarios ----------------
+# Each scenario scales one axis of a report away from the shape of
+# data/drafts/test_draft.json (a few short sections, one figure).
+#   sections    text sections (label/value items + notes)
+#   items       items per text section
+#   note_words  words of notes per text section
+#   figures     {layout: number of figures}, each in its own section
+#   image_px    long side of every figure image, in pixels
+
+BASELINE = {
+    "sections": 4,
+    "items": 4,
+    "note_words": 20,
+    "figures": {"template1": 1},
+    "image_px": 1200,
+}
+
+SCENARIOS = {
+    "baseline": {},
+    "sections_40": {"sections": 40},
+    "items_60": {"sections": 5, "items": 60},
+    "notes_long": {"sections": 5, "note_words": 1500},
+    "template1_x8": {"figures": {"template1": 8}},
+    "template2_x4": {"figures": {"template2": 4}},
+    "template3_x6": {"figures": {"template3": 6}},
+    "figures_large": {"figures": {"template1": 3, "template2": 2, "template3": 2}, "image_px": 4000},
+    # memory: peak decoded pixels must stay within imaging's pixel budget
+    "figures_20": {"figures": {"template1": 20}, "image_px": 4000},
+    "everything": {
+        "sections": 20, "items": 20, "note_words": 400,
+        "figures": {"template1": 4, "template2": 3, "template3": 3}, "image_px": 2400,
+    },
+}
+
+
+def scenario_params(name):
+    params = deepcopy(BASELINE)
+    params.update(deepcopy(SCENARIOS[name]))
+    return params
+
+
+# ---------------- Synthetic images ----------------
+
+def _photo(size, seed):
+    # smooth colour field + noise: incompressible like a microscope photo, encoded as JPEG
+    w, h = size
+    rng = np.random.default_rng(seed)
+    sw, sh = max(2, w // 8), max(2, h // 8)
+    y, x = np.mgrid[0:sh, 0:sw].astype(np.float32)
+    base = np.stack([
+        127 + 100 * np.sin(x / (sw / 3.0) + seed),
+        127 + 100 * np.cos(y / (sh / 2.5) + seed),
+        127 + 100 * np.sin((x + y) / (sw / 4.0)),
+    ], axis=-1).astype(np.uint8)
+    field = np.asarray(Image.fromarray(base, "RGB").resize(size, Image.BILINEAR), dtype=np.int16)
+    noise = rng.integers(-24, 25, size=(h, w, 3), dtype=np.int16)
+    return Image.fromarray(np.clip(field + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def _schematic(size, seed):
+    # line-art on white with few colours, like a setup scheme; stays PNG
+    w, h = size
+    rnd = random.Random(seed)
+    im = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(im)
+    unit = max(2, w // 200)
+    for _ in range(40):
+        x0, y0 = rnd.randrange(w), rnd.randrange(h)
+        x1, y1 = min(w - 1, x0 + rnd.randrange(w // 4 + 1)), min(h - 1, y0 + rnd.randrange(h // 4 + 1))
+        color = rnd.choice(["#111827", "#00afee", "#f97316", "#64bb2f"])
+        if rnd.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), outline=color, width=unit)
+        else:
+            draw.line((x0, y0, x1, y1), fill=color, width=unit)
+    return im
+
+
+def make_image(long_side, kind="photo", seed=0, aspect=4 / 3, directory=ASSET_DIR):
+    """Path of a deterministic synthetic image; generated once and reused."""
+    ext = "jpg" if kind == "photo" else "png"
+    path = Path(directory) / f"{kind}_{long_side}_{seed}.{ext}"
+    if not path.exists():
+        size = (int(long_side), max(1, int(long_side / aspect)))
+        im = _photo(size, seed) if kind == "photo" else _schematic(size, seed)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        im.save(tmp, format="JPEG" if kind == "photo" else "PNG", quality=90)
+        tmp.replace(path)
+    return str(path)
+
+
+# ---------------- Synthetic reports ----------------
+
+_WORDS = ("damage threshold fluence pulse sample coating surface site laser beam energy "
+          "measured according procedure irradiation spot diameter microscope inspection").split()
+
+
+def _text(rnd, n):
+    return " ".join(rnd.choice(_WORDS) for _ in range(n))
+
+
+def make_draft(params, seed=0, directory=ASSET_DIR):
+    """
+    Draft dict with the keys of data/drafts/test_draft.json, scaled by
+    `params` (see BASELINE). Deterministic for a given seed.
+    """
+    rnd = random.Random(seed)
+    px = params["image_px"]
+    sections = [{"title": "Report Identification", "items": [["Report Number", "BENCH"], ["Issue Date", ""]]}]
+    for i in range(params["sections"]):
+        section = {
+            "title": f"Section {i + 2}: {_text(rnd, 3).title()}",
+            "items": [[_text(rnd, rnd.randint(1, 4)).capitalize(), _text(rnd, rnd.randint(2, 14))]
+                      for _ in range(params["items"])],
+        }
+        if params["note_words"]:
+            section["notes"] = _text(rnd, params["note_words"])
+        sections.append(section)
+
+    n = 0
+    for layout in FIGURE_LAYOUTS:
+        for _ in range(params["figures"].get(layout, 0)):
+            kind = "schematic" if (layout == "template1" and n % 2) else "photo"
+            items = [{"path": make_image(px, kind, seed * 1000 + n * 10 + k, directory=directory)}
+                     for k in range(LAYOUT_IMAGES[layout])]
+            sections.append({
+                "title": f"Figure section {n + 1}",
+                "items": [["Setup", _text(rnd, 6)]],
+                "images": {"layout": layout, "items": items, "caption": _text(rnd, 24).capitalize() + "."},
+            })
+            n += 1
+
+    return {
+        "lab_image": make_image(2400, "photo", seed=9999, aspect=16 / 9, directory=directory),
+        "title": "Laser-Induced Damage Threshold Test (LIDT) Report",
+        "sample": f"BENCH-{seed:03d}",
+        "standard": "ISO 21254",
+        "prepared_by": ["Ing. Bench Mark (bench@example.com)"],
+        "approved_by": "Name Surname (name1@example.com)",
+        "institute": "HiLASE Centre, Institute of Physics ASCR",
+        "inst_address": "Za Radnici 828, 252 41 Dolni Brezany, Czech Republic",
+        "customer": "Customer Company",
+        "cust_address": "Za Radnici 828, 252 41 Dolni Brezany, Czech Republic",
+        "cust_contact": "contact@customer.com",
+        "sections": sections,
+    }
+
+
+def make_context(params, seed=0, directory=ASSET_DIR):
+    """Render-ready context for `params`: the draft through pdf.context, sections kept as generated."""
+    from pdf.context import context_from_draft
+
+    ctx = context_from_draft(make_draft(params, seed, directory), root=ROOT)
+    ctx["report_no"] = "BENCH"
+    ctx["issue_date"] = date(2025, 1, 1).strftime("%d %B %Y")
+    return ctx
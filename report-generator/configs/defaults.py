@@ -17,6 +17,12 @@ DEFAULT_CONTEXT = {
     "fade_alpha_255": 160,
     "banner_ratio": 0.35,
 
+    # image embedding: "auto" picks JPEG for photos, PNG for line-art
+    "image_encoding": "auto",
+    "jpeg_quality": 85,
+    # 72 = drafts, 300 = print-quality customer deliverables
+    "raster_dpi": 72,
+
  
     "margins": {
         "left_mm": 16,
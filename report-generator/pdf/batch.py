@@ -0,0 +1,177 @@
+"""
+Headless batch rendering of report drafts.
+
+    python -m pdf.batch data/drafts                     # every *.json in a directory
+    python -m pdf.batch "data/drafts/FS-*.json" -j 8    # globs and files
+    python -m pdf.batch drafts/ -o out/ --summary out/summary.json
+
+Each draft is normalized with the same section-building logic as the
+Streamlit app (pdf.context) and rendered in its own worker process.
+A JSON summary with one entry per job (timing, output, error) is written
+at the end; the exit code is 1 if any job failed.
+"""
+
+# === Imports ===
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+DEFAULT_OUT_DIR = ROOT / "data" / "generated" / "batch"
+
+
+# ---------------- Job discovery ----------------
+
+def expand_inputs(inputs):
+    """Draft files from a mix of files, directories (*.json inside) and glob patterns."""
+    found = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            found.extend(sorted(p.glob("*.json")))
+        elif p.is_file():
+            found.append(p)
+        else:
+            found.extend(Path(m) for m in sorted(glob.glob(item)) if m.endswith(".json"))
+    # keep order, drop duplicates
+    seen = set()
+    unique = []
+    for p in found:
+        key = p.resolve()
+        if key not in seen:
+            seen.add(key)
+            unique.append(p)
+    return unique
+
+
+# ---------------- Worker ----------------
+
+def render_draft(draft_path, output_path, report_no="DRAFT", overrides=None, quality="final"):
+    """Render one draft file to `output_path`; returns a summary dict (never raises)."""
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = {"draft": str(draft_path), "output": str(output_path), "ok": False}
+    try:
+        from pdf.context import context_from_draft, prepare_for_render
+        from pdf.generate_report import generate_report
+
+        draft = json.loads(Path(draft_path).read_text(encoding="utf-8"))
+        ctx = context_from_draft(draft, root=ROOT)
+        ctx.update(overrides or {})
+        prepare_for_render(ctx, report_no=report_no)
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        generate_report(ctx, output_path=str(output_path), quality=quality)
+
+        result["ok"] = True
+        result["bytes"] = Path(output_path).stat().st_size
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    result["cpu_seconds"] = round(time.process_time() - cpu_started, 4)
+    result["pid"] = os.getpid()
+    return result
+
+
+def run_batch(drafts, out_dir, workers=None, report_no="DRAFT", overrides=None, progress=None, quality="final"):
+    """Render `drafts` on a process pool; returns the per-job summaries in input order."""
+    out_dir = Path(out_dir)
+    jobs = []
+    used = set()
+    for p in drafts:
+        # drafts from different directories may share a file name
+        stem, n = Path(p).stem, 1
+        name = stem
+        while name in used:
+            n += 1
+            name = f"{stem}-{n}"
+        used.add(name)
+        jobs.append((p, out_dir / f"{name}.pdf"))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+
+    results = {}
+    if workers == 1:
+        for draft, out in jobs:
+            results[draft] = render_draft(draft, out, report_no, overrides, quality)
+            if progress:
+                progress(results[draft])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(render_draft, draft, out, report_no, overrides, quality): draft
+                for draft, out in jobs
+            }
+            for fut in as_completed(futures):
+                results[futures[fut]] = fut.result()
+                if progress:
+                    progress(results[futures[fut]])
+    return [results[draft] for draft, _ in jobs]
+
+
+# ---------------- CLI ----------------
+
+def _parse_override(text):
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {text!r}")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pdf.batch", description="Render LIDT report drafts to PDF.")
+    parser.add_argument("inputs", nargs="+", help="draft JSON files, directories or glob patterns")
+    parser.add_argument("-o", "--out-dir", default=str(DEFAULT_OUT_DIR), help="output directory for PDFs")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--summary", default=None, help="summary JSON path (default: <out-dir>/summary.json)")
+    parser.add_argument("--report-no", default="DRAFT", help="report number printed on every report")
+    parser.add_argument("--set", dest="overrides", action="append", type=_parse_override, default=[],
+                        metavar="KEY=VALUE", help="context override, e.g. --set raster_dpi=300")
+    parser.add_argument("--quality", choices=["final", "draft"], default="final",
+                        help="draft: same layout, low-resolution images (default: final)")
+    args = parser.parse_args(argv)
+
+    drafts = expand_inputs(args.inputs)
+    if not drafts:
+        parser.error("no draft files matched")
+
+    def _progress(r):
+        status = "ok " if r["ok"] else "ERR"
+        print(f"[{status}] {r['seconds']:7.2f}s  {r['draft']}" + ("" if r["ok"] else f"  {r['error']}"), flush=True)
+
+    started = time.perf_counter()
+    results = run_batch(drafts, args.out_dir, args.workers, args.report_no, dict(args.overrides), _progress,
+                        args.quality)
+    wall = time.perf_counter() - started
+
+    failed = [r for r in results if not r["ok"]]
+    summary = {
+        "jobs": results,
+        "total": len(results),
+        "failed": len(failed),
+        "wall_seconds": round(wall, 4),
+        "sum_job_seconds": round(sum(r["seconds"] for r in results), 4),
+        "workers": max(1, min(args.workers or os.cpu_count() or 1, len(results))),
+    }
+    summary_path = Path(args.summary) if args.summary else Path(args.out_dir) / "summary.json"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"{len(results) - len(failed)}/{len(results)} rendered in {wall:.2f}s -> {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
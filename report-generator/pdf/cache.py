@@ -0,0 +1,212 @@
+# === Imports ===
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+# ---------------- In-memory LRU cache ----------------
+
+class LRUCache:
+    """
+    Small thread-safe LRU map shared by the report generator.
+    Streamlit serves sessions from several threads of one process, so every
+    access goes through a lock. Bounded by entry count and, when `sizeof` is
+    given, by the total size of the stored values (`max_bytes`).
+    `on_evict(key, value)` is called for every entry pushed out by the bounds.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=None, sizeof=None, on_evict=None):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._size(self._data.pop(key))
+            self._data[key] = value
+            self._bytes += self._size(value)
+            while len(self._data) > 1 and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                old_key, old_value = self._data.popitem(last=False)
+                self._bytes -= self._size(old_value)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        # callbacks may do I/O; keep them outside the lock
+        if self._on_evict is not None:
+            for old_key, old_value in evicted:
+                self._on_evict(old_key, old_value)
+
+    def _size(self, value):
+        return self._sizeof(value) if self._sizeof is not None else 0
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def __contains__(self, key):
+        # membership only: neither counted in stats nor moved to the recent end
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ---------------- On-disk content-addressed cache ----------------
+
+class DiskCache:
+    """
+    Directory of immutable blobs named by their (hex) key.
+    Writes are atomic (temp file + rename); when the directory grows past
+    `max_bytes` the least recently used blobs are deleted. A hit bumps the
+    file's mtime, which is what the eviction order is based on.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, suffix=".bin"):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            # cache is best-effort: a read-only or full disk must not break rendering
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for p in self.directory.glob(f"*{self.suffix}"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, p in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    p.unlink()
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "directory": str(self.directory),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# ---------------- Content hashing ----------------
+
+# (path, mtime, size) -> sha256 hex, so unchanged files are hashed only once
+_FILE_DIGESTS = LRUCache(max_entries=256)
+
+
+def file_digest(path):
+    """sha256 of a file's contents, memoized on its path, mtime and size."""
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    key = (abs_path, st.st_mtime_ns, st.st_size)
+    digest = _FILE_DIGESTS.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(abs_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _FILE_DIGESTS.put(key, digest)
+    return digest
+
+
+def digest_key(*parts):
+    """Stable sha256 over a sequence of plain values (str/int/float/bool/None)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
@@ -0,0 +1,177 @@
+# === Imports ===
+from copy import deepcopy
+from datetime import date
+from pathlib import Path
+
+from configs.defaults import DEFAULT_CONTEXT
+from configs.lasers import LASER_PRESETS
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# asset paths in drafts may be relative to the project root
+ASSET_KEYS = ["lab_image", "logo_title", "logo_inner"]
+
+# (section item label, laser preset field)
+LASER_ITEMS = [
+    ("Laser Type", "laser_type"),
+    ("Wavelength (nm)", "wavelength_nm"),
+    ("Repetition Frequency", "pulse_repetition_frequency"),
+    ("Output Energy/Power", "output_energy_or_power"),
+    ("Pulse Duration (1/e²)", "pulse_duration_1e2"),
+    ("Effective Pulse Duration", "effective_pulse_duration"),
+    ("Polarization", "polarization_state"),
+    ("Beam Diameter (1/e²)", "beam_diameter_1e2"),
+    ("Beam Profile (Near Field)", "spatial_beam_profile_near_field"),
+    ("Beam Delivery", "beam_delivery"),
+]
+
+
+# ---------------- Form state <-> report context ----------------
+
+def new_context():
+    """Empty report form, as created by "Start new report"."""
+    ctx = deepcopy(DEFAULT_CONTEXT)
+    ctx.update({
+        "report_no": "",
+        "standard": "ISO 21254",
+        "sample": "",
+        "prepared_by": [],
+        "approved_by": "",
+        # prefill but editable
+        "institute": "HiLASE Centre, Institute of Physics ASCR",
+        "inst_address": "Za Radnici 828, 252 41 Dolni Brezany, Czech Republic",
+        "customer": "",
+        "cust_address": "",
+        "cust_contact": "",
+        "sections": []
+    })
+    return ctx
+
+
+def context_from_draft(draft, root=ROOT):
+    """
+    Report form from a draft JSON dict: defaults + draft keys, with the
+    per-section editor state (`sections_data`) hydrated from its sections and
+    relative asset paths resolved against `root`.
+    """
+    ctx = deepcopy(DEFAULT_CONTEXT)
+    ctx.update(draft)
+    form_sections = ctx.setdefault("sections_data", {})
+
+    for section in draft.get("sections", []):
+        title = section.get("title", "")
+        items = dict(section.get("items", []))
+
+        if title == "Sample Information":
+            form_sections["sample_information"] = {
+                "description": items.get("Description", ""),
+                "date_received": (
+                    date.fromisoformat(items["Date Received"])
+                    if items.get("Date Received") else date.today()
+                ),
+                "preparation": items.get("Preparation", ""),
+            }
+
+        elif title == "Laser and Environmental Conditions":
+            laser = dict(LASER_PRESETS["manual"]["data"])
+            for label, key in LASER_ITEMS:
+                if label in items:
+                    laser[key] = items[label]
+            form_sections.setdefault("laser_environmental", {})["laser"] = laser
+
+        elif title == "Test Identification":
+            form_sections["test_identification"] = {
+                "procedure": items.get("Procedure", ""),
+                "objective": items.get("Objective", ""),
+                "sites_pulses": items.get("Sites / Pulses per Site", ""),
+                "damage_detection": items.get("Damage Detection", ""),
+            }
+
+    for k in ASSET_KEYS:
+        p = Path(ctx[k])
+        if not p.is_absolute():
+            ctx[k] = str((Path(root) / p).resolve())
+    return ctx
+
+
+def build_sections(form, laser_preset=None):
+    """
+    Report sections for generate_report from the editor state.
+    `laser_preset` (a LASER_PRESETS key) supplies the laser figure; by default
+    the preset recorded in the form is used.
+    """
+    sections_data = form.get("sections_data", {})
+    sections = []
+
+    sections.append({
+        "title": "Report Identification",
+        "items": [
+            ["Report Number", form.get("report_no", "")],
+            ["Issue Date", form.get("issue_date", "")],
+        ],
+    })
+
+    # Section 2
+    sec2 = sections_data.get("sample_information", {})
+    sections.append({
+        "title": "Sample Information",
+        "items": [
+            ["Sample ID", form.get("sample", "")],
+            ["Description", sec2.get("description", "")],
+            ["Date Received", (
+                sec2["date_received"].strftime("%d %B %Y")
+                if isinstance(sec2.get("date_received"), date)
+                else ""
+            )],
+            ["Preparation", sec2.get("preparation", "")],
+        ],
+    })
+
+    sec3 = sections_data.get("laser_environmental", {})
+    laser = sec3.get("laser", {})
+    if laser_preset is None:
+        laser_preset = sec3.get("preset")
+    selected_laser = LASER_PRESETS.get(laser_preset, {})
+    laser_images = selected_laser.get("images", {})
+    sections.append({
+        "title": "Laser and Environmental Conditions",
+        "items": [[label, laser.get(key, "")] for label, key in LASER_ITEMS],
+        "images": laser_images,
+    })
+
+    sec4 = sections_data.get("test_identification", {})
+    sections.append({
+        "title": "Test Identification",
+        "items": [
+            ["Procedure", sec4.get("procedure", "")],
+            ["Objective", sec4.get("objective", "")],
+            ["Sites / Pulses per Site", sec4.get("sites_pulses", "")],
+            ["Damage Detection", sec4.get("damage_detection", "")],
+        ],
+    })
+
+    sec5 = sections_data.get("test_setup", {})
+    if sec5.get("choice") and sec5["choice"] != "Skip" and sec5.get("image"):
+        sections.append({
+            "title": "Test Setup",
+            "images": {
+                "layout": "template1",
+                "items": [
+                    {"path": sec5["image"]},
+                ],
+            "overlay_color": "black",
+            "caption": "Test setup.",
+            "width_pct": 1,
+            "flatten_alpha_to_white": False}
+        })
+
+    return sections
+
+
+def prepare_for_render(ctx, laser_preset=None, report_no="DRAFT", issue_date=None):
+    """Fill report number, issue date and sections in place, as the Generate button does."""
+    ctx["report_no"] = report_no
+    ctx["issue_date"] = (issue_date or date.today()).strftime("%d %B %Y")
+    ctx["sections"] = build_sections(ctx, laser_preset)
+    return ctx
@@ -0,0 +1,185 @@
+# === Imports ===
+import io
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from PIL import Image
+
+from .imaging import open_image, raster_size, decoded, cover_crop
+from .profiling import span
+
+
+# Encoded raster ready for ImageReader: `format` is "JPEG" (embedded as DCT)
+# or "PNG" (reportlab re-compresses the pixels with Flate).
+EncodedImage = namedtuple("EncodedImage", "data format width height")
+
+ENCODING_MODES = ("auto", "jpeg", "png")
+
+# final resize filter: LANCZOS for deliverables, BILINEAR is ~3x cheaper for drafts
+RESAMPLE_FILTERS = {"lanczos": Image.LANCZOS, "bilinear": Image.BILINEAR}
+
+# draft renders: coarse rasters, everything JPEG, cheap resampling
+DRAFT_RASTER_DPI = 36
+DRAFT_JPEG_QUALITY = 60
+
+# reportlab decodes PNGs and Flate-compresses the pixels itself, so the PNG
+# zlib level only affects encode time and cache size, not the PDF.
+PNG_COMPRESS_LEVEL = 1
+
+# A fitted image with at least this many distinct colours per pixel is
+# treated as photographic; plots, schematics and line-art stay well below.
+PHOTO_COLOR_RATIO = 0.25
+
+
+# ---------------- Encoding policy ----------------
+
+class ImagePolicy:
+    """
+    Decides how each raster is embedded in the PDF:
+      - JPEG sources that need no crop or downscale: original bytes (passthrough)
+      - photographic content: JPEG at `jpeg_quality`
+      - line-art / schematics (few distinct colours): lossless PNG/Flate
+    `mode` forces "jpeg" or "png" for everything; "auto" applies the rules above.
+    `raster_dpi` sets the pixel density figures are resampled to (72 = one
+    pixel per PDF point), capped at the source's own resolution, and
+    `resample` the filter of that final resize (see RESAMPLE_FILTERS).
+    With `track_savings` every non-PNG result is also PNG-encoded once to
+    measure how many bytes the policy saved (costly; meant for benchmarks).
+    """
+
+    def __init__(self, mode="auto", jpeg_quality=85, raster_dpi=72, track_savings=False, resample="lanczos"):
+        if mode not in ENCODING_MODES:
+            raise ValueError(f"Unknown image encoding mode: {mode!r}")
+        if raster_dpi <= 0:
+            raise ValueError(f"raster_dpi must be positive, got {raster_dpi!r}")
+        if resample not in RESAMPLE_FILTERS:
+            raise ValueError(f"Unknown resample filter: {resample!r}")
+        self.mode = mode
+        self.jpeg_quality = int(jpeg_quality)
+        self.raster_dpi = float(raster_dpi)
+        self.resample = resample
+        self.track_savings = track_savings
+        self._lock = threading.Lock()
+        self._stats = {"jpeg": 0, "png": 0, "passthrough": 0, "bytes_out": 0, "bytes_saved": 0}
+
+    @classmethod
+    def from_context(cls, context, **kwargs):
+        return cls(
+            mode=context.get("image_encoding", "auto"),
+            jpeg_quality=context.get("jpeg_quality", 85),
+            raster_dpi=context.get("raster_dpi", 72),
+            **kwargs,
+        )
+
+    @classmethod
+    def draft(cls, **kwargs):
+        """Cheap policy for draft renders; same boxes, coarser pixels."""
+        return cls(mode="jpeg", jpeg_quality=DRAFT_JPEG_QUALITY, raster_dpi=DRAFT_RASTER_DPI,
+                   resample="bilinear", **kwargs)
+
+    def cache_token(self):
+        # everything that changes the encoded bytes, for cache keys
+        return (self.mode, self.jpeg_quality, self.raster_dpi, self.resample)
+
+    @property
+    def resample_filter(self):
+        return RESAMPLE_FILTERS[self.resample]
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _record(self, kind, nbytes, reference_bytes=None):
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats["bytes_out"] += nbytes
+            if reference_bytes is not None:
+                self._stats["bytes_saved"] += reference_bytes - nbytes
+
+    def _png_size(self, img):
+        # what encode() would have written for this image as PNG
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        return buf.tell()
+
+    def choose(self, img, source_format=None, override=None):
+        mode = override or self.mode
+        if mode in ("jpeg", "png"):
+            return mode.upper()
+        if source_format == "JPEG":
+            return "JPEG"
+        # getcolors returns None once the limit is exceeded -> photographic
+        max_colors = max(256, int(img.width * img.height * PHOTO_COLOR_RATIO))
+        return "JPEG" if img.getcolors(maxcolors=max_colors) is None else "PNG"
+
+    def encode(self, img, source_format=None, override=None):
+        fmt = self.choose(img, source_format, override)
+        buf = io.BytesIO()
+        with span("image.encode") as s:
+            if fmt == "JPEG":
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                img.save(buf, format="JPEG", quality=self.jpeg_quality)
+            else:
+                img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+            data = buf.getvalue()
+            s.add_bytes(len(data))
+        reference = self._png_size(img) if (self.track_savings and fmt == "JPEG") else None
+        self._record(fmt.lower(), len(data), reference)
+        return EncodedImage(data, fmt, img.width, img.height)
+
+    def pixel_size(self, source_size, box_w, box_h):
+        return raster_size(source_size, box_w, box_h, self.raster_dpi)
+
+    def can_passthrough(self, source_format, source_mode, source_size, target_w, target_h, override=None):
+        if (override or self.mode) == "png" or source_format != "JPEG" or source_mode not in ("RGB", "L"):
+            return False
+        w, h = source_size
+        # a source no larger than the raster target is embedded as-is and scaled by the PDF
+        if w > target_w or h > target_h:
+            return False
+        # cover-crop would cut less than a pixel -> no crop needed
+        target_ratio = target_w / target_h
+        if w / h > target_ratio:
+            return int(h * target_ratio) >= w
+        return int(w / target_ratio) >= h
+
+    def passthrough(self, data, width, height, reference_img=None):
+        reference = None
+        if self.track_savings and reference_img is not None:
+            reference = self._png_size(reference_img)
+        self._record("passthrough", len(data), reference)
+        return EncodedImage(data, "JPEG", width, height)
+
+
+def _read_bytes(src):
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src)
+    return Path(src).read_bytes()
+
+
+def fit_and_encode(src, box_w, box_h, policy, *, flatten_white=False, override=None):
+    """
+    Final encoded raster for a box_w x box_h box (PDF points), following
+    `policy`: resampled to policy.raster_dpi, then JPEG/PNG/passthrough.
+    Only the file header is read when the original JPEG can be passed through.
+    """
+    with open_image(src) as im:
+        fmt, mode, size = im.format, im.mode, im.size
+    target_w, target_h = policy.pixel_size(size, box_w, box_h)
+    if policy.can_passthrough(fmt, mode, size, target_w, target_h, override):
+        with span("image.passthrough") as s:
+            data = _read_bytes(src)
+            s.add_bytes(len(data))
+        if policy.track_savings:
+            # the passthrough keeps the source size, so the reference is the plain decode, not resampled
+            with decoded(src) as rgb:
+                return policy.passthrough(data, size[0], size[1], rgb)
+        return policy.passthrough(data, size[0], size[1])
+    # the decoded pixels stay reserved in the pixel budget until the encode is done
+    with decoded(src, target_w, target_h, flatten_white=flatten_white) as rgb:
+        fitted = cover_crop(rgb, target_w, target_h, policy.resample_filter)
+        del rgb
+        return policy.encode(fitted, source_format=fmt, override=override)
@@ -0,0 +1,163 @@
+"""
+Font registration for the report. Nothing is parsed at import: the
+TrueType fonts are registered with reportlab on first use (ensure_fonts),
+and their parsed metrics can be kept on disk, keyed by the font file's
+hash, so a fresh process skips most of the TTF parsing. A font rebuilt
+from cached metrics is compared with the freshly parsed one before the
+entry is written; if they differ (e.g. a reportlab release that sets up
+TTFont differently), nothing is cached and fonts are always parsed.
+"""
+
+# === Imports ===
+import pickle
+import threading
+from fnmatch import fnmatch
+from pathlib import Path
+
+from .cache import DiskCache, file_digest, digest_key
+
+
+ROOT = Path(__file__).resolve().parents[1]
+FONT_PATH = ROOT / "assets" / "fonts" / "DejaVuSans.ttf"
+FONT_CACHE_DIR = ROOT / "data" / "cache" / "fonts"
+FONT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# name -> TrueType file registered by ensure_fonts()
+REPORT_FONTS = {"DejaVu": FONT_PATH}
+
+# bump when the pickled layout changes
+_METRICS_VERSION = 2
+
+# not pickled: the raw file is re-read, the scale function is a closure
+_UNPICKLED = ("_ttf_data", "_pdfScale")
+
+# compared between a rebuilt and a parsed font, besides their attributes
+_PROBE_TEXT = "LIDT 1064 nm ±0.5 J/cm² Žluťoučký kůň ÄÖÜß"
+
+
+# ---------------- Parsed-metrics cache ----------------
+
+_METRICS_CACHE = DiskCache(FONT_CACHE_DIR, max_bytes=FONT_CACHE_MAX_BYTES, suffix=".pickle")
+
+
+def configure_font_cache(directory=FONT_CACHE_DIR, max_bytes=FONT_CACHE_MAX_BYTES):
+    """Move the parsed-metrics cache; directory=None parses the fonts every time."""
+    global _METRICS_CACHE
+    _METRICS_CACHE = None if directory is None else DiskCache(directory, max_bytes=max_bytes, suffix=".pickle")
+
+
+def font_cache_stats():
+    return _METRICS_CACHE.stats() if _METRICS_CACHE is not None else None
+
+
+def _pdf_scale(units_per_em):
+    # same as TTFontFile.extractInfo
+    if units_per_em == 1000:
+        return lambda x: x
+    mult = 1000 / units_per_em
+    return lambda x: x * mult
+
+
+def _ttfont_from_metrics(name, path, metrics):
+    from reportlab import rl_config
+    from reportlab.pdfbase.ttfonts import TTEncoding, TTFont, TTFontFace
+    from weakref import WeakKeyDictionary
+
+    face = TTFontFace.__new__(TTFontFace)
+    face.__dict__.update(metrics)
+    face.filename = str(path)
+    face._ttf_data = Path(path).read_bytes()
+    face._pdfScale = _pdf_scale(face.unitsPerEm)
+
+    # what TTFont.__init__ sets up around the parsed face
+    font = TTFont.__new__(TTFont)
+    font.fontName = name
+    font.face = face
+    font.encoding = TTEncoding()
+    font.state = WeakKeyDictionary()
+    font._asciiReadable = rl_config.ttfAsciiReadable
+    font.shapable = not any(fnmatch(name, pattern) for pattern in rl_config.unShapedFontGlob)
+    return font
+
+
+def _attrs(obj):
+    return sorted(vars(obj))
+
+
+def font_mismatch(font, expected):
+    """
+    First difference between TTFont `font` and `expected` (attribute names,
+    face metrics and widths, encoding, subset state), or None if there is none.
+    """
+    if type(font) is not type(expected) or _attrs(font) != _attrs(expected):
+        return "font attributes"
+    for k, v in vars(expected).items():
+        if k not in ("face", "encoding", "state") and getattr(font, k) != v:
+            return f"font.{k}"
+    if _attrs(font.face) != _attrs(expected.face) or _attrs(font.encoding) != _attrs(expected.encoding):
+        return "face/encoding attributes"
+    for k, v in vars(expected.face).items():
+        if k == "_pdfScale":
+            if font.face._pdfScale(1234) != v(1234):
+                return "face._pdfScale"
+        elif getattr(font.face, k) != v:
+            return f"face.{k}"
+    if vars(font.encoding) != vars(expected.encoding):
+        return "encoding"
+    if type(font.state) is not type(expected.state) or len(font.state) or len(expected.state):
+        return "state"
+    for size in (10, 11.5):
+        if font.stringWidth(_PROBE_TEXT, size) != expected.stringWidth(_PROBE_TEXT, size):
+            return "stringWidth"
+    return None
+
+
+def load_ttfont(name, path):
+    """TTFont for `path`, from the metrics cache when the file is unchanged."""
+    from reportlab import Version
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    cache = _METRICS_CACHE
+    if cache is None:
+        return TTFont(name, str(path))
+    key = digest_key("ttf-metrics", _METRICS_VERSION, Version, file_digest(path))
+    data = cache.get(key)
+    if data is not None:
+        try:
+            entry = pickle.loads(data)
+            font = _ttfont_from_metrics(name, path, entry["face"])
+            # same layout as the parsed font the entry was verified against
+            if _attrs(font) == entry["font_attrs"] and _attrs(font.face) == entry["face_attrs"]:
+                return font
+        except Exception:
+            pass  # unreadable entry (e.g. written by another reportlab build): parse again
+    font = TTFont(name, str(path))
+    metrics = {k: v for k, v in font.face.__dict__.items() if k not in _UNPICKLED}
+    try:
+        mismatch = font_mismatch(_ttfont_from_metrics(name, path, metrics), font)
+    except Exception:
+        mismatch = "rebuild failed"
+    if mismatch is None:
+        entry = {"face": metrics, "font_attrs": _attrs(font), "face_attrs": _attrs(font.face)}
+        cache.put(key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    return font
+
+
+# ---------------- Registration ----------------
+
+_registered = False
+_register_lock = threading.Lock()
+
+
+def ensure_fonts():
+    """Register REPORT_FONTS with reportlab; cheap after the first call."""
+    global _registered
+    if _registered:
+        return
+    with _register_lock:
+        if _registered:
+            return
+        from reportlab.pdfbase import pdfmetrics
+        for name, path in REPORT_FONTS.items():
+            pdfmetrics.registerFont(load_ttfont(name, path))
+        _registered = True
@@ -4,51 +4,37 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
-from PIL import Image
 import io, os
-from textwrap import wrap
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPDF
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import logging
+import pickle
+from contextlib import nullcontext
 from pathlib import Path
 
+from .cache import LRUCache, DiskCache, file_digest, digest_key
+from .fonts import ensure_fonts
+from .imaging import (
+    make_gradient as _make_gradient, compose_banner, load_image, open_image, ImageTooLarge,
+)
+from .encoding import ImagePolicy
+from .tiles import TileCache, source_digest
+from .prefetch import FigurePrefetcher
+from .profiling import span
+from .layout import (
+    INNER_HEADER_HEIGHT_PT, INNER_LOGO_HEIGHT_PT,
+    TextBox, RuleBox, ImageBox, BannerBox, SvgBox, StageMark, layout_document,
+)
 
-FONT_PATH = Path(__file__).resolve().parents[1] / "assets" / "fonts" / "DejaVuSans.ttf"
-pdfmetrics.registerFont(TTFont("DejaVu", str(FONT_PATH)))
 
-# ---------------- Helpers - styling functions ----------------
+ROOT = Path(__file__).resolve().parents[1]
+BANNER_CACHE_DIR = ROOT / "data" / "cache" / "banners"
+BANNER_CACHE_MAX_BYTES = 32 * 1024 * 1024
+TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TILE_SPILL_DIR = ROOT / "data" / "cache" / "tiles"
+TILE_SPILL_MAX_BYTES = 256 * 1024 * 1024
 
-def _hex_to_rgb(hex_color: str):
-    hex_color = hex_color.lstrip("#")
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-
-def _cover_crop(img, target_w, target_h):
-    w, h = img.size
-    target_ratio = target_w / target_h
-    img_ratio = w / h
-    if img_ratio > target_ratio:
-        new_w = int(h * target_ratio)
-        x_off = (w - new_w) // 2
-        box = (x_off, 0, x_off + new_w, h)
-    else:
-        new_h = int(w / target_ratio)
-        y_off = (h - new_h) // 2
-        box = (0, y_off, w, y_off + new_h)
-    return img.crop(box).resize((target_w, target_h), Image.LANCZOS)
-
-def _make_gradient(w, h, color_left, color_right, alpha):
-    c1, c2 = _hex_to_rgb(color_left), _hex_to_rgb(color_right)
-    gradient = Image.new("RGBA", (w, h))
-    a = int(255 * alpha)
-    for x in range(max(w, 1)):
-        t = x / (w - 1) if w > 1 else 0
-        r = int(c1[0]*(1-t) + c2[0]*t)
-        g = int(c1[1]*(1-t) + c2[1]*t)
-        b = int(c1[2]*(1-t) + c2[2]*t)
-        for y in range(h):
-            gradient.putpixel((x, y), (r, g, b, a))
-    return gradient
+log = logging.getLogger(__name__)
+
+# ---------------- Helpers - styling functions ----------------
 
 def _pil_to_reader(img):
     buf = io.BytesIO()
@@ -56,53 +42,89 @@ def _pil_to_reader(img):
     buf.seek(0)
     return ImageReader(buf)
 
+# Encoded figure tiles shared by every report of the process (preset images,
+# setup schemes, re-used uploads); see pdf/tiles.py.
+_TILE_CACHE = TileCache(
+    max_bytes=TILE_CACHE_MAX_BYTES,
+    spill_dir=TILE_SPILL_DIR,
+    spill_max_bytes=TILE_SPILL_MAX_BYTES,
+)
+
+def configure_tile_cache(max_bytes=TILE_CACHE_MAX_BYTES, max_entries=512,
+                         spill_dir=TILE_SPILL_DIR, spill_max_bytes=TILE_SPILL_MAX_BYTES):
+    """Replace the process-wide tile cache; spill_dir=None keeps it memory-only."""
+    global _TILE_CACHE
+    _TILE_CACHE = TileCache(max_bytes=max_bytes, max_entries=max_entries,
+                            spill_dir=spill_dir, spill_max_bytes=spill_max_bytes)
+
+def tile_cache_stats():
+    return _TILE_CACHE.stats()
+
+def _encoded_to_reader(encoded):
+    # JPEG data is embedded as-is (DCTDecode); PNG pixels are Flate-compressed by reportlab
+    return ImageReader(io.BytesIO(encoded.data))
+
+# Parsed + scaled SVG drawings, shared by every report rendered in this process,
+# stored pickled: the bytes cannot be modified, and unpickling a private
+# drawing is about 5x cheaper than deep-copying one (reportlab's renderer sets
+# _canvas/_parent on the nodes it draws, so a drawing must not be shared).
+# Keyed by (path, mtime, height) so an edited logo file is re-parsed automatically.
+_SVG_CACHE = LRUCache(max_entries=32)
+
+
+def _load_svg_drawing(svg_path, target_height_pt):
+    """Return a private copy of the parsed SVG scaled to `target_height_pt`."""
+    abs_path = os.path.abspath(svg_path)
+    key = (abs_path, os.stat(abs_path).st_mtime_ns, float(target_height_pt))
+    data = _SVG_CACHE.get(key)
+    if data is None:
+        # svglib is slow to import and only needed once a logo is drawn
+        from svglib.svglib import svg2rlg
+        with span("svg.parse", os.path.getsize(abs_path)):
+            drawing = svg2rlg(abs_path)
+        # keep background transparent if present
+        if hasattr(drawing, "background"):
+            drawing.background = None
+        scale = target_height_pt / drawing.height
+        drawing.width  *= scale
+        drawing.height *= scale
+        drawing.scale(scale, scale)
+        data = pickle.dumps(drawing, protocol=pickle.HIGHEST_PROTOCOL)
+        _SVG_CACHE.put(key, data)
+    return pickle.loads(data)
+
+def svg_cache_stats():
+    return _SVG_CACHE.stats()
+
 def _draw_svg(c, svg_path, x_left, baseline_y, target_height_pt):
-    drawing = svg2rlg(svg_path)
-    # keep background transparent if present
-    if hasattr(drawing, "background"):
-        drawing.background = None
-    scale = target_height_pt / drawing.height
-    drawing.width  *= scale
-    drawing.height *= scale
-    drawing.scale(scale, scale)
-    renderPDF.draw(drawing, c, x_left, baseline_y)
-
-def _wrap_text(c, text, font_name, font_size, max_width):
-    words = text.split()
-    lines = []
-    current = []
-    for w in words:
-        test = (" ".join(current + [w])) if current else w
-        if c.stringWidth(test, font_name, font_size) <= max_width:
-            current.append(w)
-        else:
-            if current:
-                lines.append(" ".join(current))
-            current = [w]
-    if current:
-        lines.append(" ".join(current))
-    return lines
+    from reportlab.graphics import renderPDF
+    drawing = _load_svg_drawing(svg_path, target_height_pt)
+    with span("svg.draw"):
+        renderPDF.draw(drawing, c, x_left, baseline_y)
 
 
-def _draw_header_footer_svg_ombre(
+INNER_HEADER_FORM = "innerHeader"
+
+QUALITY_MODES = ("final", "draft")
+PLACEHOLDER_COLOR = "#E5E7EB"
+
+
+def _build_header_form(
     c, page_w, page_h, *,
-    logo_path, sample_name, report_no,
-    left_margin=16*mm, right_margin=16*mm, top_margin=16*mm, bottom_margin=16*mm,
-    logo_height_pt=35, header_height_pt=35,
-    ombre_left="#1B8EAB", ombre_right="#5BB79E", ombre_alpha=0.5,
-    header_font="Helvetica", header_font_size=10.5,
-    footer_font="Helvetica", footer_font_size=9
+    form_name, logo_path, left_margin, logo_height_pt, header_height_pt,
+    ombre_left, ombre_right, ombre_alpha
 ):
-    # header area
- 
-    # 
-    y_top = page_h
+    """
+    Compile the static part of the inner-page header (ombre strip + SVG logo)
+    into a PDF form XObject. It is stored once in the document and stamped on
+    every page with doForm, so the raster and the logo paths are not repeated.
+    """
     header_h = int(header_height_pt)
-    header_y = y_top - header_h
+    header_y = page_h - header_h
     header_w = int(page_w)
     header_x = 0
-    #header_x = left_margin
-    
+
+    c.beginForm(form_name, 0, header_y, page_w, page_h)
 
     # ombre strip (no photo) as header background
     grad = _make_gradient(header_w, header_h, ombre_left, ombre_right, ombre_alpha)
@@ -113,6 +135,38 @@ def _draw_header_footer_svg_ombre(
         logo_baseline_y = header_y + (header_h-logo_height_pt) / 2.0
         _draw_svg(c, logo_path, left_margin, logo_baseline_y, logo_height_pt)
 
+    c.endForm()
+
+
+def _draw_header_footer_svg_ombre(
+    c, page_w, page_h, *,
+    logo_path, sample_name, report_no,
+    left_margin=16*mm, right_margin=16*mm, top_margin=16*mm, bottom_margin=16*mm,
+    logo_height_pt=35, header_height_pt=35,
+    ombre_left="#1B8EAB", ombre_right="#5BB79E", ombre_alpha=0.5,
+    header_font="Helvetica", header_font_size=10.5,
+    footer_font="Helvetica", footer_font_size=9,
+    form_name=INNER_HEADER_FORM
+):
+    # header area
+    header_h = int(header_height_pt)
+    header_y = page_h - header_h
+
+    # static strip + logo: built on the first inner page, reused afterwards
+    if not c.hasForm(form_name):
+        _build_header_form(
+            c, page_w, page_h,
+            form_name=form_name,
+            logo_path=logo_path,
+            left_margin=left_margin,
+            logo_height_pt=logo_height_pt,
+            header_height_pt=header_height_pt,
+            ombre_left=ombre_left,
+            ombre_right=ombre_right,
+            ombre_alpha=ombre_alpha,
+        )
+    c.doForm(form_name)
+
     # right-aligned header text in white
     c.setFillColor(colors.white)
     c.setFont(header_font, header_font_size)
@@ -125,585 +179,180 @@ def _draw_header_footer_svg_ombre(
     c.drawString(left_margin, footer_y, f"Report No: {report_no}")
     c.drawRightString(page_w - right_margin, footer_y, f"Page {c.getPageNumber()}")
 
-# --- New simple section drawing function ---
-def _draw_overlay_letter(c, letter, x, y, font_size=10, color="white"):
-    """
-    Draw just a bold letter (no background badge).
-    (x, y) is the top-left anchor inside the image.
-    color: 'white' or 'black'
-    """
-    if color not in ("white", "black"):
-        color = "white"  # fallback
-    c.setFont("Helvetica-Bold", font_size)
-    c.setFillColor(colors.HexColor("#FFFFFF" if color == "white" else "#111827"))
-    # Draw with a slight downward shift so top aligns more naturally
-    c.drawString(x, y - font_size, letter)
-
-def _load_image_flatten_white(path):
-    im = Image.open(path)
-    # If there's an alpha channel (RGBA, LA, or palette with transparency), flatten onto white
-    if im.mode in ("RGBA", "LA") or (im.mode == "P" and ("transparency" in im.info)):
-        im = im.convert("RGBA")
-        white_bg = Image.new("RGBA", im.size, (255, 255, 255, 255))
-        white_bg.alpha_composite(im)
-        return white_bg.convert("RGB")
-    else:
-        return im.convert("RGB")
-
-
-
-def _draw_image_template(
-    c,
-    images_spec,
-    start_y,
-    page_w,
-    page_h,
-    margins,
-    on_new_page,
-    left_margin_mm=16,
-    right_margin_mm=16,
-    min_bottom_gap_pt=20,
-    width_pct=0.8,
-    figure_number=None
-):
-    """
-    Adds optional transparency flatten flag:
-      images_spec['flatten_alpha_to_white'] = True/False (default False)
-    If True: transparent pixels become white; if False: current behavior (transparent -> black).
-    """
-    if not images_spec:
-        return start_y, False
-
-    if images_spec.get("layout") == "template1":
-        items = images_spec.get("items") or []
-        if not items:
-            return start_y, False
-
-        img_path = items[0].get("path")
-        if not img_path or (not isinstance(img_path, bytes) and not os.path.exists(img_path)):
-            return start_y, False
-
-        caption_user = images_spec.get("caption", "").strip()
-        overlay_color = images_spec.get("overlay_color", "white")
-        width_pct = max(0.1, min(width_pct, 1.0))
-
-        # Figure caption
-        if figure_number is not None:
-            caption_final = f"Figure {figure_number}: {caption_user}" if caption_user else f"Figure {figure_number}"
-        else:
-            caption_final = caption_user
-
-        left_x = left_margin_mm * mm
-        right_x = page_w - right_margin_mm * mm
-        usable_w = right_x - left_x
-
-        img_w = usable_w * width_pct
-        img_x = left_x + (usable_w - img_w) / 2
-
-        caption_h = 12 if caption_final else 0
-        bottom_limit = margins["bottom_mm"] * mm + min_bottom_gap_pt
-
-        min_img_h = 80
-        needed_min = min_img_h + caption_h + 16
-        if start_y - needed_min < bottom_limit:
-            c.showPage()
-            start_y = on_new_page(c)
-
-        available_h_for_image = start_y - (bottom_limit + caption_h + 16)
-        if available_h_for_image < 40:
-            available_h_for_image = 40
-
-        # Choose loading strategy based on flag
-        flatten_flag = images_spec.get("flatten_alpha_to_white", False)
-
-        try:
-            if flatten_flag:
-                pil = _load_image_flatten_white(img_path)
-            else:
-                pil = Image.open(img_path).convert("RGB")
-
-            w0, h0 = pil.size
-            scale = img_w / w0
-            img_h = h0 * scale
-            if img_h > available_h_for_image:
-                scale = available_h_for_image / h0
-                img_h = available_h_for_image
-                img_w = w0 * scale
-                img_x = left_x + (usable_w - img_w) / 2
-
-            fitted = _cover_crop(pil, int(img_w), int(img_h))
-            reader = _pil_to_reader(fitted)
-        except Exception:
-            return start_y, False
-
-        c.drawImage(reader, img_x, start_y - img_h, width=img_w, height=img_h)
+# ---------------- Paint pass ----------------
 
-        # _draw_overlay_letter(
-        #     c,
-        #     "a",
-        #     img_x + 6,
-        #     start_y - 6,
-        #     font_size=10,
-        #     color="white" if overlay_color == "white" else "black"
-        # )
-
-        y = start_y - img_h - 8
-
-        if caption_final:
-            c.setFillColor(colors.HexColor("#111827"))
-            caption_font = "Helvetica-Oblique"
-            caption_size = 10
-            line_spacing = 12
-
-            usable_w2 = (page_w - right_margin_mm * mm) - (left_margin_mm * mm)
-
-            # wrap caption into multiple lines
-            lines = _wrap_text(c, caption_final, caption_font, caption_size, usable_w2)
-
-            c.setFont(caption_font, caption_size)
-            current_y = y - line_spacing
-
-            if len(lines) == 1:
-                # ---- single line → center ----
-                line = lines[0]
-                text_w = c.stringWidth(line, caption_font, caption_size)
-                caption_x = left_x + (usable_w2 - text_w) / 2
-                c.drawString(caption_x, current_y, line)
-                current_y -= line_spacing
-            else:
-                # ---- multiple lines → left align ----
-                caption_x = left_x
-                for line in lines:
-                    c.drawString(caption_x, current_y, line)
-                    current_y -= line_spacing
-
-            # extra gap after caption
-            y = current_y - 35
-
-
-
-
-
-            return y, True
+def _draw_placeholder(c, x, y, w, h, color=PLACEHOLDER_COLOR):
+    # draft stand-in for an image: same box, nothing decoded
+    c.saveState()
+    c.setFillColor(colors.HexColor(color))
+    c.setStrokeColor(colors.HexColor("#9CA3AF"))
+    c.setLineWidth(0.5)
+    c.rect(x, y, w, h, stroke=1, fill=1)
+    if color == PLACEHOLDER_COLOR:
+        c.line(x, y, x + w, y + h)
+        c.line(x, y + h, x + w, y)
+    c.restoreState()
 
 
+def _paint_page(c, page, context, image_policy, tiles, on_stage=None, placeholders=False):
+    """
+    Emit the canvas operations of one laid-out page, without ending it.
+    All positions and page breaks come from the layout; only images are
+    encoded here (or drawn as placeholder boxes with `placeholders`).
+    """
+    if page.chrome:
+        m = context["margins"]
+        with span("page.chrome"):
+            _draw_header_footer_svg_ombre(
+                c, *A4,
+                logo_path=context["logo_inner"],
+                sample_name=context["sample"],
+                report_no=context["report_no"],
+                left_margin=m["left_mm"] * mm,
+                right_margin=m["right_mm"] * mm,
+                top_margin=m["top_mm"] * mm,
+                bottom_margin=m["bottom_mm"] * mm,
+                ombre_left=context["ombre_left"],
+                ombre_right=context["ombre_right"],
+                ombre_alpha=context["ombre_alpha"],
+                logo_height_pt=INNER_LOGO_HEIGHT_PT,
+                header_height_pt=INNER_HEADER_HEIGHT_PT
+            )
 
-    # ------------------------------------------------------------
-    # TEMPLATE 2: 2x2 grid (a b / c d)
-    # ------------------------------------------------------------
-    if images_spec.get("layout") == "template2":
-        items = images_spec.get("items") or []
-        if len(items) < 4:
-            return start_y, False  # need exactly 4 images
-        overlay_color = images_spec.get("overlay_color", "white")
-        flatten_flag = images_spec.get("flatten_alpha_to_white", False)
-        width_pct_local = max(0.1, min(images_spec.get("width_pct", width_pct), 1.0))
-
-        caption_user = images_spec.get("caption", "").strip()
-        if figure_number is not None:
-            caption_final = f"Figure {figure_number}: {caption_user}" if caption_user else f"Figure {figure_number}"
-        else:
-            caption_final = caption_user
-        caption_h = 12 if caption_final else 0
-
-        left_x = left_margin_mm * mm
-        right_x = page_w - right_margin_mm * mm
-        usable_w = right_x - left_x
-
-        grid_w = usable_w * width_pct_local
-        grid_x = left_x + (usable_w - grid_w) / 2
-
-        gap = 8  # horizontal & vertical gap
-        cell_w = (grid_w - gap) / 2
-        cell_h = cell_w 
-
-        # Load images and compute a common height so the grid is nice and even
-        # ==== NEW: load each image and stretch to exact cell size (no cropping, no borders) ====
-        readers = []
-        for i in range(4):
-            p = items[i].get("path")
-            if not p or not os.path.exists(p):
-                return start_y, False
+    # only emit font/colour operators when they change
+    font = fill = None
+    for box in page.boxes:
+        kind = type(box)
+        if kind is TextBox:
+            if box.color != fill:
+                fill = box.color
+                c.setFillColor(colors.HexColor(fill))
+            if (box.font, box.size) != font:
+                font = (box.font, box.size)
+                c.setFont(*font)
+            c.drawString(box.x, box.y, box.text)
+        elif kind is RuleBox:
+            if box.color != fill:
+                fill = box.color
+                c.setFillColor(colors.HexColor(fill))
+            c.rect(box.x, box.y, box.width, box.height, stroke=0, fill=1)
+        elif kind is ImageBox:
+            if placeholders:
+                _draw_placeholder(c, box.x, box.y, box.width, box.height)
+                continue
             try:
-                pil = _load_image_flatten_white(p) if flatten_flag else Image.open(p).convert("RGB")
+                # waits for the prefetch worker, or fits the image right here
+                with span("image.fetch"):
+                    encoded = tiles.fit_and_encode(box.src, box.width, box.height, image_policy,
+                                                   flatten_white=box.flatten_white, override=box.encoding)
+            except ImageTooLarge:
+                # over the pixel budget (imaging.configure_pixel_budget): show where it would go
+                _draw_placeholder(c, box.x, box.y, box.width, box.height)
+                continue
             except Exception:
-                return start_y, False
-
-            # Stretch directly to the grid cell dimensions (may slightly distort)
-            # resized = pil.resize((int(cell_w), int(cell_h)), Image.LANCZOS)
-            # readers.append(_pil_to_reader(resized))
-            fitted = _cover_crop(pil, int(cell_w), int(cell_h))
-            readers.append(_pil_to_reader(fitted))
-
-      
-
-        # Both rows have the same height now
-        row1_h = cell_h
-        row2_h = cell_h
-        needed = row1_h + gap + row2_h + 8 + caption_h + 16  # total vertical space
-
-
-
-        bottom_limit = margins["bottom_mm"] * mm + min_bottom_gap_pt
-
-        if start_y - needed < bottom_limit:
-            c.showPage()
-            start_y = on_new_page(c)
-
-        # Draw row 1 (a, b)
-        x_a = grid_x
-        x_b = grid_x + cell_w + gap
-        y_top = start_y
-        c.drawImage(readers[0], x_a, y_top - cell_h, width=cell_w, height=cell_h)
-        c.drawImage(readers[1], x_b, y_top - cell_h, width=cell_w, height=cell_h)
-
-        _draw_overlay_letter(c, "a", x_a + 6, y_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-        _draw_overlay_letter(c, "b", x_b + 6, y_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-
-        # Row 2 (c, d)
-        y_row2_top = y_top - row1_h - gap
-        c.drawImage(readers[2], x_a, y_row2_top - cell_h, width=cell_w, height=cell_h)
-        c.drawImage(readers[3], x_b, y_row2_top - cell_h, width=cell_w, height=cell_h)
-
-        _draw_overlay_letter(c, "c", x_a + 6, y_row2_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-        _draw_overlay_letter(c, "d", x_b + 6, y_row2_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-
-        y_after = y_row2_top - cell_h - 8
-
-        # Centered caption (optional)
-        if caption_final:
-            c.setFillColor(colors.HexColor("#111827"))
-            caption_font = "Helvetica-Oblique"
-            caption_size = 10
-            line_spacing = 12
-
-            # wrap caption into multiple lines (use full usable_w)
-            lines = _wrap_text(c, caption_final, caption_font, caption_size, usable_w)
-
-            c.setFont(caption_font, caption_size)
-            current_y = y_after - line_spacing
-
-            if len(lines) == 1:
-                # ---- single line → center ----
-                line = lines[0]
-                text_w = c.stringWidth(line, caption_font, caption_size)
-                caption_x = left_x + (usable_w - text_w) / 2
-                c.drawString(caption_x, current_y, line)
-                current_y -= line_spacing
-            else:
-                # ---- multiple lines → left align ----
-                caption_x = left_x
-                for line in lines:
-                    c.drawString(caption_x, current_y, line)
-                    current_y -= line_spacing
-
-            # extra gap after caption
-            y_after = current_y - 35
-
-        return y_after, True
-    
-    # ------------------------------------------------------------
-    # TEMPLATE 3: 1/3 + 2/3 top, full-width bottom (a | b / c)
-    # ------------------------------------------------------------
-    if images_spec.get("layout") == "template3":
-        items = images_spec.get("items") or []
-        if len(items) < 3:
-            return start_y, False  # need exactly 3 images
-
-        overlay_color = images_spec.get("overlay_color", "white")
-        flatten_flag = images_spec.get("flatten_alpha_to_white", False)
-        width_pct_local = max(0.1, min(images_spec.get("width_pct", width_pct), 1.0))
-
-        caption_user = images_spec.get("caption", "").strip()
-        if figure_number is not None:
-            caption_final = f"Figure {figure_number}: {caption_user}" if caption_user else f"Figure {figure_number}"
-        else:
-            caption_final = caption_user
-        caption_h = 12 if caption_final else 0
-
-        # --- Geometry ---
-        left_x = left_margin_mm * mm
-        right_x = page_w - right_margin_mm * mm
-        usable_w = right_x - left_x
-
-        grid_w = usable_w * width_pct_local
-        grid_x = left_x + (usable_w - grid_w) / 2
-
-        gap = 8
-
-        w_a = (grid_w - gap) * (1/3)
-        w_b = (grid_w - gap) * (2/3)
+                # the layout already placed its caption and number; keep the box visible
+                log.warning("Cannot draw figure image %s", box.src, exc_info=True)
+                _draw_placeholder(c, box.x, box.y, box.width, box.height)
+                continue
+            with span("image.draw", len(encoded.data)):
+                c.drawImage(_encoded_to_reader(encoded), box.x, box.y, width=box.width, height=box.height)
+        elif kind is BannerBox:
+            if placeholders:
+                # flat ombre colour instead of the composed photo
+                _draw_placeholder(c, box.x, box.y, box.width, box.height, context["ombre_left"])
+                continue
+            reader = _banner_reader(context, box.width, box.height, image_policy)
+            with span("banner.draw"):
+                c.drawImage(reader, box.x, box.y, width=box.width, height=box.height)
+        elif kind is SvgBox:
+            _draw_svg(c, box.path, box.x, box.y, box.height)
+        elif kind is StageMark and on_stage is not None:
+            on_stage(box.label)
+
+
+_PAGE_KEY_VERSION = 2
+
+
+def _page_key(page, context, image_policy, placeholders=False):
+    """Fingerprint of everything that goes into painting `page`."""
+    parts = [_PAGE_KEY_VERSION, page, image_policy.cache_token(), placeholders]
+    for box in page.boxes:
+        kind = type(box)
+        if placeholders and kind in (ImageBox, BannerBox):
+            continue
+        if kind is ImageBox:
+            parts.append(source_digest(box.src))
+        elif kind is BannerBox:
+            parts.append(_banner_key(context, box.width, box.height, image_policy))
+        elif kind is SvgBox:
+            parts.append(file_digest(box.path))
+    if page.chrome:
+        logo = context["logo_inner"]
+        parts += [
+            logo, file_digest(logo) if os.path.exists(logo) else None,
+            context["sample"], context["report_no"], sorted(context["margins"].items()),
+            context["ombre_left"], context["ombre_right"], float(context["ombre_alpha"]),
+        ]
+    return digest_key(*parts)
+
+
+# ---------------- Title banner ----------------
+
+# Composed title banners (encoded PNG), content-addressed by source photo + styling.
+_BANNER_CACHE = DiskCache(BANNER_CACHE_DIR, max_bytes=BANNER_CACHE_MAX_BYTES, suffix=".img")
+_BANNER_CACHE_VERSION = 3
+
+
+def _banner_key(context, banner_w, banner_h, image_policy):
+    return digest_key(
+        "banner", _BANNER_CACHE_VERSION, image_policy.cache_token(),
+        file_digest(context["lab_image"]),
+        banner_w, banner_h,
+        int(context["fade_alpha_255"]),
+        context["ombre_left"], context["ombre_right"], float(context["ombre_alpha"]),
+    )
 
-        h_top = w_a  # square
-        h_bottom = h_top #* 0.6
 
-        needed = h_top + gap + h_bottom + 8 + caption_h + 16
-        bottom_limit = margins["bottom_mm"] * mm + min_bottom_gap_pt
+def _banner_reader(context, banner_w, banner_h, image_policy):
+    """
+    ImageReader for the title-page banner. The composed, encoded banner is
+    kept in a disk cache, so on a warm run this is a single file read.
+    """
+    key = _banner_key(context, banner_w, banner_h, image_policy)
+    data = _BANNER_CACHE.get(key)
+    if data is None:
+        # one header read for both the size and the format the policy decides on
+        with open_image(context["lab_image"]) as src:
+            source_size, source_format = src.size, src.format
+        with span("banner.compose") as s:
+            px_w, px_h = image_policy.pixel_size(source_size, banner_w, banner_h)
+            lab = load_image(context["lab_image"], px_w, px_h)
+            banner = compose_banner(
+                lab, px_w, px_h,
+                fade_alpha_255=context["fade_alpha_255"],
+                ombre_left=context["ombre_left"],
+                ombre_right=context["ombre_right"],
+                ombre_alpha=context["ombre_alpha"],
+                resample=image_policy.resample_filter,
+            )
+            s.add_bytes(px_w * px_h * 4)
+        # the composite is fully opaque, so the alpha channel carries nothing
+        data = image_policy.encode(banner.convert("RGB"), source_format=source_format).data
+        _BANNER_CACHE.put(key, data)
+    return ImageReader(io.BytesIO(data))
 
-        if start_y - needed < bottom_limit:
-            c.showPage()
-            start_y = on_new_page(c)
+def configure_banner_cache(directory=BANNER_CACHE_DIR, max_bytes=BANNER_CACHE_MAX_BYTES):
+    """Move the composed-banner disk cache (e.g. to a scratch directory for benchmarks)."""
+    global _BANNER_CACHE
+    _BANNER_CACHE = DiskCache(directory, max_bytes=max_bytes, suffix=".img")
 
-        # --- Load images ---
-        readers = []
-        for i in range(3):
-            p = items[i].get("path")
-            if not p or not os.path.exists(p):
-                return start_y, False
-            try:
-                pil = _load_image_flatten_white(p) if flatten_flag else Image.open(p).convert("RGB")
-                if i == 0:
-                    fitted = _cover_crop(pil, int(w_a), int(h_top))
-                elif i == 1:
-                    fitted = _cover_crop(pil, int(w_b), int(h_top))
-                else:
-                    fitted = _cover_crop(pil, int(grid_w), int(h_bottom))
-                readers.append(_pil_to_reader(fitted))
-            except Exception:
-                return start_y, False
-
-        # --- Draw top row ---
-        x_a = grid_x
-        x_b = grid_x + w_a + gap
-        y_top = start_y
-
-        c.drawImage(readers[0], x_a, y_top - h_top, width=w_a, height=h_top)
-        c.drawImage(readers[1], x_b, y_top - h_top, width=w_b, height=h_top)
-
-        _draw_overlay_letter(c, "a", x_a + 6, y_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-        _draw_overlay_letter(c, "b", x_b + 6, y_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-
-        # --- Draw bottom image ---
-        y_bottom_top = y_top - h_top - gap
-        c.drawImage(readers[2], grid_x, y_bottom_top - h_bottom,
-                    width=grid_w, height=h_bottom)
-
-        _draw_overlay_letter(c, "c", grid_x + 6, y_bottom_top - 6,
-                             font_size=10,
-                             color="white" if overlay_color == "white" else "black")
-
-        y_after = y_bottom_top - h_bottom - 12
-
-        # --- Caption ---
-        if caption_final:
-            c.setFillColor(colors.HexColor("#111827"))
-            caption_font = "Helvetica-Oblique"
-            caption_size = 10
-            line_spacing = 12
-
-            lines = _wrap_text(c, caption_final, caption_font, caption_size, usable_w)
-            c.setFont(caption_font, caption_size)
-
-            current_y = y_after - line_spacing
-            if len(lines) == 1:
-                text_w = c.stringWidth(lines[0], caption_font, caption_size)
-                c.drawString(left_x + (usable_w - text_w) / 2, current_y, lines[0])
-                current_y -= line_spacing
-            else:
-                for line in lines:
-                    c.drawString(left_x, current_y, line)
-                    current_y -= line_spacing
-
-            y_after = current_y - 35
-
-        return y_after, True
-
-    # ------------------------------------------------------------
-    # FUTURE TEMPLATES (placeholders – do nothing yet)
-    # ------------------------------------------------------------
-    # if layout == "template2":
-    #     # Two side-by-side images (a, b)
-    #     return start_y
-    #
-    # if layout == "template3":
-    #     # Tall-left (a tall image + two stacked)
-    #     return start_y
-    #
-    # if layout == "template4":
-    #     # Tall-right (mirror)
-    #     return start_y
-    #
-    # if layout == "template5":
-    #     # Quad 2x2 (a, b, c, d)
-    #     return start_y
-    #
-    # if layout == "template6":
-    #     # Big-top + two bottom
-    #     return start_y
-
-    # Unknown layout name
-    return start_y
-
-
-def render_sections_split_simple(
-    c,
-    sections,
-    start_y,
-    page_w,
-    page_h,
-    margins,
-    on_new_page,
-    left_margin_mm=16,
-    right_margin_mm=16,
-    line_spacing=14,
-    min_bottom_gap_pt=20
-):
+def banner_cache_stats():
+    return _BANNER_CACHE.stats()
 
-    y = start_y
-    bottom_limit = margins["bottom_mm"] * mm + min_bottom_gap_pt
-
-    title_font = "Helvetica-Bold"
-    title_font_size = 14
-    body_font = "Helvetica"
-    body_font_size = 11
-    title_to_rule_gap = 8
-    rule_height_pt = 0.3
-    rule_to_items_gap = 16
-    tail_gap = 24
-
-    # Global figure counter (increment only if an image actually draws)
-    fig_counter = 0
-
-    for idx, sec in enumerate(sections, start=1):
-        title = sec.get("title", f"Section {idx}")
-        items = sec.get("items", [])
-        left_x = left_margin_mm * mm
-        right_x = page_w - right_margin_mm * mm
-        rule_width = int(right_x - left_x)
-
-        # Ensure space for header + one item; otherwise page-break first
-        header_h = title_font_size + title_to_rule_gap + rule_height_pt + rule_to_items_gap
-        if y - (header_h + line_spacing) < bottom_limit:
-            c.showPage()
-            y = on_new_page(c)
-
-        # Title
-        c.setFillColor(colors.HexColor("#00afee"))
-        c.setFillColor(colors.HexColor("#00afee"))
-        c.setFont(title_font, title_font_size)
-        c.drawString(left_x, y, f"{idx}. {title}")
-
-        # Rule
-        rule_y = y - title_to_rule_gap
-        c.setFillColor(colors.HexColor("#00afee"))
-        c.rect(left_x, rule_y, rule_width, rule_height_pt, stroke=0, fill=1)
-
-        # Items start position
-        y = rule_y - rule_to_items_gap
-
-        # Body font setup
-        c.setFillColor(colors.HexColor("#111827"))
-        c.setFont(body_font, body_font_size)
-
-        # Draw items (split across pages as needed)
-        for label, value in items:
-            if y - line_spacing < bottom_limit:
-                c.showPage()
-                y = on_new_page(c)
-                c.setFillColor(colors.HexColor("#111827"))
-                c.setFont(body_font, body_font_size)
-
-            wrapped_label = _wrap_text(c, f"{label}:", "Helvetica-Bold", body_font_size, right_x - left_x)
-            label_width = c.stringWidth(wrapped_label[0], "Helvetica-Bold", body_font_size) + 4
-            available_width = (right_x - left_x) - (2 * mm + label_width)
-            wrapped_value = _wrap_text(c, str(value), body_font, body_font_size, available_width)
-            for i in range(max(len(wrapped_label), len(wrapped_value))):
-                if i < len(wrapped_label):
-                    c.setFont("Helvetica-Bold", body_font_size)
-                    c.drawString(left_x + 2 * mm, y, wrapped_label[i])
-                if i < len(wrapped_value):
-                    x_val = left_x + 2 * mm + c.stringWidth(wrapped_label[0], "Helvetica-Bold", body_font_size) + 4
-                    c.setFont(body_font, body_font_size)
-                    c.drawString(x_val, y, wrapped_value[i])
-                y -= line_spacing
-
-
-        # Tail gap after items
-        y -= tail_gap
-
-        # Optional image template (global figure numbering)
-        images_spec = sec.get("images")
-        if images_spec:
-            prev_y = y
-            y, drawn = _draw_image_template(
-                c=c,
-                images_spec=images_spec,
-                start_y=y,
-                page_w=page_w,
-                page_h=page_h,
-                margins=margins,
-                on_new_page=on_new_page,
-                left_margin_mm=left_margin_mm,
-                right_margin_mm=right_margin_mm,
-                min_bottom_gap_pt=min_bottom_gap_pt,
-                figure_number=fig_counter + 1  # pass next figure number
-            )
-            if drawn:
-                fig_counter += 1
-
-        # Optional notes AFTER images
-        notes_text = sec.get("notes")
-        if notes_text:
-            left_x = left_margin_mm * mm
-            right_x = page_w - right_margin_mm * mm
-            usable_w = right_x - left_x
-            bottom_limit = margins["bottom_mm"] * mm + min_bottom_gap_pt
-
-            note_label_font = "Helvetica-Bold"
-            note_label_size = body_font_size
-            note_text_font = "Helvetica-Oblique"
-            note_text_size = body_font_size
-
-            prefix = "Notes:"
-            prefix_w = c.stringWidth(prefix, note_label_font, note_label_size) + 6
-            max_line_w = usable_w - prefix_w
-
-            # Wrap note text (italic part)
-            c.setFont(note_text_font, note_text_size)
-            note_lines = _wrap_text(c, notes_text, note_text_font, note_text_size, max_line_w)
-
-            needed_h = len(note_lines) * line_spacing + 4
-            if y - needed_h < bottom_limit:
-                c.showPage()
-                y = on_new_page(c)
-                c.setFillColor(colors.HexColor("#111827"))
-
-            # First line with prefix
-            c.setFillColor(colors.HexColor("#111827"))
-            c.setFont(note_label_font, note_label_size)
-            c.drawString(left_x + 2 * mm, y, prefix)
-            c.setFont(note_text_font, note_text_size)
-            c.drawString(left_x + 2 * mm + prefix_w, y, note_lines[0])
-            y -= line_spacing
-
-            # Remaining lines (italic only)
-            for extra in note_lines[1:]:
-                if y - line_spacing < bottom_limit:
-                    c.showPage()
-                    y = on_new_page(c)
-                    c.setFillColor(colors.HexColor("#111827"))
-                    c.setFont(note_text_font, note_text_size)
-                c.drawString(left_x + 2 * mm + prefix_w, y, extra)
-                y -= line_spacing
-
-            y -= 12  # small gap after notes
-
-    return y
 # ---------------- callable functions ----------------
 
-def generate_report(context: dict, output_path: str = "report.pdf"):
+def generate_report(context: dict, output_path="report.pdf", image_policy=None, progress=None,
+                    page_store=None, quality="final", placeholders=False, profile=None):
     """
     Expected context keys (keep your existing names):
       lab_image (str)           # photo
@@ -720,248 +369,112 @@ def generate_report(context: dict, output_path: str = "report.pdf"):
       report_no (str)
       margins: {left_mm,right_mm,top_mm,bottom_mm}
       copyright (optional str)  # if omitted, nothing is drawn at bottom of title page
+      image_encoding (optional) # "auto" (default) | "jpeg" | "png"
+      jpeg_quality (optional)   # 1..95, default 85
+      raster_dpi (optional)     # figure/banner resolution, default 72 (1 px per pt)
+      prefetch_workers (optional) # figure preprocessing threads; 0 = serial, default auto
+    output_path: file path, a writable binary stream (e.g. io.BytesIO), or None.
+      For a stream or None the PDF is rendered in memory and its bytes are
+      returned (and written to the stream); for a path it is saved and None is returned.
+    image_policy: optional ImagePolicy; pass one in to read its .stats afterwards.
+    progress: optional callback progress(stage: str, done: int, total: int), called
+      after the title page, each section, each figure and the final save.
+    page_store: optional PageStore kept between renders (e.g. one per editing
+      session). Pages whose inputs did not change are copied from it instead
+      of being painted again; the PDF is byte-for-byte the same either way.
+    quality: "final" (default) or "draft". A draft has exactly the same
+      layout, but its images are low-dpi JPEGs resized with a cheap filter
+      (ImagePolicy.draft); an explicit image_policy takes precedence.
+    placeholders: draw image boxes as grey placeholders and the title banner
+      as a flat colour, without decoding anything (for drafts).
+    profile: optional pdf.profiling.Profile; every stage of this render
+      (layout, text wrapping, image decode/resize/encode, banner, SVG, page
+      paint/replay, save) is recorded into it as a timed span.
     """
-    PAGE_W, PAGE_H = A4
-    c = canvas.Canvas(output_path, pagesize=A4)
-
-    # --- Banner full width over page
-    banner_h = int(PAGE_H * context["banner_ratio"])
-    banner_w = int(PAGE_W)
-    banner_y = PAGE_H - banner_h
-
-    lab = Image.open(context["lab_image"]).convert("RGB")
-    banner = _cover_crop(lab, banner_w, banner_h).convert("RGBA")
-    
-    fade_layer = Image.new("RGBA", banner.size, (255, 255, 255, int(context["fade_alpha_255"])))
-    banner = Image.alpha_composite(banner, fade_layer)
-    gradient = _make_gradient(
-        banner_w, banner_h, context["ombre_left"], context["ombre_right"], float(context["ombre_alpha"])
-    )
-    banner = Image.alpha_composite(banner, gradient)
-    c.drawImage(_pil_to_reader(banner), 0, banner_y, width=banner_w, height=banner_h)
-
-    # --- Title-page SVG logo (white)
-    if os.path.exists(context["logo_title"]):
-        logo_target_h = 48  
-        logo_x = 16 * mm
-        logo_y = banner_y + banner_h - 30 * mm  # baseline
-        _draw_svg(c, context["logo_title"], logo_x, logo_y, logo_target_h)
-
-    # --- Title ( "{title} {sample}")
-    font_name, font_size = "Helvetica-Bold", 28
-    c.setFillColor(colors.white)
-    title_txt = f"{context['title']}"
-    max_width = PAGE_W - 80 * mm
-    approx_char_w = font_size * 0.45
-    wrap_width = max(1, int(max_width / approx_char_w))
-    lines = wrap(title_txt, width=wrap_width)
-
-    start_y = banner_y + 35*mm + (len(lines) - 1) * 6
-    c.setFont(font_name, font_size)
-    for i, line in enumerate(lines):
-        line_w = c.stringWidth(line, font_name, font_size)
-        c.drawString((PAGE_W - line_w)/2, start_y - i*font_size*1.1, line)
-
-    # --- Subtitle (notebook: "According to {standard}")
-    c.setFillColor(colors.white)
-    c.setFont("Helvetica", 14)
-    subtitle = f"According to {context['standard']}"
-    sub_w = c.stringWidth(subtitle, "Helvetica-Bold", 14)
-    c.drawString((PAGE_W - sub_w)/2, banner_y + 16*mm, subtitle)
-
-    c.setFillColor(colors.white)
-    c.setFont("Helvetica", 14)
-    subtitle2 = f"No. {context['report_no']}"
-    sub2_w = c.stringWidth(subtitle2, "Helvetica-Bold", 14)
-    c.drawString((PAGE_W - sub2_w)/2, banner_y + 8*mm, subtitle2)
-
-
-    page_bottom = context["margins"]["bottom_mm"] * mm
-    #y_pos = page_bottom + 90*mm
-    current_y = PAGE_H - page_bottom - 90 * mm
-    # --- Info blocks (notebook look)
-    block_x = 16 * mm
-    current_y = banner_y - 25 * mm
-    #current_y = banner_y - 20 * mm
-    #current_y=y_pos
-    line_h = 18
-    #current_y = 0
-
-
-    def _measure_block_height(items, line_h=18, title_gap_mm=8, tail_gap_mm=14):
-        lines = 0
-        for _, value in items:
-            if isinstance(value, (list, tuple)):
-                lines += max(1, len(value))
-            else:
-                lines += max(1, len(_wrap_text(c, str(value), "DejaVu", 12, max_width)))
-
-        body_h = lines * line_h
-        title_gap = title_gap_mm * mm
-        tail_gap = tail_gap_mm * mm
-        return body_h + title_gap + tail_gap
-
-
-    def _block(title_txt, items, max_width):
-        nonlocal current_y
-
-        c.setFont("Helvetica-Bold", 14)
-        c.setFillColor(colors.HexColor("#00afee"))
-        c.drawString(block_x, current_y - 2, title_txt)
-
-        y = current_y - 8 * mm
-        line_h = 18
-
-        for label, value in items:
-            c.setFont("Helvetica-Bold", 12)
-            c.setFillColor(colors.HexColor("#111827"))
-
-            label_text = f"{label}:"
-            label_x = block_x + 2 * mm
-            label_w = c.stringWidth(label_text, "Helvetica-Bold", 12) + 4
-            value_x = label_x + label_w
-
-            if isinstance(value, (list, tuple)):
-                # draw label once
-                if value:
-                    c.drawString(label_x, y, label_text)
-                    c.setFont("DejaVu", 12)
-                    c.drawString(value_x, y, str(value[0]))
-                    y -= line_h
-
-                    for v in value[1:]:
-                        c.drawString(value_x, y, str(v))
-                        y -= line_h
-                else:
-                    c.drawString(label_x, y, label_text)
-                    y -= line_h
-            else:
-                c.setFont("Helvetica-Bold", 12)
-                c.drawString(label_x, y, label_text)
-                wrapped_value = _wrap_text(c, str(value), "DejaVu", 12, max_width)
-                c.setFont("DejaVu", 12)
-                for i, line in enumerate(wrapped_value):
-                    if i == 0:
-                        c.drawString(value_x, y, line)
-                    else:
-                        y -= line_h
-                        c.drawString(label_x, y, line)
-            
-                y -= line_h
-
-        current_y = y - 14 * mm   
-
-
-    # page_bottom = context["margins"]["bottom_mm"] * mm
-    # bottom_padding = 25 * mm
-
-    hilase_items = [
-        ("Prepared by", context["prepared_by"]),
-        ("Approved by", context["approved_by"]),
-        ("Institute", context["institute"]),
-        ("Address", context["inst_address"]),
-    ]
-
-    customer_items = [
-        ("Name", context["customer"]),
-        ("Sample ID", context["sample"]),
-        ("Address", context["cust_address"]),
-        ("Contact", context["cust_contact"]),
+    if quality not in QUALITY_MODES:
+        raise ValueError(f"Unknown quality: {quality!r} (expected one of {QUALITY_MODES})")
+    if image_policy is None:
+        image_policy = ImagePolicy.draft() if quality == "draft" else ImagePolicy.from_context(context)
+    with profile.activate() if profile is not None else nullcontext():
+        with span("render"):
+            return _render(context, output_path, image_policy, progress, page_store, placeholders)
+
+
+def _render(context, output_path, image_policy, progress, page_store, placeholders):
+    with span("fonts"):
+        ensure_fonts()
+    to_memory = output_path is None or hasattr(output_path, "write")
+    c = canvas.Canvas(io.BytesIO() if to_memory else output_path, pagesize=A4)
+
+    # layout first: it is cheap and tells exactly which image boxes will be drawn
+    with span("layout"):
+        layout = layout_document(context, _TILE_CACHE.image_size)
+
+    keys = [None] * layout.page_count
+    if page_store is not None:
+        with span("page.keys"):
+            keys = [_page_key(page, context, image_policy, placeholders) for page in layout.pages]
+
+    # Decode/fit/encode every figure on a thread pool while the title page is drawn;
+    # the paint pass then only picks up finished buffers.
+    tiles = _TILE_CACHE
+    image_boxes = [
+        box for page, key in zip(layout.pages, keys) if key is None or key not in page_store
+        for box in page.boxes if isinstance(box, ImageBox)
     ]
-    FINAL_BASELINE_Y = banner_y - 180 * mm
-
-    hilase_h = _measure_block_height(hilase_items)
-    customer_h = _measure_block_height(customer_items)
-
-    current_y = FINAL_BASELINE_Y + hilase_h + customer_h + 10 * mm
-
-    _block("HiLASE", hilase_items, max_width)
-    _block("Customer", customer_items, max_width)
-
-
-
-
-
-    # --- Optional copyright centered at bottom of title page
-    if "copyright" in context and context["copyright"]:
-        c.setFont("Helvetica", 9)
-        c.setFillColor(colors.HexColor("#667085"))
-        c.drawCentredString(PAGE_W/2, 12*mm, context["copyright"])
-
-    # Next page
-    c.showPage()
-    ##----------------------------------------------------------------------
-    ## END OF TITLE PAGE
-    ## ----------------------------------------------------------------------
-
-
-    #------------------------------------------------------------------------
-    ## SECOND PAGE
-    #------------------------------------------------------------------------
+    workers = context.get("prefetch_workers")
+    if image_boxes and workers != 0 and not placeholders:
+        tiles = FigurePrefetcher(_TILE_CACHE, image_policy, max_workers=workers)
+        for box in image_boxes:
+            tiles.submit(box.src, box.width, box.height, flatten_white=box.flatten_white, override=box.encoding)
+
+    # title page + one step per section and per figure + save
+    total_steps = 2 + len(context.get("sections", [])) + len(layout.figures)
+    done_steps = 0
+
+    def _on_stage(stage):
+        nonlocal done_steps
+        done_steps = min(done_steps + 1, total_steps - 1)
+        if progress is not None:
+            progress(stage, done_steps, total_steps)
+
+    try:
+        for page, key in zip(layout.pages, keys):
+            replayed = False
+            if key is not None:
+                with span("page.reuse"):
+                    replayed = page_store.replay(c, key)
+            if replayed:
+                for box in page.boxes:
+                    if isinstance(box, StageMark):
+                        _on_stage(box.label)
+                continue
+            with span("page.paint"):
+                with page_store.recording(c, key) if key is not None else nullcontext():
+                    _paint_page(c, page, context, image_policy, tiles, _on_stage, placeholders)
+                c.showPage()
+    finally:
+        if tiles is not _TILE_CACHE:
+            tiles.close()
+    pdf_bytes = None
+    with span("save") as s:
+        if to_memory:
+            pdf_bytes = c.getpdfdata()
+            if output_path is not None:
+                output_path.write(pdf_bytes)
+            s.add_bytes(len(pdf_bytes))
+        else:
+            c.save()
+            s.add_bytes(os.path.getsize(output_path))
+    if progress is not None:
+        progress("Saved", total_steps, total_steps)
+    return pdf_bytes
 
-    # --- Second page header/footer using SVG
-    m = context["margins"]
-    header_h_pt = 45
-    logo_h_pt = 25
 
-    _draw_header_footer_svg_ombre(
-    c, PAGE_W, PAGE_H,
-    logo_path=context["logo_inner"],
-    sample_name=context["sample"],
-    report_no=context["report_no"],
-    left_margin=m["left_mm"] * mm,
-    right_margin=m["right_mm"] * mm,
-    top_margin=m["top_mm"] * mm,
-    bottom_margin=m["bottom_mm"] * mm,
-    ombre_left=context["ombre_left"],
-    ombre_right=context["ombre_right"],
-    ombre_alpha=context["ombre_alpha"],  
-    logo_height_pt=logo_h_pt,                   
-    header_height_pt=header_h_pt             
-)
-    content_top_y = PAGE_H - m["top_mm"] * mm - header_h_pt - 6
-
-    def _on_new_page(ca):
-        _draw_header_footer_svg_ombre(
-            ca, PAGE_W, PAGE_H,
-            logo_path=context["logo_inner"],
-            sample_name=context["sample"],
-            report_no=context["report_no"],
-            left_margin=m["left_mm"] * mm,
-            right_margin=m["right_mm"] * mm,
-            top_margin=m["top_mm"] * mm,
-            bottom_margin=m["bottom_mm"] * mm,
-            ombre_left=context["ombre_left"],
-            ombre_right=context["ombre_right"],
-            ombre_alpha=context["ombre_alpha"],
-            logo_height_pt=logo_h_pt,
-            header_height_pt=header_h_pt
-        )
-        return PAGE_H - m["top_mm"] * mm - header_h_pt - 6
-
-    sections = context.get("sections", [])
-    if sections:
-        render_sections_split_simple( 
-            c=c, 
-            sections=sections, 
-            start_y=content_top_y, 
-            page_w=PAGE_W, 
-            page_h=PAGE_H, 
-            margins=m, 
-            on_new_page=_on_new_page, 
-            left_margin_mm=m["left_mm"], 
-            right_margin_mm=m["right_mm"], 
-            line_spacing=14, 
-            min_bottom_gap_pt=20 )
-
-
-
-    # # Example placeholder section
-    # c.setFillColor(colors.HexColor("#1B8EAB"))
-    # c.setFont("Helvetica-Bold", 14)
-    # c.drawString(16*mm, PAGE_H - 16*mm - 16*mm, "1. Report Identification")
-    # c.setFillColor(colors.HexColor("#1D722D"))
-    # c.rect(16*mm, banner_y - 10*mm, 56, 2, stroke=0, fill=1)
-
-    c.showPage()
-    c.save()
+def dry_run_report(context: dict):
+    """
+    Lay the report out without producing a PDF: returns the DocumentLayout,
+    whose .page_count and .figures (number, page, bounding box) are what a
+    full render would produce. Only image headers are read.
+    """
+    return layout_document(context, _TILE_CACHE.image_size)
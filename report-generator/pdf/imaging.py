@@ -0,0 +1,321 @@
+# === Imports ===
+import io
+import math
+import threading
+from contextlib import contextmanager
+
+from PIL import Image, ImageFile
+
+from .profiling import span
+
+
+# Keep at least this much oversampling before the final LANCZOS pass, so the
+# cheap reductions never replace the real resampling filter.
+REDUCING_GAP = 2.0
+
+# Decoded source pixels held at once by all decodes in the process (figure
+# workers, concurrent sessions, the banner, previews). The budget counts
+# pixels, not bytes. Per budgeted pixel, the images in flight take up to
+# BYTES_PER_BUDGET_PIXEL bytes: Pillow stores RGB at 4 bytes per pixel, the
+# cover-crop copies the cropped region (another 4) before resizing it, and
+# the resized raster and codec buffers add the rest (about 10.3 bytes
+# measured for a 12 MP photo fitted at 300 dpi). Not covered: encoded tiles
+# (TILE_CACHE_MAX_BYTES), painting them into the PDF, the PDF itself and
+# the interpreter.
+DEFAULT_PIXEL_BUDGET = 64_000_000
+BYTES_PER_BUDGET_PIXEL = 11
+
+
+# ---------------- Compositing engine (whole-array ops) ----------------
+
+def hex_to_rgb(hex_color: str):
+    hex_color = hex_color.lstrip("#")
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+def cover_crop(img, target_w, target_h, resample=Image.LANCZOS):
+    """Center-crop `img` to the target aspect ratio and resize it to (target_w, target_h)."""
+    w, h = img.size
+    target_ratio = target_w / target_h
+    img_ratio = w / h
+    if img_ratio > target_ratio:
+        new_w = int(h * target_ratio)
+        x_off = (w - new_w) // 2
+        box = (x_off, 0, x_off + new_w, h)
+    else:
+        new_h = int(w / target_ratio)
+        y_off = (h - new_h) // 2
+        box = (0, y_off, w, y_off + new_h)
+    with span("image.resize", target_w * target_h * len(img.getbands())):
+        # crop() copies the region; skip it when it is the whole image
+        region = img if box == (0, 0, w, h) else img.crop(box)
+        return region.resize((target_w, target_h), resample)
+
+
+def make_gradient(w, h, color_left, color_right, alpha):
+    """
+    Horizontal left->right RGBA gradient with a constant alpha.
+    Only one row is computed; it is broadcast down the height, so the cost
+    is O(w) in Python-level work instead of O(w*h) putpixel calls.
+    """
+    import numpy as np  # only needed for banners/headers; keeps module import light
+
+    c1 = np.array(hex_to_rgb(color_left), dtype=np.float64)
+    c2 = np.array(hex_to_rgb(color_right), dtype=np.float64)
+    a = int(255 * alpha)
+
+    cols = max(w, 1)
+    if w > 1:
+        t = np.arange(cols, dtype=np.float64) / (w - 1)
+    else:
+        t = np.zeros(cols, dtype=np.float64)
+    t = t[:, None]
+
+    # same float expression as the old per-pixel loop, truncated like int()
+    row = np.empty((cols, 4), dtype=np.uint8)
+    row[:, :3] = (c1 * (1 - t) + c2 * t).astype(np.uint8)
+    row[:, 3] = a
+
+    pixels = np.broadcast_to(row[None, :w, :], (h, w, 4))
+    return Image.fromarray(np.ascontiguousarray(pixels), "RGBA")
+
+
+def compose_banner(photo, w, h, *, fade_alpha_255, ombre_left, ombre_right, ombre_alpha,
+                   resample=Image.LANCZOS):
+    """
+    Title-page banner: cover-cropped photo, flat white fade, then the ombre gradient.
+    Every step is a single C-level PIL/NumPy operation on the whole raster.
+    """
+    # layers are built inline, so each one is freed as soon as it is composited
+    banner = cover_crop(photo, w, h, resample).convert("RGBA")
+    banner = Image.alpha_composite(banner, Image.new("RGBA", banner.size, (255, 255, 255, int(fade_alpha_255))))
+    return Image.alpha_composite(banner, make_gradient(w, h, ombre_left, ombre_right, float(ombre_alpha)))
+
+
+# ---------------- Pixel budget ----------------
+
+class ImageTooLarge(ValueError):
+    """A source image that cannot be decoded within the pixel budget."""
+
+
+_TRIM = None
+# smaller decodes are not worth a trim (it walks every arena)
+TRIM_MIN_PIXELS = 1_000_000
+
+
+def _malloc_trim():
+    # glibc keeps memory freed by a thread in that thread's arena; without
+    # handing it back, RSS grows to (workers x largest image) whatever the budget
+    global _TRIM
+    if _TRIM is None:
+        try:
+            import ctypes
+            _TRIM = ctypes.CDLL("libc.so.6").malloc_trim
+        except (OSError, AttributeError):
+            _TRIM = False
+    if _TRIM:
+        _TRIM(0)
+
+
+class PixelBudget:
+    """
+    Caps the decoded pixels alive at once across threads: a decode first
+    reserves its pixel count and waits until it fits. `max_pixels=None`
+    means no limit. Memory follows at up to BYTES_PER_BUDGET_PIXEL bytes
+    per pixel; see DEFAULT_PIXEL_BUDGET for what is not counted.
+    """
+
+    def __init__(self, max_pixels=DEFAULT_PIXEL_BUDGET):
+        self.max_pixels = max_pixels
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self.downscaled = 0
+        self.rejected = 0
+
+    @contextmanager
+    def reserve(self, pixels):
+        if self.max_pixels is None:
+            yield
+            return
+        with self._cond:
+            if self._in_use + pixels > self.max_pixels:
+                self.waits += 1
+                self._cond.wait_for(lambda: self._in_use + pixels <= self.max_pixels)
+            self._in_use += pixels
+            self.peak = max(self.peak, self._in_use)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= pixels
+                self._cond.notify_all()
+            if pixels >= TRIM_MIN_PIXELS:
+                _malloc_trim()
+
+    def _count(self, attr):
+        with self._cond:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_pixels": self.max_pixels,
+                "in_use": self._in_use,
+                "peak": self.peak,
+                "waits": self.waits,
+                "downscaled": self.downscaled,
+                "rejected": self.rejected,
+            }
+
+
+_PIXEL_BUDGET = PixelBudget()
+
+
+def configure_pixel_budget(max_pixels=DEFAULT_PIXEL_BUDGET):
+    """Replace the process-wide decode budget; None removes the limit."""
+    global _PIXEL_BUDGET
+    _PIXEL_BUDGET = PixelBudget(max_pixels)
+
+
+def pixel_budget_stats():
+    return _PIXEL_BUDGET.stats()
+
+
+# ---------------- Reduced-resolution loading ----------------
+
+def open_image(src):
+    # paths, or raw encoded bytes (e.g. straight from an upload widget)
+    if isinstance(src, (bytes, bytearray)):
+        return Image.open(io.BytesIO(src))
+    return Image.open(src)
+
+
+def image_size(src):
+    """Pixel size of an image file; only the header is read."""
+    with open_image(src) as im:
+        return im.size
+
+
+def raster_size(source_size, box_w, box_h, dpi=72):
+    """
+    Pixel size for a box of box_w x box_h PDF points rendered at `dpi`.
+    Never asks for more pixels than the source's cover-crop region holds:
+    upscaling adds bytes but no detail, the PDF viewer can scale instead.
+    """
+    scale = dpi / 72
+    px_w, px_h = max(1, int(box_w * scale)), max(1, int(box_h * scale))
+    w, h = source_size
+    target_ratio = px_w / px_h
+    if w / h > target_ratio:
+        crop_w, crop_h = h * target_ratio, h
+    else:
+        crop_w, crop_h = w, w / target_ratio
+    if px_w > crop_w or px_h > crop_h:
+        px_w, px_h = max(1, int(crop_w)), max(1, int(crop_h))
+    return px_w, px_h
+
+
+def _cover_source_size(size, target_w, target_h):
+    # smallest source size whose cover-crop still yields target_w x target_h
+    w, h = size
+    s = max(target_w / w, target_h / h)
+    return max(1, math.ceil(w * s)), max(1, math.ceil(h * s))
+
+
+def _draft_scale(size, request):
+    # the DCT scale JpegImageFile.draft picks for `request`
+    scale = min(size[0] // max(1, request[0]), size[1] // max(1, request[1]))
+    return next((s for s in (8, 4, 2, 1) if scale >= s), 1)
+
+
+def _scaled_pixels(size, scale):
+    return math.ceil(size[0] / scale) * math.ceil(size[1] / scale)
+
+
+def _to_rgb(im, flatten_white):
+    # If there's an alpha channel (RGBA, LA, or palette with transparency), flatten onto white
+    if flatten_white and (im.mode in ("RGBA", "LA") or (im.mode == "P" and ("transparency" in im.info))):
+        im = im.convert("RGBA")
+        white_bg = Image.new("RGBA", im.size, (255, 255, 255, 255))
+        white_bg.alpha_composite(im)
+        return white_bg.convert("RGB")
+    if im.mode == "RGB":
+        # convert() would copy every pixel; the decoded image is used as is
+        im.load()
+        return im
+    return im.convert("RGB")
+
+
+@contextmanager
+def decoded(src, target_w=None, target_h=None, *, flatten_white=False):
+    """
+    `load_image` as a context manager: the decoded pixels stay reserved in
+    the pixel budget until the block exits, so a caller can fit and encode
+    the image before the next decode is let in.
+    """
+    budget = _PIXEL_BUDGET
+    with open_image(src) as im:
+        need = draft = None
+        scale = 1
+        if target_w and target_h:
+            need = _cover_source_size(im.size, int(target_w), int(target_h))
+            if im.format == "JPEG":
+                draft = (math.ceil(need[0] * REDUCING_GAP), math.ceil(need[1] * REDUCING_GAP))
+                scale = _draft_scale(im.size, draft)
+
+        pixels = _scaled_pixels(im.size, scale)
+        if budget.max_pixels is not None and pixels > budget.max_pixels:
+            if im.format == "JPEG":
+                while scale < 8 and pixels > budget.max_pixels:
+                    scale *= 2
+                    pixels = _scaled_pixels(im.size, scale)
+                draft = (im.width // scale, im.height // scale)
+            if pixels > budget.max_pixels:
+                budget._count("rejected")
+                raise ImageTooLarge(f"{im.width}x{im.height} {im.format} image needs {pixels:,} decoded "
+                                    f"pixels, over the budget of {budget.max_pixels:,}")
+            budget._count("downscaled")
+
+        with budget.reserve(pixels):
+            with span("image.decode") as s:
+                if draft is not None:
+                    im.draft("RGB", draft)
+                rgb = _to_rgb(im, flatten_white)
+                s.add_bytes(rgb.width * rgb.height * 3)
+            if rgb is not im:
+                im.close()
+            if need is not None:
+                factor = int(min(rgb.width / need[0], rgb.height / need[1]) / REDUCING_GAP)
+                if factor > 1:
+                    with span("image.reduce"):
+                        rgb = rgb.reduce(factor)
+                    im.close()
+            yield rgb
+
+
+def load_image(src, target_w=None, target_h=None, *, flatten_white=False):
+    """
+    Decode `src` to RGB, at no more resolution than a cover-crop to
+    (target_w, target_h) needs.
+    JPEGs are downscaled in the DCT domain with draft() while decoding; any
+    remaining excess is removed with Image.reduce() (box filter, C-level),
+    keeping REDUCING_GAP of headroom for the final LANCZOS resample.
+
+    The decode holds its pixels in the process-wide pixel budget until the
+    reduced image is ready. A JPEG bigger than the whole budget is decoded
+    at a coarser DCT scale instead; any other source that big raises
+    ImageTooLarge without being decoded. The file handle is closed before
+    returning.
+    """
+    with decoded(src, target_w, target_h, flatten_white=flatten_white) as rgb:
+        # an RGB source that needed no reduction is the file's own image, closed with the block
+        return rgb.copy() if isinstance(rgb, ImageFile.ImageFile) else rgb
+
+
+def fit_image(src, target_w, target_h, *, flatten_white=False, resample=Image.LANCZOS):
+    """load_image + cover_crop: the final raster for a target_w x target_h box."""
+    target_w, target_h = max(1, int(target_w)), max(1, int(target_h))
+    with decoded(src, target_w, target_h, flatten_white=flatten_white) as rgb:
+        return cover_crop(rgb, target_w, target_h, resample)
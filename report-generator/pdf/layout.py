@@ -0,0 +1,452 @@
+# === Imports ===
+import json
+import os
+from collections import namedtuple
+from textwrap import wrap
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+
+from .cache import LRUCache, digest_key
+from .textmetrics import string_width, wrap_text
+
+
+# inner-page header strip and logo (see generate_report._draw_header_footer_svg_ombre)
+INNER_HEADER_HEIGHT_PT = 45
+INNER_LOGO_HEIGHT_PT = 25
+
+TEXT_COLOR = "#111827"
+ACCENT_COLOR = "#00afee"
+MUTED_COLOR = "#667085"
+WHITE = "#FFFFFF"
+
+
+# ---------------- Layout tree ----------------
+# A laid-out report is an immutable tree: DocumentLayout -> Page -> boxes.
+# Coordinates are PDF points, origin bottom-left, exactly what the paint pass
+# hands to the canvas. Nothing here touches a canvas or decodes pixels.
+
+TextBox = namedtuple("TextBox", "x y text font size color")
+RuleBox = namedtuple("RuleBox", "x y width height color")
+# a figure image, encoded at paint time for its (width, height) box
+ImageBox = namedtuple("ImageBox", "src x y width height flatten_white encoding")
+BannerBox = namedtuple("BannerBox", "x y width height")
+SvgBox = namedtuple("SvgBox", "path x y height")
+# progress marker, reported once everything before it has been painted
+StageMark = namedtuple("StageMark", "label")
+
+# `chrome`: the page gets the inner-page header/footer
+Page = namedtuple("Page", "number chrome boxes")
+# `x, y, width, height`: bounding box of the figure's images on `page`
+FigurePlacement = namedtuple("FigurePlacement", "number page x y width height")
+
+
+class DocumentLayout(namedtuple("DocumentLayout", "pages figures")):
+    __slots__ = ()
+
+    @property
+    def page_count(self):
+        return len(self.pages)
+
+    def image_boxes(self):
+        return [b for page in self.pages for b in page.boxes if isinstance(b, ImageBox)]
+
+
+# ---------------- Title page ----------------
+
+def _info_block_lines(items, max_width):
+    """(label, value lines) per item of a title-page info block."""
+    rows = []
+    for label, value in items:
+        if isinstance(value, (list, tuple)):
+            rows.append((label, True, tuple(str(v) for v in value)))
+        else:
+            rows.append((label, False, tuple(wrap_text(str(value), "DejaVu", 12, max_width))))
+    return rows
+
+
+def _info_block_height(rows, line_h=18, title_gap_mm=8, tail_gap_mm=14):
+    lines = sum(max(1, len(values)) for _, _, values in rows)
+    return lines * line_h + title_gap_mm * mm + tail_gap_mm * mm
+
+
+def _info_block(boxes, title_txt, rows, x, top_y, line_h=18):
+    """Append an info block's boxes; returns the top of the next block."""
+    boxes.append(TextBox(x, top_y - 2, title_txt, "Helvetica-Bold", 14, ACCENT_COLOR))
+    y = top_y - 8 * mm
+    for label, is_list, values in rows:
+        label_text = f"{label}:"
+        label_x = x + 2 * mm
+        value_x = label_x + string_width(label_text, "Helvetica-Bold", 12) + 4
+        boxes.append(TextBox(label_x, y, label_text, "Helvetica-Bold", 12, TEXT_COLOR))
+        if is_list:
+            # one value per line, aligned after the label
+            for v in values:
+                boxes.append(TextBox(value_x, y, v, "DejaVu", 12, TEXT_COLOR))
+                y -= line_h
+            if not values:
+                y -= line_h
+        else:
+            # wrapped text continues under the label
+            for i, line in enumerate(values):
+                if i:
+                    y -= line_h
+                boxes.append(TextBox(value_x if i == 0 else label_x, y, line, "DejaVu", 12, TEXT_COLOR))
+            y -= line_h
+    return y - 14 * mm
+
+
+def layout_title_page(context, page_w, page_h):
+    """Boxes of the title page: banner, logo, title, HiLASE/customer blocks, copyright."""
+    boxes = []
+
+    banner_h = int(page_h * context["banner_ratio"])
+    banner_w = int(page_w)
+    banner_y = page_h - banner_h
+    boxes.append(BannerBox(0, banner_y, banner_w, banner_h))
+
+    if os.path.exists(context["logo_title"]):
+        boxes.append(SvgBox(context["logo_title"], 16 * mm, banner_y + banner_h - 30 * mm, 48))
+
+    # title, wrapped by an approximate character width
+    font_name, font_size = "Helvetica-Bold", 28
+    max_width = page_w - 80 * mm
+    wrap_width = max(1, int(max_width / (font_size * 0.45)))
+    lines = wrap(f"{context['title']}", width=wrap_width)
+    start_y = banner_y + 35 * mm + (len(lines) - 1) * 6
+    for i, line in enumerate(lines):
+        line_w = string_width(line, font_name, font_size)
+        boxes.append(TextBox((page_w - line_w) / 2, start_y - i * font_size * 1.1, line, font_name, font_size, WHITE))
+
+    # subtitles are centred by their bold width, as they always were
+    for text, dy in ((f"According to {context['standard']}", 16 * mm), (f"No. {context['report_no']}", 8 * mm)):
+        text_w = string_width(text, "Helvetica-Bold", 14)
+        boxes.append(TextBox((page_w - text_w) / 2, banner_y + dy, text, "Helvetica", 14, WHITE))
+
+    hilase_rows = _info_block_lines([
+        ("Prepared by", context["prepared_by"]),
+        ("Approved by", context["approved_by"]),
+        ("Institute", context["institute"]),
+        ("Address", context["inst_address"]),
+    ], max_width)
+    customer_rows = _info_block_lines([
+        ("Name", context["customer"]),
+        ("Sample ID", context["sample"]),
+        ("Address", context["cust_address"]),
+        ("Contact", context["cust_contact"]),
+    ], max_width)
+
+    # both blocks end on a fixed baseline
+    final_baseline_y = banner_y - 180 * mm
+    y = final_baseline_y + _info_block_height(hilase_rows) + _info_block_height(customer_rows) + 10 * mm
+    y = _info_block(boxes, "HiLASE", hilase_rows, 16 * mm, y)
+    _info_block(boxes, "Customer", customer_rows, 16 * mm, y)
+
+    if context.get("copyright"):
+        text_w = string_width(context["copyright"], "Helvetica", 9)
+        boxes.append(TextBox(page_w / 2 - text_w / 2, 12 * mm, context["copyright"], "Helvetica", 9, MUTED_COLOR))
+
+    boxes.append(StageMark("Title page"))
+    return boxes
+
+
+# ---------------- Sections: measure ----------------
+# Measuring wraps all text of a section; it depends only on the section's
+# content and the page geometry, so results are cached by content hash.
+
+MeasuredSection = namedtuple("MeasuredSection", "heading items figure notes")
+# label_lines, value_lines, value_dx (value column offset from the label)
+MeasuredItem = namedtuple("MeasuredItem", "label_lines value_lines value_dx")
+# caption_w: width of a single-line (centred) caption
+MeasuredFigure = namedtuple("MeasuredFigure", "caption_lines caption_w")
+# prefix_w: width reserved for "Notes:"
+MeasuredNotes = namedtuple("MeasuredNotes", "prefix_w lines")
+
+_LAYOUT_VERSION = 1
+_SECTION_CACHE = LRUCache(max_entries=256)
+
+
+def section_cache_stats():
+    return _SECTION_CACHE.stats()
+
+
+def _section_key(sec, idx, figure_number, geometry):
+    content = json.dumps(sec, sort_keys=True, default=str, ensure_ascii=False)
+    return digest_key("section", _LAYOUT_VERSION, content, idx, figure_number, geometry)
+
+
+def _figure_caption(images_spec, figure_number):
+    caption_user = images_spec.get("caption", "").strip()
+    if figure_number is not None:
+        return f"Figure {figure_number}: {caption_user}" if caption_user else f"Figure {figure_number}"
+    return caption_user
+
+
+def measure_section(sec, idx, figure_number, usable_w, body_font_size=11):
+    """Wrapped text of one section; `figure_number` is the number its figure would get."""
+    key = _section_key(sec, idx, figure_number, (round(usable_w, 4), body_font_size))
+    measured = _SECTION_CACHE.get(key)
+    if measured is not None:
+        return measured
+
+    items = []
+    for label, value in sec.get("items", []):
+        label_lines = wrap_text(f"{label}:", "Helvetica-Bold", body_font_size, usable_w)
+        label_w = string_width(label_lines[0], "Helvetica-Bold", body_font_size) + 4
+        available_w = usable_w - (2 * mm + label_w)
+        value_lines = wrap_text(str(value), "Helvetica", body_font_size, available_w)
+        items.append(MeasuredItem(tuple(label_lines), tuple(value_lines), label_w))
+
+    figure = None
+    images_spec = sec.get("images")
+    if images_spec:
+        caption = _figure_caption(images_spec, figure_number)
+        caption_lines = tuple(wrap_text(caption, "Helvetica-Oblique", 10, usable_w))
+        caption_w = string_width(caption_lines[0], "Helvetica-Oblique", 10) if len(caption_lines) == 1 else 0
+        figure = MeasuredFigure(caption_lines, caption_w)
+
+    notes = None
+    if sec.get("notes"):
+        prefix_w = string_width("Notes:", "Helvetica-Bold", body_font_size) + 6
+        lines = wrap_text(sec["notes"], "Helvetica-Oblique", body_font_size, usable_w - prefix_w)
+        notes = MeasuredNotes(prefix_w, tuple(lines))
+
+    measured = MeasuredSection(f"{idx}. {sec.get('title', f'Section {idx}')}", tuple(items), figure, notes)
+    _SECTION_CACHE.put(key, measured)
+    return measured
+
+
+# ---------------- Sections: flow ----------------
+
+def _path_ok(p):
+    return bool(p) and (isinstance(p, bytes) or os.path.exists(p))
+
+
+class _Flow:
+    """Places measured sections onto inner pages, breaking pages as needed."""
+
+    def __init__(self, page_w, page_h, margins, image_size, line_spacing=14, min_bottom_gap_pt=20,
+                 first_page_number=2):
+        self.page_w = page_w
+        self.left_x = margins["left_mm"] * mm
+        self.right_x = page_w - margins["right_mm"] * mm
+        self.usable_w = self.right_x - self.left_x
+        self.top_y = page_h - margins["top_mm"] * mm - INNER_HEADER_HEIGHT_PT - 6
+        self.bottom_limit = margins["bottom_mm"] * mm + min_bottom_gap_pt
+        self.line_spacing = line_spacing
+        self.image_size = image_size
+        self.pages = []
+        self.figures = []
+        self._boxes = []
+        self._number = first_page_number
+        self.y = self.top_y
+
+    def ensure(self, needed):
+        """Break the page unless `needed` points fit above the bottom limit."""
+        if self.y - needed < self.bottom_limit:
+            self.new_page()
+
+    def new_page(self):
+        self.pages.append(Page(self._number, True, tuple(self._boxes)))
+        self._number += 1
+        self._boxes = []
+        self.y = self.top_y
+
+    def finish(self):
+        self.pages.append(Page(self._number, True, tuple(self._boxes)))
+        return self.pages
+
+    def add(self, box):
+        self._boxes.append(box)
+
+    @property
+    def page_number(self):
+        return self._number
+
+    # --- items, notes ---
+
+    def section(self, measured, body_font_size=11):
+        ls = self.line_spacing
+        header_h = 14 + 8 + 0.3 + 16
+        self.ensure(header_h + ls)
+
+        self.add(TextBox(self.left_x, self.y, measured.heading, "Helvetica-Bold", 14, ACCENT_COLOR))
+        rule_y = self.y - 8
+        self.add(RuleBox(self.left_x, rule_y, int(self.usable_w), 0.3, ACCENT_COLOR))
+        self.y = rule_y - 16
+
+        # an item is kept whole once its first line fits
+        x_label = self.left_x + 2 * mm
+        for item in measured.items:
+            self.ensure(ls)
+            for i in range(max(len(item.label_lines), len(item.value_lines))):
+                if i < len(item.label_lines):
+                    self.add(TextBox(x_label, self.y, item.label_lines[i], "Helvetica-Bold", body_font_size, TEXT_COLOR))
+                if i < len(item.value_lines):
+                    self.add(TextBox(x_label + item.value_dx, self.y, item.value_lines[i], "Helvetica",
+                                     body_font_size, TEXT_COLOR))
+                self.y -= ls
+
+        self.y -= 24
+
+    def notes(self, notes, body_font_size=11):
+        ls = self.line_spacing
+        x = self.left_x + 2 * mm
+        self.ensure(len(notes.lines) * ls + 4)
+        self.add(TextBox(x, self.y, "Notes:", "Helvetica-Bold", body_font_size, TEXT_COLOR))
+        for i, line in enumerate(notes.lines):
+            if i:
+                self.ensure(ls)
+            self.add(TextBox(x + notes.prefix_w, self.y, line, "Helvetica-Oblique", body_font_size, TEXT_COLOR))
+            self.y -= ls
+        if not notes.lines:
+            self.y -= ls
+        self.y -= 12
+
+    # --- figures ---
+
+    def _caption(self, figure, y):
+        """Caption under a figure whose images end at `y`; returns the y after it."""
+        current_y = y - 12
+        for line in figure.caption_lines:
+            if len(figure.caption_lines) == 1:
+                x = self.left_x + (self.usable_w - figure.caption_w) / 2
+            else:
+                x = self.left_x
+            self.add(TextBox(x, current_y, line, "Helvetica-Oblique", 10, TEXT_COLOR))
+            current_y -= 12
+        return current_y - 35
+
+    def _letter(self, letter, x, y, overlay_color):
+        # bold letter anchored at its top-left corner inside the image
+        color = WHITE if overlay_color == "white" else TEXT_COLOR
+        self.add(TextBox(x, y - 10, letter, "Helvetica-Bold", 10, color))
+
+    def _image(self, path, x, y, w, h, spec):
+        self.add(ImageBox(path, x, y, w, h, spec.get("flatten_alpha_to_white", False), spec.get("encoding")))
+
+    def figure(self, spec, figure, number, width_pct=0.8):
+        """Lay out the figure `spec`; returns False (nothing placed) if its images are unusable."""
+        layout = spec.get("layout")
+        items = spec.get("items") or []
+        caption_h = 12 if figure.caption_lines else 0
+        overlay = spec.get("overlay_color", "white")
+
+        if layout == "template1":
+            if not items or not _path_ok(items[0].get("path")):
+                return False
+            path = items[0]["path"]
+            width_pct = max(0.1, min(width_pct, 1.0))
+            img_w = self.usable_w * width_pct
+            img_x = self.left_x + (self.usable_w - img_w) / 2
+
+            self.ensure(80 + caption_h + 16)
+            available_h = max(40, self.y - (self.bottom_limit + caption_h + 16))
+            try:
+                w0, h0 = self.image_size(path)
+            except Exception:
+                return False
+            img_h = h0 * img_w / w0
+            if img_h > available_h:
+                # shrink to the remaining page height
+                img_h = available_h
+                img_w = w0 * available_h / h0
+                img_x = self.left_x + (self.usable_w - img_w) / 2
+
+            self._image(path, img_x, self.y - img_h, img_w, img_h, spec)
+            self.figures.append(FigurePlacement(number, self.page_number, img_x, self.y - img_h, img_w, img_h))
+            self.y = self._caption(figure, self.y - img_h - 8)
+            return True
+
+        width_pct_local = max(0.1, min(spec.get("width_pct", width_pct), 1.0))
+        grid_w = self.usable_w * width_pct_local
+        grid_x = self.left_x + (self.usable_w - grid_w) / 2
+        gap = 8
+
+        if layout == "template2":
+            # 2x2 grid (a b / c d)
+            if len(items) < 4 or not all(_path_ok(it.get("path")) for it in items[:4]):
+                return False
+            cell = (grid_w - gap) / 2
+            self.ensure(cell + gap + cell + 8 + caption_h + 16)
+
+            x_a, x_b = grid_x, grid_x + cell + gap
+            y_top = self.y
+            y_row2 = y_top - cell - gap
+            self._image(items[0]["path"], x_a, y_top - cell, cell, cell, spec)
+            self._image(items[1]["path"], x_b, y_top - cell, cell, cell, spec)
+            self._letter("a", x_a + 6, y_top - 6, overlay)
+            self._letter("b", x_b + 6, y_top - 6, overlay)
+            self._image(items[2]["path"], x_a, y_row2 - cell, cell, cell, spec)
+            self._image(items[3]["path"], x_b, y_row2 - cell, cell, cell, spec)
+            self._letter("c", x_a + 6, y_row2 - 6, overlay)
+            self._letter("d", x_b + 6, y_row2 - 6, overlay)
+
+            self.figures.append(FigurePlacement(number, self.page_number, grid_x, y_row2 - cell, grid_w, 2 * cell + gap))
+            self.y = self._caption(figure, y_row2 - cell - 8)
+            return True
+
+        if layout == "template3":
+            # 1/3 + 2/3 top, full-width bottom (a | b / c)
+            if len(items) < 3:
+                return False
+            w_a = (grid_w - gap) * (1/3)
+            w_b = (grid_w - gap) * (2/3)
+            h_top = h_bottom = w_a
+            self.ensure(h_top + gap + h_bottom + 8 + caption_h + 16)
+            if not all(_path_ok(it.get("path")) for it in items[:3]):
+                return False
+
+            x_a, x_b = grid_x, grid_x + w_a + gap
+            y_top = self.y
+            y_bottom_top = y_top - h_top - gap
+            self._image(items[0]["path"], x_a, y_top - h_top, w_a, h_top, spec)
+            self._image(items[1]["path"], x_b, y_top - h_top, w_b, h_top, spec)
+            self._letter("a", x_a + 6, y_top - 6, overlay)
+            self._letter("b", x_b + 6, y_top - 6, overlay)
+            self._image(items[2]["path"], grid_x, y_bottom_top - h_bottom, grid_w, h_bottom, spec)
+            self._letter("c", grid_x + 6, y_bottom_top - 6, overlay)
+
+            self.figures.append(FigurePlacement(number, self.page_number, grid_x, y_bottom_top - h_bottom,
+                                                grid_w, h_top + gap + h_bottom))
+            self.y = self._caption(figure, y_bottom_top - h_bottom - 12)
+            return True
+
+        # unknown layout
+        return False
+
+
+def layout_sections(sections, page_w, page_h, margins, image_size, line_spacing=14, min_bottom_gap_pt=20):
+    """
+    Inner pages for `sections`: (pages, figure placements).
+    `image_size(src) -> (w, h)` is only used for template1 figures, whose
+    height follows the image's aspect ratio.
+    """
+    flow = _Flow(page_w, page_h, margins, image_size, line_spacing, min_bottom_gap_pt)
+    fig_counter = 0
+    for idx, sec in enumerate(sections, start=1):
+        measured = measure_section(sec, idx, fig_counter + 1, flow.usable_w)
+        flow.section(measured)
+
+        # figures are numbered globally, counting only those actually placed
+        if measured.figure is not None and flow.figure(sec["images"], measured.figure, fig_counter + 1):
+            fig_counter += 1
+            flow.add(StageMark(f"Figure {fig_counter}"))
+
+        if measured.notes is not None:
+            flow.notes(measured.notes)
+
+        flow.add(StageMark(f"Section {idx}: {sec.get('title', f'Section {idx}')}"))
+    return flow.finish(), tuple(flow.figures)
+
+
+def layout_document(context, image_size, pagesize=A4):
+    """
+    Full report layout: the title page followed by the inner pages.
+    Cheap enough for a dry run (no canvas, no pixel decoding), so page count
+    and figure positions can be known before anything is rendered.
+    """
+    page_w, page_h = pagesize
+    title = Page(1, False, tuple(layout_title_page(context, page_w, page_h)))
+    inner, figures = layout_sections(context.get("sections", []), page_w, page_h, context["margins"], image_size)
+    return DocumentLayout((title, *inner), figures)
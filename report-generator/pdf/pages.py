@@ -0,0 +1,223 @@
+# === Imports ===
+import copy
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+import reportlab
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfbase.ttfonts import TTFont
+
+from .cache import LRUCache
+
+
+# ---------------- Page reuse between renders ----------------
+# A rendered page is more than its content stream: painting it also registers
+# document objects (images, the header form, fonts, TrueType subset codes)
+# that get numbered in registration order. A record keeps the page's stream
+# plus a pristine copy of everything it registered, and the document state it
+# depended on; replaying it into a new canvas re-registers the same objects in
+# the same order, so the saved PDF is byte-for-byte what painting would give.
+
+_PageRecord = namedtuple("_PageRecord", [
+    "code", "forms", "has_images", "extgstate", "colors_used", "shading_used",
+    "font_mapping",        # doc.fontMapping at page start (internal font names)
+    "forms_existed",       # per used form/image: was it registered before the page?
+    "new_fonts",           # fontMapping entries added by the page, in order
+    "new_basic_fonts",     # BasicFonts resource entries added: (key, object name)
+    "new_objects",         # (name, counter offset, pristine object), in order
+    "counter_delta",
+    "new_delayed_fonts",   # TrueType fonts first used on the page
+    "ttf_before",          # fontName -> subset state at start, for TrueType fonts the page draws with
+    "ttf_after",           # fontName -> subset state at end, for those the page changed
+    "pdf_version",         # (at start, at end): soft masks etc. raise the document's version
+])
+
+_UNNAMED = re.compile(r"R\d+$")
+
+# Replay reaches into reportlab internals (canvas code and resource lists,
+# document object tables, TrueType subset state). Only versions checked
+# byte-for-byte against full renders (tests/test_pages.py) replay; with any
+# other version every page is painted.
+REPLAY_REPORTLAB_VERSIONS = ("5.0.1",)
+
+# one store lives per editing session and every record holds a copy of the
+# image XObjects its page registered, so the store is bounded by size as well
+PAGE_STORE_MAX_BYTES = 16 * 1024 * 1024
+
+
+def replay_supported():
+    return reportlab.Version in REPLAY_REPORTLAB_VERSIONS
+
+
+def _ttf_state(font, doc):
+    state = font.state.get(doc)
+    return None if state is None else copy.deepcopy(state.__dict__)
+
+
+def _restore_ttf_state(font, doc, snapshot):
+    state = TTFont.State.__new__(TTFont.State)
+    state.__dict__.update(copy.deepcopy(snapshot))
+    font.state[doc] = state
+
+
+def _object_bytes(obj):
+    # encoded stream of an image or form XObject; fonts and the like are a few attributes
+    for attr in ("streamContent", "stream"):
+        data = getattr(obj, attr, None)
+        if isinstance(data, (bytes, str)):
+            return len(data)
+    return 0
+
+
+def _record_bytes(rec):
+    return sum(map(len, rec.code)) + sum(_object_bytes(obj) for _, _, obj in rec.new_objects)
+
+
+def _stream_text(obj):
+    # content of a form XObject registered by the page (images are binary, skipped)
+    if isinstance(obj, pdfdoc.PDFFormXObject):
+        return getattr(obj, "stream", b"").decode("latin-1")
+    return ""
+
+
+class PageStore:
+    """
+    Rendered pages of previous reports, keyed by a fingerprint of each
+    page's inputs. Meant to live for one editing session: generate_report
+    replays every page whose fingerprint and document state still match and
+    paints only the rest. Bounded by page count and by the size of the
+    stored content and XObject streams (`max_bytes`).
+    """
+
+    def __init__(self, max_pages=64, max_bytes=PAGE_STORE_MAX_BYTES):
+        self._records = LRUCache(max_entries=max_pages, max_bytes=max_bytes, sizeof=_record_bytes)
+
+    def __contains__(self, key):
+        # a peek: counted as a hit or miss (and made recent) only by replay
+        return key in self._records
+
+    def clear(self):
+        self._records.clear()
+
+    def stats(self):
+        return self._records.stats()
+
+    # --- replay ---
+
+    def _applicable(self, doc, rec):
+        if dict(doc.fontMapping) != rec.font_mapping or doc._pdfVersion != rec.pdf_version[0]:
+            return False
+        if any(doc.hasForm(name) != existed for name, existed in zip(rec.forms, rec.forms_existed)):
+            return False
+        for font, snapshot in rec.ttf_before.items():
+            if _ttf_state(font, doc) != snapshot:
+                return False
+        return True
+
+    def replay(self, c, key):
+        """
+        Emit the stored page for `key` onto canvas `c` (ending it with
+        showPage); returns False, leaving `c` untouched, if there is no
+        usable record.
+        """
+        if not replay_supported():
+            return False
+        rec = self._records.get(key)
+        doc = c._doc
+        if rec is None or c._code or not self._applicable(doc, rec):
+            return False
+
+        start = doc.objectcounter
+        for name, offset, pristine in rec.new_objects:
+            obj = copy.deepcopy(pristine)
+            n = start + offset
+            doc.idToObjectNumberAndVersion[name] = (n, 0)
+            doc.numberToId[n] = name
+            doc.idToObject[name] = obj
+        doc.objectcounter = start + rec.counter_delta
+        doc.fontMapping.update(rec.new_fonts)
+        basic_fonts = doc.idToObject[pdfdoc.BasicFonts].dict
+        for k, name in rec.new_basic_fonts:
+            basic_fonts[k] = doc.idToObject[name]
+        doc._pdfVersion = rec.pdf_version[1]
+        doc.delayedFonts.extend(rec.new_delayed_fonts)
+        for font, snapshot in rec.ttf_after.items():
+            _restore_ttf_state(font, doc, snapshot)
+
+        c._code = list(rec.code)
+        c._formsinuse = list(rec.forms)
+        c._currentPageHasImages = rec.has_images
+        c._extgstate = copy.deepcopy(rec.extgstate)
+        c._colorsUsed = dict(rec.colors_used)
+        c._shadingUsed = dict(rec.shading_used)
+        c.showPage()
+        return True
+
+    # --- record ---
+
+    @contextmanager
+    def recording(self, c, key):
+        """
+        Record what is painted on `c` inside the block as the page for `key`.
+        The block must paint exactly one page and stop before showPage.
+        """
+        if not replay_supported():
+            yield
+            return
+        doc = c._doc
+        start = doc.objectcounter
+        ids_before = len(doc.idToObject)
+        existing = set(doc.idToObject)
+        fonts_before = dict(doc.fontMapping)
+        version_before = doc._pdfVersion
+        basic_before = set(doc.idToObject[pdfdoc.BasicFonts].dict)
+        delayed_before = list(doc.delayedFonts)
+        ttf_before = {font: _ttf_state(font, doc) for font in delayed_before}
+
+        yield
+
+        new_names = list(doc.idToObject)[ids_before:]
+        basic_fonts = doc.idToObject[pdfdoc.BasicFonts].dict
+        new_basic = [(k, getattr(v, "__InternalName__", None)) for k, v in basic_fonts.items() if k not in basic_before]
+        if any(_UNNAMED.match(name) for name in new_names) or any(name not in new_names for _, name in new_basic):
+            # unnamed objects are numbered by position; not safe to replay
+            return
+        new_objects = tuple(
+            (name, doc.idToObjectNumberAndVersion[name][0] - start, copy.deepcopy(doc.idToObject[name]))
+            for name in new_names
+        )
+        new_delayed = [f for f in doc.delayedFonts if f not in delayed_before]
+
+        # TrueType text is encoded with subset codes assigned in first-use
+        # order, so the page depends on a font's state if it draws with it
+        text = "\n".join(c._code) + "".join(_stream_text(obj) for _, _, obj in new_objects)
+        ttf_used = {}
+        ttf_after = {}
+        for font in doc.delayedFonts:
+            state = font.state.get(doc)
+            if font in new_delayed or (state is not None and f"/{state.internalName}+" in text):
+                ttf_used[font] = ttf_before.get(font)
+                after = _ttf_state(font, doc)
+                if after != ttf_used[font]:
+                    ttf_after[font] = after
+
+        forms = tuple(c._formsinuse)
+        self._records.put(key, _PageRecord(
+            code=tuple(c._code),
+            forms=forms,
+            has_images=c._currentPageHasImages,
+            extgstate=copy.deepcopy(c._extgstate),
+            colors_used=dict(c._colorsUsed),
+            shading_used=dict(c._shadingUsed),
+            font_mapping=fonts_before,
+            forms_existed=tuple(pdfdoc.xObjectName(name) in existing for name in forms),
+            new_fonts=tuple((k, v) for k, v in doc.fontMapping.items() if k not in fonts_before),
+            new_basic_fonts=tuple(new_basic),
+            new_objects=new_objects,
+            counter_delta=doc.objectcounter - start,
+            new_delayed_fonts=tuple(new_delayed),
+            ttf_before=ttf_used,
+            ttf_after=ttf_after,
+            pdf_version=(version_before, doc._pdfVersion),
+        ))
@@ -0,0 +1,66 @@
+# === Imports ===
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+
+# ---------------- Parallel figure preprocessing ----------------
+
+def default_workers():
+    return min(8, os.cpu_count() or 1)
+
+
+class FigurePrefetcher:
+    """
+    Decodes, fits and encodes figure images on a thread pool ahead of the
+    drawing pass (PIL releases the GIL for decode, resample and encode).
+    Exposes the same `fit_and_encode` / `image_size` surface as TileCache,
+    so the paint pass consumes ready results, or falls back to the cache
+    for anything that was not (or could not be) prefetched.
+    """
+
+    def __init__(self, tiles, policy, max_workers=None):
+        self._tiles = tiles
+        self._policy = policy
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or default_workers(),
+            thread_name_prefix="figure-prefetch",
+        )
+        self._futures = {}
+
+    @staticmethod
+    def _key(src, box_w, box_h, flatten_white, override):
+        return (src, round(float(box_w), 3), round(float(box_h), 3), bool(flatten_white), override)
+
+    def submit(self, src, box_w, box_h, *, flatten_white=False, override=None):
+        key = self._key(src, box_w, box_h, flatten_white, override)
+        if key not in self._futures:
+            # pool threads don't inherit context variables; a copy per job
+            # carries the active profile (pdf.profiling) over to the worker
+            self._futures[key] = self._pool.submit(
+                copy_context().run, self._tiles.fit_and_encode, src, box_w, box_h, self._policy,
+                flatten_white=flatten_white, override=override,
+            )
+
+    def fit_and_encode(self, src, box_w, box_h, policy, *, flatten_white=False, override=None):
+        future = None
+        if policy is self._policy:
+            future = self._futures.get(self._key(src, box_w, box_h, flatten_white, override))
+        if future is not None:
+            # re-raises a worker exception here, where the caller already handles it
+            return future.result()
+        return self._tiles.fit_and_encode(src, box_w, box_h, policy,
+                                          flatten_white=flatten_white, override=override)
+
+    def image_size(self, src):
+        return self._tiles.image_size(src)
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._futures.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
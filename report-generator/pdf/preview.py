@@ -0,0 +1,272 @@
+"""
+Low-resolution page previews, rasterized with PIL straight from the layout
+tree (pdf.layout) instead of going through a PDF. Page breaks, text, rules,
+figures and the banner land exactly where the paint pass puts them; text is
+set in DejaVu for every font and the SVG logos are left out.
+"""
+
+# === Imports ===
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+
+from .cache import LRUCache
+from .fonts import FONT_PATH
+from .imaging import compose_banner, fit_image, image_size, load_image, make_gradient
+from .layout import (
+    INNER_HEADER_HEIGHT_PT, MUTED_COLOR,
+    TextBox, RuleBox, ImageBox, BannerBox, layout_document,
+)
+from .textmetrics import string_width
+from .tiles import source_digest
+
+
+PREVIEW_DPI = 36
+PLACEHOLDER_FILL = "#E5E7EB"
+PLACEHOLDER_LINE = "#9CA3AF"
+
+# thumbnails of figures and banners at preview size, shared by all sessions
+_THUMBS = LRUCache(max_entries=256, max_bytes=32 * 1024 * 1024,
+                   sizeof=lambda im: im.width * im.height * len(im.getbands()))
+# rendered text lines (alpha masks): FreeType takes ~2 ms per line, a paste ~20 us,
+# and most lines are unchanged from one preview to the next
+_TEXT_MASKS = LRUCache(max_entries=8192, max_bytes=16 * 1024 * 1024,
+                       sizeof=lambda entry: entry[0].width * entry[0].height)
+
+
+class PreviewCancelled(Exception):
+    """Raised by render_preview when `should_stop()` turns true."""
+
+
+def thumb_cache_stats():
+    return {"thumbs": _THUMBS.stats(), "text": _TEXT_MASKS.stats()}
+
+
+# ---------------- Raster helpers ----------------
+
+@lru_cache(maxsize=64)
+def _font(px):
+    return ImageFont.truetype(str(FONT_PATH), px)
+
+
+def _draw_text(im, x, y, text, font_name, size, scale, color):
+    """Draw `text` with its baseline start at pixel (x, y), as wide as it is in the PDF."""
+    px = _px(size, scale)
+    key = (text, font_name, px)
+    entry = _TEXT_MASKS.get(key)
+    if entry is None:
+        font = _font(px)
+        x0, y0, x1, y1 = font.getbbox(text, anchor="ls")
+        mask = Image.new("L", (max(1, x1 - x0), max(1, y1 - y0)))
+        ImageDraw.Draw(mask).text((-x0, -y0), text, font=font, fill=255, anchor="ls")
+        # DejaVu stands in for every font; squeeze it to the real advance so
+        # columns and line ends sit where they do in the PDF
+        width = max(1, round(string_width(text, font_name, size) * scale))
+        if width < mask.width:
+            mask = mask.resize((width, mask.height), Image.BILINEAR)
+        entry = (mask, x0, y0)
+        _TEXT_MASKS.put(key, entry)
+    mask, x0, y0 = entry
+    im.paste(ImageColor.getrgb(color), (round(x) + x0, round(y) + y0), mask)
+
+
+def _px(v, scale):
+    return max(1, round(v * scale))
+
+
+def _cached(key, build):
+    im = _THUMBS.get(key)
+    if im is None:
+        im = build()
+        _THUMBS.put(key, im)
+    return im
+
+
+def _figure_thumb(box, w, h):
+    key = ("figure", source_digest(box.src), w, h, bool(box.flatten_white))
+    return _cached(key, lambda: fit_image(box.src, w, h, flatten_white=box.flatten_white))
+
+
+def _banner_thumb(context, w, h):
+    key = ("banner", source_digest(context["lab_image"]), w, h, int(context["fade_alpha_255"]),
+           context["ombre_left"], context["ombre_right"], float(context["ombre_alpha"]))
+
+    def build():
+        return compose_banner(
+            load_image(context["lab_image"], w, h), w, h,
+            fade_alpha_255=context["fade_alpha_255"],
+            ombre_left=context["ombre_left"],
+            ombre_right=context["ombre_right"],
+            ombre_alpha=context["ombre_alpha"],
+        ).convert("RGB")
+
+    return _cached(key, build)
+
+
+def _header_strip(context, w, h):
+    key = ("header", w, h, context["ombre_left"], context["ombre_right"], float(context["ombre_alpha"]))
+
+    def build():
+        strip = Image.new("RGBA", (w, h), "white")
+        strip.alpha_composite(make_gradient(w, h, context["ombre_left"], context["ombre_right"],
+                                            context["ombre_alpha"]))
+        return strip.convert("RGB")
+
+    return _cached(key, build)
+
+
+def _placeholder(draw, x0, y0, x1, y1):
+    draw.rectangle((x0, y0, x1, y1), fill=PLACEHOLDER_FILL, outline=PLACEHOLDER_LINE)
+    draw.line((x0, y0, x1, y1), fill=PLACEHOLDER_LINE)
+    draw.line((x0, y1, x1, y0), fill=PLACEHOLDER_LINE)
+
+
+# ---------------- Page raster ----------------
+
+def _draw_chrome(im, page, context, page_w, page_h, scale):
+    # mirrors generate_report._draw_header_footer_svg_ombre
+    m = context["margins"]
+    header_h = int(INNER_HEADER_HEIGHT_PT)
+    im.paste(_header_strip(context, _px(page_w, scale), _px(header_h, scale)), (0, 0))
+    right_x = page_w - m["right_mm"] * mm
+    header_y = page_h - header_h + (header_h - 10.5) / 2 + 1
+    footer_y = m["bottom_mm"] * mm - 6
+    header = f"LIDT Test – {context['sample']}"
+    page_no = f"Page {page.number}"
+    texts = [
+        (right_x - string_width(header, "Helvetica", 10.5), header_y, header, 10.5, "#FFFFFF"),
+        (m["left_mm"] * mm, footer_y, f"Report No: {context['report_no']}", 9, MUTED_COLOR),
+        (right_x - string_width(page_no, "Helvetica", 9), footer_y, page_no, 9, MUTED_COLOR),
+    ]
+    for x, y, text, size, color in texts:
+        _draw_text(im, x * scale, (page_h - y) * scale, text, "Helvetica", size, scale, color)
+
+
+def render_page(page, context, dpi=PREVIEW_DPI, pagesize=A4):
+    """RGB image of one laid-out page at `dpi`."""
+    page_w, page_h = pagesize
+    scale = dpi / 72.0
+    im = Image.new("RGB", (_px(page_w, scale), _px(page_h, scale)), "white")
+    draw = ImageDraw.Draw(im)
+    if page.chrome:
+        _draw_chrome(im, page, context, page_w, page_h, scale)
+
+    for box in page.boxes:
+        kind = type(box)
+        if kind is TextBox:
+            _draw_text(im, box.x * scale, (page_h - box.y) * scale, box.text, box.font, box.size, scale, box.color)
+        elif kind is RuleBox:
+            y1 = (page_h - box.y) * scale
+            draw.rectangle((box.x * scale, y1 - max(box.height * scale, 1),
+                            (box.x + box.width) * scale, y1), fill=box.color)
+        elif kind in (ImageBox, BannerBox):
+            w, h = _px(box.width, scale), _px(box.height, scale)
+            x0, y0 = round(box.x * scale), round((page_h - box.y - box.height) * scale)
+            try:
+                thumb = _figure_thumb(box, w, h) if kind is ImageBox else _banner_thumb(context, w, h)
+            except Exception:
+                # the PDF leaves a missing image out; the preview shows where it would go
+                _placeholder(draw, x0, y0, x0 + w - 1, y0 + h - 1)
+                continue
+            im.paste(thumb, (x0, y0))
+    return im
+
+
+def render_preview(context, dpi=PREVIEW_DPI, should_stop=None):
+    """
+    Thumbnails of every page of the report for a prepared context
+    (see pdf.context.prepare_for_render). `should_stop()` is polled between
+    pages; when it returns true, PreviewCancelled is raised.
+    """
+    layout = layout_document(context, image_size)
+    pages = []
+    for page in layout.pages:
+        if should_stop is not None and should_stop():
+            raise PreviewCancelled()
+        pages.append(render_page(page, context, dpi))
+    return pages
+
+
+# ---------------- Debounced background previews ----------------
+
+PreviewResult = namedtuple("PreviewResult", "key pages ms")
+
+
+class PreviewScheduler:
+    """
+    Live preview for one editing session. `request()` is cheap enough to call
+    on every rerun: a render starts only after `delay_s` without a newer
+    request, runs on the shared `executor`, and is abandoned at the next page
+    boundary as soon as a newer request arrives. `result` is the latest
+    finished preview.
+    """
+
+    def __init__(self, executor, delay_s=0.3, dpi=PREVIEW_DPI):
+        self._executor = executor
+        self.delay_s = delay_s
+        self.dpi = dpi
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._key = None
+        self._done_key = None
+        self._timer = None
+        self.result = None
+        self.error = None
+        self.cancelled = 0
+
+    @property
+    def pending(self):
+        """True while the latest request has no finished preview yet."""
+        return self._key != self._done_key
+
+    def request(self, context, key):
+        """Schedule a preview of `context` (a private snapshot) unless `key` is already shown or queued."""
+        with self._lock:
+            if key == self._key:
+                return False
+            self._key = key
+            self._generation += 1
+            generation = self._generation
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(
+                self.delay_s, self._executor.submit, args=(self._run, context, key, generation))
+            self._timer.daemon = True
+            self._timer.start()
+        return True
+
+    def _stale(self, generation):
+        return generation != self._generation
+
+    def _run(self, context, key, generation):
+        if self._stale(generation):
+            return
+        started = time.perf_counter()
+        try:
+            pages = render_preview(context, self.dpi, should_stop=lambda: self._stale(generation))
+        except PreviewCancelled:
+            with self._lock:
+                self.cancelled += 1
+            return
+        except Exception as e:
+            with self._lock:
+                if not self._stale(generation):
+                    self.error = f"{type(e).__name__}: {e}"
+                    self._done_key = key
+            return
+        with self._lock:
+            if not self._stale(generation):
+                self.result = PreviewResult(key, pages, (time.perf_counter() - started) * 1e3)
+                self.error = None
+                self._done_key = key
+
+    def close(self):
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
@@ -0,0 +1,245 @@
+"""
+Per-stage timing spans for report renders.
+
+    profile = Profile()
+    generate_report(ctx, "report.pdf", profile=profile)
+    print("\\n".join(profile.format_table()))
+    profile.write_chrome_trace("render.trace.json")    # chrome://tracing or ui.perfetto.dev
+
+    python -m pdf.profiling data/drafts/test_draft.json --trace render.trace.json
+
+Instrumented code calls `span(name)`, which records into the profile active
+in the current context (see Profile.activate) and costs a single ContextVar
+lookup when there is none. Spans nest per thread and carry wall time, the
+CPU time of their own thread and the number of bytes they processed.
+"""
+
+# === Imports ===
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+_ACTIVE = ContextVar("lidt_profile", default=None)
+
+# start_s is relative to the profile's creation; parent is None for the
+# outermost span of a thread
+Span = namedtuple("Span", "id parent name thread start_s wall_s cpu_s bytes")
+
+
+# ---------------- Spans ----------------
+
+class _OpenSpan:
+    """A span being timed; `add_bytes` before it closes."""
+
+    __slots__ = ("_profile", "_name", "_bytes", "_id", "_parent", "_start", "_cpu")
+
+    def __init__(self, profile, name, nbytes):
+        self._profile = profile
+        self._name = name
+        self._bytes = nbytes
+
+    def add_bytes(self, n):
+        self._bytes += n
+
+    def __enter__(self):
+        self._id, self._parent = self._profile._open()
+        self._cpu = time.thread_time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._start
+        cpu = time.thread_time() - self._cpu
+        self._profile._close(Span(self._id, self._parent, self._name, threading.get_ident(),
+                                  self._start - self._profile.origin, wall, cpu, self._bytes))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def add_bytes(self, n):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, nbytes=0):
+    """Time a stage in the active profile, if any: `with span("image.encode") as s: ...`."""
+    profile = _ACTIVE.get()
+    return _NO_SPAN if profile is None else profile.span(name, nbytes)
+
+
+def active_profile():
+    return _ACTIVE.get()
+
+
+# ---------------- Profile ----------------
+
+class Profile:
+    """
+    Finished spans of one or more renders. Thread-safe: figure workers
+    record into the same profile as the paint pass. `on_span(span)` is
+    called for every span as it closes, on the thread that ran it.
+    """
+
+    def __init__(self, on_span=None):
+        self.on_span = on_span
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._threads = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name, nbytes=0):
+        return _OpenSpan(self, name, nbytes)
+
+    @contextmanager
+    def activate(self):
+        """Make this the profile that `span()` records into, for the current context."""
+        token = _ACTIVE.set(self)
+        try:
+            yield self
+        finally:
+            _ACTIVE.reset(token)
+
+    def _open(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        with self._lock:
+            self._next_id += 1
+            span_id = self._next_id
+        parent = stack[-1] if stack else None
+        stack.append(span_id)
+        return span_id, parent
+
+    def _close(self, finished):
+        self._local.stack.pop()
+        with self._lock:
+            self.spans.append(finished)
+            if finished.thread not in self._threads:
+                self._threads[finished.thread] = threading.current_thread().name
+        if self.on_span is not None:
+            self.on_span(finished)
+
+    # ---- summaries ----
+
+    def totals(self):
+        """
+        {stage: {count, wall_s, self_s, cpu_s, bytes}} in order of first
+        appearance. self_s is wall time minus that of nested spans.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_s)
+        nested = {}
+        for s in spans:
+            if s.parent is not None:
+                nested[s.parent] = nested.get(s.parent, 0.0) + s.wall_s
+        totals = {}
+        for s in spans:
+            t = totals.setdefault(s.name, {"count": 0, "wall_s": 0.0, "self_s": 0.0, "cpu_s": 0.0, "bytes": 0})
+            t["count"] += 1
+            t["wall_s"] += s.wall_s
+            t["self_s"] += max(0.0, s.wall_s - nested.get(s.id, 0.0))
+            t["cpu_s"] += s.cpu_s
+            t["bytes"] += s.bytes
+        return totals
+
+    def rows(self):
+        """totals() as a list of flat dicts (milliseconds, KB), e.g. for a table widget."""
+        return [
+            {"stage": name, "count": t["count"], "wall_ms": round(t["wall_s"] * 1e3, 2),
+             "self_ms": round(t["self_s"] * 1e3, 2), "cpu_ms": round(t["cpu_s"] * 1e3, 2),
+             "kb": round(t["bytes"] / 1024, 1)}
+            for name, t in self.totals().items()
+        ]
+
+    def format_table(self):
+        lines = [f"{'stage':<20} {'count':>6} {'wall ms':>10} {'self ms':>10} {'cpu ms':>10} {'KB':>10}"]
+        for r in self.rows():
+            lines.append(f"{r['stage']:<20} {r['count']:>6} {r['wall_ms']:>10.2f} {r['self_ms']:>10.2f} "
+                         f"{r['cpu_ms']:>10.2f} {r['kb']:>10.1f}")
+        return lines
+
+    # ---- Chrome trace ----
+
+    def to_chrome_trace(self):
+        """The spans in Chrome's Trace Event format (complete "X" events, microseconds)."""
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_s)
+            threads = dict(self._threads)
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        for s in spans:
+            events.append({
+                "name": s.name, "cat": s.name.split(".", 1)[0], "ph": "X",
+                "ts": round(s.start_s * 1e6, 3), "dur": round(s.wall_s * 1e6, 3),
+                "pid": pid, "tid": s.thread,
+                "args": {"cpu_ms": round(s.cpu_s * 1e3, 3), "bytes": s.bytes},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        tmp.write_text(json.dumps(self.to_chrome_trace()), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+
+# ---------------- CLI ----------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pdf.profiling",
+                                     description="Render a draft and show where the time went.")
+    parser.add_argument("draft", help="draft JSON (as saved by the app)")
+    parser.add_argument("-q", "--quality", choices=["final", "draft"], default="final")
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+                        help="renders in this process; only the last one is profiled")
+    parser.add_argument("--trace", help="write a Chrome trace JSON here")
+    args = parser.parse_args(argv)
+
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    from pdf.context import context_from_draft, prepare_for_render
+    from pdf.generate_report import generate_report
+    # run as a script this module is __main__; the renderer records into pdf.profiling
+    from pdf.profiling import Profile as _Profile
+
+    ctx = context_from_draft(json.loads(Path(args.draft).read_text(encoding="utf-8")), root=ROOT)
+    prepare_for_render(ctx)
+    for _ in range(max(0, args.repeat - 1)):
+        generate_report(ctx, output_path=None, quality=args.quality)
+    profile = _Profile()
+    generate_report(ctx, output_path=None, quality=args.quality, profile=profile)
+
+    print("\n".join(profile.format_table()))
+    if args.trace:
+        print(f"-> {profile.write_chrome_trace(args.trace)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+"""
+Import-time budget for the entry points that start cold: the Streamlit app
+(before its first render) and the batch/render worker processes.
+
+    python -m pdf.startup                # median of 5 fresh interpreters each
+    python -m pdf.startup --repeat 11 --json out/startup.json
+
+Every probe runs in a new interpreter, so module and font caches of this
+process do not count. Exit code 1 if a probe is over its budget or pulls in
+a module it must not (e.g. reportlab on the app's start screen).
+"""
+
+# === Imports ===
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+# ---------------- Budgets ----------------
+# Milliseconds, measured inside the child after interpreter start-up, with
+# headroom for slower machines. `forbid`: top-level packages that must still
+# be unimported when the probe is done.
+
+PROBES = {
+    "app_start": {
+        "label": "app imports (start screen, no render)",
+        "code": "import pdf.context, storage.uploads, storage.drafts, storage.autosave, configs.lasers, configs.test_setup",
+        "budget_ms": 30,
+        "forbid": ["reportlab", "PIL", "numpy", "svglib"],
+    },
+    "renderer_import": {
+        "label": "import pdf.generate_report",
+        "code": "import pdf.generate_report",
+        "budget_ms": 150,
+        "forbid": ["svglib", "numpy"],
+    },
+    "fonts_cached": {
+        "label": "register fonts (metrics cache warm)",
+        "setup": "import pdf.fonts, reportlab.pdfbase.pdfmetrics, reportlab.pdfbase.ttfonts",
+        "code": "pdf.fonts.ensure_fonts()",
+        "budget_ms": 20,
+        "forbid": [],
+    },
+    "fonts_parsed": {
+        "label": "register fonts (no metrics cache)",
+        "setup": "import pdf.fonts, reportlab.pdfbase.pdfmetrics, reportlab.pdfbase.ttfonts; "
+                 "pdf.fonts.configure_font_cache(None)",
+        "code": "pdf.fonts.ensure_fonts()",
+        "budget_ms": 45,
+        "forbid": [],
+    },
+    "worker_ready": {
+        "label": "render worker ready (import + fonts)",
+        "code": "import pdf.generate_report; pdf.generate_report.ensure_fonts()",
+        "budget_ms": 170,
+        "forbid": ["svglib"],
+    },
+}
+
+_CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+{setup}
+t = time.perf_counter()
+{code}
+ms = (time.perf_counter() - t) * 1e3
+print(json.dumps({{"ms": ms, "loaded": sorted(m for m in {forbid!r} if m in sys.modules)}}))
+"""
+
+
+# ---------------- Measuring ----------------
+
+def run_probe(probe, repeat=5):
+    """Median time of `probe` over `repeat` fresh interpreters, and forbidden modules seen."""
+    child = _CHILD.format(root=str(ROOT), setup=probe.get("setup", ""), code=probe["code"],
+                          forbid=probe["forbid"])
+    times = []
+    loaded = set()
+    for _ in range(max(1, repeat)):
+        out = subprocess.run([sys.executable, "-c", child], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout
+        sample = json.loads(out.strip().splitlines()[-1])
+        times.append(sample["ms"])
+        loaded.update(sample["loaded"])
+    return {"ms": statistics.median(times), "min_ms": min(times), "loaded": sorted(loaded)}
+
+
+def check(repeat=5, probes=None):
+    results = {}
+    for name in probes or PROBES:
+        probe = PROBES[name]
+        r = run_probe(probe, repeat)
+        r["budget_ms"] = probe["budget_ms"]
+        r["ok"] = r["ms"] <= probe["budget_ms"] and not r["loaded"]
+        results[name] = r
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pdf.startup",
+                                     description="Check cold-start import times against their budgets.")
+    parser.add_argument("probes", nargs="*", help=f"default: all of {', '.join(PROBES)}")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per probe")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = [p for p in args.probes if p not in PROBES]
+    if unknown:
+        parser.error(f"unknown probe(s): {', '.join(unknown)}")
+
+    # the warm-cache probe needs the font metrics on disk first
+    if not args.probes or "fonts_cached" in args.probes:
+        run_probe({"code": "import pdf.fonts; pdf.fonts.ensure_fonts()", "forbid": []}, repeat=1)
+
+    results = check(args.repeat, args.probes)
+    for name, r in results.items():
+        flag = "ok  " if r["ok"] else "OVER"
+        extra = f"   loaded: {', '.join(r['loaded'])}" if r["loaded"] else ""
+        print(f"{flag} {PROBES[name]['label']:<42} {r['ms']:7.1f} ms  (budget {r['budget_ms']} ms){extra}")
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0 if all(r["ok"] for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,200 @@
+"""
+Text measurement for layout: per-font glyph advance tables, word widths and
+memoized greedy wrapping. Widths match reportlab's pdfmetrics.stringWidth
+exactly, so line breaks are the same as measuring whole strings.
+
+    python -m pdf.textmetrics            # micro-benchmark vs. the old wrap
+"""
+
+# === Imports ===
+import argparse
+import time
+from functools import lru_cache
+
+from reportlab.lib.rl_accel import unicode2T1
+from reportlab.pdfbase import pdfmetrics
+
+from .fonts import ensure_fonts
+from .profiling import span
+
+
+WORD_CACHE_SIZE = 1 << 16
+WRAP_CACHE_SIZE = 4096
+
+
+# ---------------- Advance tables ----------------
+# Advances are kept in font units (1/1000 em) and only scaled at the end.
+# Type 1 widths are integers and the TrueType ones multiples of
+# 1000/unitsPerEm (2048 for DejaVu, a power of two), so sums of them are
+# exact in any order: measuring word by word gives the same number as
+# measuring the whole line.
+
+class _AdvanceTable:
+    def __init__(self, font_name):
+        font = pdfmetrics.getFont(font_name)
+        self.font = font
+        self.truetype = bool(getattr(font, "_dynamicFont", False))
+        if self.truetype:
+            self._widths = font.face.charWidths
+            self._default = font.face.defaultWidth
+            self._chars = {}
+        else:
+            self._fonts = [font] + list(font.substitutionFonts)
+            # Latin-1 up front; anything else is looked up once and remembered
+            self._chars = {chr(i): self._t1_units(chr(i)) for i in range(32, 256)}
+
+    def _t1_units(self, ch):
+        # characters outside the font's encoding fall back to the substitution fonts
+        return sum(sum(map(f.widths.__getitem__, t)) for f, t in unicode2T1(ch, self._fonts))
+
+    def char_units(self, ch):
+        units = self._chars.get(ch)
+        if units is None:
+            if self.truetype:
+                units = self._widths.get(ord(ch), self._default)
+            else:
+                units = self._t1_units(ch)
+            self._chars[ch] = units
+        return units
+
+    def units(self, text):
+        get = self._chars.get
+        total = 0
+        for ch in text:
+            u = get(ch)
+            total += u if u is not None else self.char_units(ch)
+        return total
+
+    def scale(self, units, size):
+        # same operation order as reportlab, so results are bit-identical
+        if self.truetype:
+            return 0.001 * size * units
+        return units * 0.001 * size
+
+
+_TABLES = {}
+
+
+def advance_table(font_name):
+    table = _TABLES.get(font_name)
+    if table is None:
+        ensure_fonts()
+        table = _TABLES[font_name] = _AdvanceTable(font_name)
+    return table
+
+
+# ---------------- Measuring ----------------
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def word_units(word, font_name):
+    """Advance of `word` in font units (1/1000 em)."""
+    return advance_table(font_name).units(word)
+
+
+def string_width(text, font_name, font_size):
+    """Drop-in for pdfmetrics.stringWidth (points)."""
+    table = advance_table(font_name)
+    return table.scale(table.units(text), font_size)
+
+
+@lru_cache(maxsize=WRAP_CACHE_SIZE)
+def wrap_text(text, font_name, font_size, max_width):
+    """
+    Greedy word wrap by rendered width; returns a tuple of lines. A word wider
+    than `max_width` gets a line of its own. Linear in the text length:
+    every word is measured once (and memoized across calls).
+    """
+    with span("text.wrap", len(text)):
+        table = advance_table(font_name)
+        space = word_units(" ", font_name)
+        lines = []
+        current = []
+        current_units = 0
+        for w in text.split():
+            units = word_units(w, font_name)
+            test_units = current_units + space + units if current else units
+            if table.scale(test_units, font_size) <= max_width:
+                current.append(w)
+                current_units = test_units
+            else:
+                if current:
+                    lines.append(" ".join(current))
+                current = [w]
+                current_units = units
+        if current:
+            lines.append(" ".join(current))
+        return tuple(lines)
+
+
+def cache_stats():
+    return {"words": word_units.cache_info()._asdict(), "wraps": wrap_text.cache_info()._asdict()}
+
+
+def clear_caches():
+    word_units.cache_clear()
+    wrap_text.cache_clear()
+
+
+# ---------------- Micro-benchmark ----------------
+
+def _reference_wrap(text, font_name, font_size, max_width):
+    # the previous implementation: re-measures the whole growing line per word
+    words = text.split()
+    lines = []
+    current = []
+    for w in words:
+        test = (" ".join(current + [w])) if current else w
+        if pdfmetrics.stringWidth(test, font_name, font_size) <= max_width:
+            current.append(w)
+        else:
+            if current:
+                lines.append(" ".join(current))
+            current = [w]
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+def _bench(fn, args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pdf.textmetrics",
+                                     description="Benchmark text wrapping on a page of notes.")
+    parser.add_argument("--words", type=int, default=600, help="words of notes (default: about a page)")
+    parser.add_argument("--width", type=float, default=470.0, help="line width in points")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    vocabulary = ("damage threshold fluence pulse sample coating surface site laser beam "
+                  "measured according to ISO 21254 procedure with S-on-1 irradiation").split()
+    notes = " ".join(vocabulary[i % len(vocabulary)] for i in range(args.words))
+    font, size = "Helvetica-Oblique", 11
+
+    expected = _reference_wrap(notes, font, size, args.width)
+    assert list(wrap_text.__wrapped__(notes, font, size, args.width)) == expected
+
+    t_ref = _bench(_reference_wrap, (notes, font, size, args.width), args.repeat)
+    clear_caches()
+    t_cold = _bench(lambda *a: (clear_caches(), wrap_text(*a)), (notes, font, size, args.width), args.repeat)
+    word_units.cache_clear()
+    wrap_text(notes, font, size, args.width)
+    t_words = _bench(wrap_text.__wrapped__, (notes, font, size, args.width), args.repeat)
+    t_memo = _bench(wrap_text, (notes, font, size, args.width), args.repeat)
+
+    print(f"{args.words} words, {len(expected)} lines of {args.width:g} pt ({font} {size})")
+    print(f"  previous wrap          {t_ref * 1e3:8.3f} ms")
+    print(f"  table, cold caches     {t_cold * 1e3:8.3f} ms   x{t_ref / t_cold:6.1f}")
+    print(f"  table, warm word cache {t_words * 1e3:8.3f} ms   x{t_ref / t_words:6.1f}")
+    print(f"  memoized wrap          {t_memo * 1e3:8.3f} ms   x{t_ref / t_memo:6.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+# === Imports ===
+import hashlib
+import io
+import threading
+
+from PIL import Image
+
+from .cache import LRUCache, DiskCache, file_digest, digest_key
+from .encoding import EncodedImage, fit_and_encode
+from .imaging import image_size
+
+
+# ---------------- Fitted-tile cache ----------------
+
+def source_digest(src):
+    """Content hash of an image source (path or raw bytes)."""
+    if isinstance(src, (bytes, bytearray)):
+        return hashlib.sha256(src).hexdigest()
+    return file_digest(src)
+
+
+def _encoded_from_bytes(data):
+    # only the header is parsed, to recover format and size
+    with Image.open(io.BytesIO(data)) as im:
+        return EncodedImage(data, im.format, im.width, im.height)
+
+
+class TileCache:
+    """
+    Final encoded figure rasters shared across reports.
+    Keyed by the source's content hash, the target box, the flatten flag and
+    the encoding policy (mode, quality, dpi), so a hit skips decode, resize
+    and encode entirely. Entries pushed out of the in-memory LRU are spilled
+    to an optional DiskCache and promoted back on the next hit.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=512, spill_dir=None,
+                 spill_max_bytes=256 * 1024 * 1024):
+        self._spill = DiskCache(spill_dir, max_bytes=spill_max_bytes, suffix=".img") if spill_dir else None
+        self._memory = LRUCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            sizeof=lambda enc: len(enc.data),
+            on_evict=self._spill_entry,
+        )
+        self._sizes = LRUCache(max_entries=1024)
+        self._lock = threading.Lock()
+        self.spill_hits = 0
+
+    def _spill_entry(self, key, encoded):
+        if self._spill is not None:
+            self._spill.put(key, encoded.data)
+
+    def key(self, src, box_w, box_h, policy, *, flatten_white=False, override=None):
+        return digest_key(
+            "tile", source_digest(src), round(float(box_w), 3), round(float(box_h), 3),
+            bool(flatten_white), override, policy.cache_token(),
+        )
+
+    def get(self, key):
+        encoded = self._memory.get(key)
+        if encoded is None and self._spill is not None:
+            data = self._spill.get(key)
+            if data is not None:
+                encoded = _encoded_from_bytes(data)
+                self._memory.put(key, encoded)
+                with self._lock:
+                    self.spill_hits += 1
+        return encoded
+
+    def fit_and_encode(self, src, box_w, box_h, policy, *, flatten_white=False, override=None):
+        """Cached `encoding.fit_and_encode`."""
+        key = self.key(src, box_w, box_h, policy, flatten_white=flatten_white, override=override)
+        encoded = self.get(key)
+        if encoded is None:
+            encoded = fit_and_encode(src, box_w, box_h, policy,
+                                     flatten_white=flatten_white, override=override)
+            self._memory.put(key, encoded)
+        return encoded
+
+    def image_size(self, src):
+        """`imaging.image_size`, memoized on the source's content hash."""
+        digest = source_digest(src)
+        size = self._sizes.get(digest)
+        if size is None:
+            size = image_size(src)
+            self._sizes.put(digest, size)
+        return size
+
+    def clear(self):
+        self._memory.clear()
+        self._sizes.clear()
+
+    def stats(self):
+        s = self._memory.stats()
+        with self._lock:
+            s["spill_hits"] = self.spill_hits
+        lookups = s["hits"] + s["misses"]
+        # spill hits were counted as memory misses first
+        s["hit_rate"] = ((s["hits"] + s["spill_hits"]) / lookups) if lookups else 0.0
+        if self._spill is not None:
+            s["spill"] = self._spill.stats()
+        return s
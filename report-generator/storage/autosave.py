@@ -0,0 +1,521 @@
+"""
+Journaled autosave of editing sessions.
+
+Every autosave is a pair of files in one directory:
+
+    <id>.json      snapshot: {"version", "seq", "saved", "form"}, replaced atomically
+    <id>.journal   one JSON line per saved interaction: {"seq", "t", "set": [[path, value]], "del": [path]}
+    <id>.meta      {"sample", "customer"}, rewritten when one of them changes; all that listing reads
+
+`AutosaveSession.save(form)` diffs the form against what was last saved and
+appends only the changed fields (dict keys are descended into, lists and
+scalars are replaced whole), so an interaction costs one short append
+whatever the size of the draft. Once the journal grows past a threshold it
+is folded into a new snapshot on a background thread. Restoring reads the
+snapshot and replays the journal entries newer than it; a torn last line
+(crash mid-append) is dropped. Autosaves left alone for max_age_s are
+pruned (see AutosaveStore.maybe_prune).
+
+    python -m storage.autosave                  # benchmark save cost vs. draft size
+"""
+
+# === Imports ===
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import namedtuple
+from copy import deepcopy
+from datetime import date, datetime
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_AUTOSAVE_DIR = ROOT / "data" / "autosave"
+
+SNAPSHOT_VERSION = 1
+# fold the journal into the snapshot past either bound
+COMPACT_ENTRIES = 200
+COMPACT_BYTES = 256 * 1024
+# autosaves not written for this long are deleted by prune()
+DEFAULT_MAX_AGE_S = 30 * 24 * 3600
+
+# form fields kept in <id>.meta for listing
+SUMMARY_FIELDS = ("sample", "customer")
+_SUFFIXES = (".json", ".journal", ".meta")
+
+# store root -> last prune timestamp, shared by all reruns/sessions of the process
+_LAST_PRUNE = {}
+_PRUNE_LOCK = threading.Lock()
+
+AutosaveInfo = namedtuple("AutosaveInfo", "id sample customer modified")
+
+
+# ---------------- Encoding ----------------
+# Form state holds datetime.date values (date inputs); they are tagged so a
+# restored form has the same types as the one that was saved.
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return {"$datetime": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"$date": obj.isoformat()}
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f"Cannot autosave a {type(obj).__name__}")
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        if "$date" in obj:
+            return date.fromisoformat(obj["$date"])
+        if "$datetime" in obj:
+            return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def _dumps(obj):
+    return json.dumps(obj, default=_encode, ensure_ascii=False, separators=(",", ":"))
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+# ---------------- Field-level changes ----------------
+
+def diff(old, new, path=()):
+    """
+    Changes that turn dict `old` into dict `new`: (sets, dels), where sets
+    is a list of (path, value) and dels a list of paths (tuples of keys).
+    """
+    sets, dels = [], []
+    for key, value in new.items():
+        if key not in old:
+            sets.append((path + (key,), value))
+            continue
+        before = old[key]
+        if isinstance(value, dict) and isinstance(before, dict):
+            s, d = diff(before, value, path + (key,))
+            sets += s
+            dels += d
+        elif type(before) is not type(value) or before != value:
+            sets.append((path + (key,), value))
+    dels += [path + (key,) for key in old if key not in new]
+    return sets, dels
+
+
+def apply_changes(state, sets, dels):
+    """Apply `diff` output to dict `state` in place."""
+    for path in dels:
+        parent = state
+        for key in path[:-1]:
+            parent = parent.get(key)
+            if not isinstance(parent, dict):
+                break
+        else:
+            parent.pop(path[-1], None)
+    for path, value in sets:
+        parent = state
+        for key in path[:-1]:
+            child = parent.get(key)
+            if not isinstance(child, dict):
+                child = parent[key] = {}
+            parent = child
+        parent[path[-1]] = value
+    return state
+
+
+# ---------------- Sessions ----------------
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _summary(form):
+    return {k: form.get(k) or "" for k in SUMMARY_FIELDS}
+
+
+def _write_small(path, text):
+    # atomic replace; not fsynced, the snapshot and journal are the data of record
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def replay(snapshot_path, journal_path):
+    """
+    Read-only restore: (form, seq, snapshot_seq, journal entries, journal
+    bytes up to the first torn line, torn). Never writes either file, so it
+    is safe while another session is appending.
+    """
+    state, seq = {}, 0
+    try:
+        snapshot = _loads(snapshot_path.read_text(encoding="utf-8"))
+        if snapshot.get("version") == SNAPSHOT_VERSION:
+            state, seq = snapshot["form"], snapshot["seq"]
+    except (OSError, ValueError, KeyError):
+        pass
+    snapshot_seq = seq
+    entries = nbytes = 0
+    torn = False
+    try:
+        with open(journal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    torn = True
+                    break
+                nbytes += len(line)
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    continue
+                if entry["seq"] <= snapshot_seq:
+                    continue
+                apply_changes(state, [(tuple(p), v) for p, v in entry.get("set", ())],
+                              [tuple(p) for p in entry.get("del", ())])
+                seq = max(seq, entry["seq"])
+                entries += 1
+    except OSError:
+        pass
+    return state, seq, snapshot_seq, entries, nbytes, torn
+
+
+class AutosaveSession:
+    """
+    Autosave of one form. Thread-safe; several browser tabs editing the
+    same autosave share one instance (see AutosaveStore.session), and the
+    last write to a field wins.
+    """
+
+    def __init__(self, store, autosave_id):
+        self.store = store
+        self.id = autosave_id
+        self.snapshot_path = store.root / f"{autosave_id}.json"
+        self.journal_path = store.root / f"{autosave_id}.journal"
+        self.meta_path = store.root / f"{autosave_id}.meta"
+        self._lock = threading.Lock()
+        self._saved, self._seq, self._snapshot_seq, self._journal_entries, self._journal_bytes = self._restore()
+        self._summary = _summary(self._saved) if self.meta_path.exists() else None
+        self._compacting = False
+        self.last_save = None  # (time, bytes appended)
+
+    def _restore(self):
+        state, seq, snapshot_seq, entries, nbytes, torn = replay(self.snapshot_path, self.journal_path)
+        if torn:
+            # torn tail of an interrupted append: cut it so the next append starts a fresh line
+            try:
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(nbytes)
+            except OSError:
+                pass
+        return state, seq, snapshot_seq, entries, nbytes
+
+    @property
+    def form(self):
+        """A private copy of the saved form state."""
+        with self._lock:
+            return deepcopy(self._saved)
+
+    def save(self, form):
+        """
+        Append the fields of `form` that changed since the last save; returns
+        the number of bytes written (0 when nothing changed).
+        """
+        with self._lock:
+            sets, dels = diff(self._saved, form)
+            if not sets and not dels:
+                return 0
+            self._seq += 1
+            line = _dumps({"seq": self._seq, "t": round(time.time(), 3),
+                           "set": [[list(p), v] for p, v in sets], "del": [list(p) for p in dels]}) + "\n"
+            data = line.encode("utf-8")
+            self.store.root.mkdir(parents=True, exist_ok=True)
+            # flushed to the OS on close, so it survives a server restart; fsync is left to compaction
+            with open(self.journal_path, "ab") as f:
+                f.write(data)
+            # the saved state must not alias the live form, which the app keeps mutating
+            apply_changes(self._saved, [(p, deepcopy(v)) for p, v in sets], dels)
+            summary = _summary(self._saved)
+            if summary != self._summary:
+                _write_small(self.meta_path, _dumps(summary))
+                self._summary = summary
+            self._journal_entries += 1
+            self._journal_bytes += len(data)
+            self.last_save = (time.time(), len(data))
+            due = (self._snapshot_seq == 0 or self._journal_entries >= self.store.compact_entries
+                   or self._journal_bytes >= self.store.compact_bytes)
+            if due and not self._compacting:
+                self._compacting = True
+                self.store._submit(self._compact_in_background)
+        return len(data)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """Fold the journal into a new snapshot (atomic replace), then drop the folded entries."""
+        with self._lock:
+            seq = self._seq
+            if seq == self._snapshot_seq:
+                return False
+            text = _dumps({"version": SNAPSHOT_VERSION, "seq": seq, "saved": time.time(), "form": self._saved})
+
+        # written outside the lock: saves keep appending meanwhile
+        fd, tmp = tempfile.mkstemp(dir=self.store.root, prefix=f".{self.id}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        _fsync_dir(self.store.root)
+
+        # entries up to `seq` are in the snapshot; keep only those appended since.
+        # A crash before this point leaves them in the journal, where restore skips them.
+        with self._lock:
+            self._snapshot_seq = seq
+            if self._seq == seq:
+                with open(self.journal_path, "wb"):
+                    pass
+                self._journal_entries = self._journal_bytes = 0
+            else:
+                with open(self.journal_path, encoding="utf-8") as f:
+                    newer = [line for line in f if line.endswith("\n") and _loads(line)["seq"] > seq]
+                tmp = self.journal_path.with_name(self.journal_path.name + ".part")
+                tmp.write_text("".join(newer), encoding="utf-8")
+                os.replace(tmp, self.journal_path)
+                self._journal_entries = len(newer)
+                self._journal_bytes = sum(len(line.encode("utf-8")) for line in newer)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "seq": self._seq,
+                "snapshot_seq": self._snapshot_seq,
+                "journal_entries": self._journal_entries,
+                "journal_bytes": self._journal_bytes,
+                "compacting": self._compacting,
+            }
+
+
+# ---------------- Store ----------------
+
+class AutosaveStore:
+    """
+    Directory of autosaves, shared by all sessions of the process. One
+    background thread does every compaction.
+    """
+
+    def __init__(self, root=DEFAULT_AUTOSAVE_DIR, compact_entries=COMPACT_ENTRIES, compact_bytes=COMPACT_BYTES,
+                 max_age_s=DEFAULT_MAX_AGE_S):
+        self.root = Path(root)
+        self.compact_entries = compact_entries
+        self.compact_bytes = compact_bytes
+        self.max_age_s = max_age_s
+        # open sessions only: an autosave nobody edits any more is dropped with its last user
+        self._sessions = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _submit(self, fn):
+        with self._lock:
+            if self._executor is None:
+                # imported here: the app's start screen does not need it
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave-compact")
+            return self._executor.submit(fn)
+
+    @staticmethod
+    def new_id():
+        return f"{datetime.now():%Y%m%d-%H%M%S}-{os.urandom(3).hex()}"
+
+    @staticmethod
+    def _valid_id(autosave_id):
+        return bool(autosave_id) and all(ch.isalnum() or ch == "-" for ch in autosave_id)
+
+    def session(self, autosave_id=None):
+        """The session of `autosave_id` (restored from disk if it exists), or of a new id."""
+        autosave_id = autosave_id or self.new_id()
+        if not self._valid_id(autosave_id):
+            raise ValueError(f"Invalid autosave id: {autosave_id!r}")
+        with self._lock:
+            session = self._sessions.get(autosave_id)
+            if session is None:
+                session = self._sessions[autosave_id] = AutosaveSession(self, autosave_id)
+            return session
+
+    def exists(self, autosave_id):
+        return self._valid_id(autosave_id) and (
+            (self.root / f"{autosave_id}.json").exists() or (self.root / f"{autosave_id}.journal").exists())
+
+    def _modified(self):
+        """autosave id -> newest mtime of its files."""
+        ids = {}
+        if self.root.is_dir():
+            for p in self.root.iterdir():
+                if p.suffix in _SUFFIXES and self._valid_id(p.stem):
+                    try:
+                        ids[p.stem] = max(ids.get(p.stem, 0), p.stat().st_mtime)
+                    except OSError:
+                        continue
+        return ids
+
+    def list(self):
+        """
+        AutosaveInfo of every autosave, most recently modified first. Only
+        the small <id>.meta files are read; no session is restored.
+        """
+        infos = []
+        for autosave_id, mtime in self._modified().items():
+            meta_path = self.root / f"{autosave_id}.meta"
+            try:
+                summary = _loads(meta_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                # no summary yet (or a torn one): build it from the autosave itself, read-only,
+                # since another session may be appending to the journal right now
+                with self._lock:
+                    session = self._sessions.get(autosave_id)
+                if session is not None:
+                    form, torn = session.form, False
+                else:
+                    form, *_, torn = replay(self.root / f"{autosave_id}.json",
+                                            self.root / f"{autosave_id}.journal")
+                if not form:
+                    continue
+                summary = _summary(form)
+                if not torn:
+                    _write_small(meta_path, _dumps(summary))
+            infos.append(AutosaveInfo(autosave_id, summary.get("sample", ""), summary.get("customer", ""),
+                                      datetime.fromtimestamp(mtime)))
+        return sorted(infos, key=lambda info: info.modified, reverse=True)
+
+    def delete(self, autosave_id):
+        with self._lock:
+            self._sessions.pop(autosave_id, None)
+        for suffix in _SUFFIXES:
+            (self.root / f"{autosave_id}{suffix}").unlink(missing_ok=True)
+
+    def prune(self, max_age_s=None, now=None):
+        """
+        Delete autosaves whose files have not been written for `max_age_s`,
+        unless a session has them open, plus abandoned temp files. Returns
+        the removed ids.
+        """
+        max_age_s = self.max_age_s if max_age_s is None else max_age_s
+        now = time.time() if now is None else now
+        removed = []
+        for autosave_id, mtime in self._modified().items():
+            if now - mtime < max_age_s:
+                continue
+            with self._lock:
+                if autosave_id in self._sessions:
+                    continue
+            self.delete(autosave_id)
+            removed.append(autosave_id)
+        if self.root.is_dir():
+            for p in self.root.glob("*.part"):
+                try:
+                    if now - p.stat().st_mtime >= max_age_s:
+                        p.unlink()
+                except OSError:
+                    continue
+        return removed
+
+    def maybe_prune(self, interval_s=3600):
+        """Run `prune` at most once per `interval_s` per process."""
+        key = str(self.root.resolve())
+        with _PRUNE_LOCK:
+            now = time.time()
+            if now - _LAST_PRUNE.get(key, 0) < interval_s:
+                return []
+            _LAST_PRUNE[key] = now
+        return self.prune(now=now)
+
+    def flush(self):
+        """Compact every open session now (e.g. before shutdown)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.compact()
+
+
+# ---------------- Benchmark ----------------
+
+def _synthetic_form(sections):
+    return {
+        "sample": "FS-AR-1064-S1",
+        "customer": "Customer Company",
+        "prepared_by": ["Ing. Martin Mydlář (martin.mydlar@hilase.cz)"],
+        "sections_data": {"sample_information": {"description": "", "date_received": date(2025, 9, 12)}},
+        "sections": [{"title": f"Section {i}", "items": [[f"Label {j}", "value " * 8] for j in range(10)],
+                      "notes": "note " * 200} for i in range(sections)],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m storage.autosave",
+                                     description="Compare journaled saves with full JSON dumps.")
+    parser.add_argument("--edits", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    for sections in (5, 50, 500):
+        form = _synthetic_form(sections)
+        with tempfile.TemporaryDirectory(prefix="lidt-autosave-") as tmp:
+            store = AutosaveStore(tmp, compact_entries=10**9, compact_bytes=10**12)
+            session = store.session()
+            session.save(form)
+            session.compact()
+            written = 0
+            t = time.perf_counter()
+            for i in range(args.edits):
+                form["sections_data"]["sample_information"]["description"] = f"edit {i}"
+                written += session.save(form)
+            journaled = (time.perf_counter() - t) / args.edits
+
+            full = Path(tmp) / "full.json"
+            t = time.perf_counter()
+            for i in range(args.edits):
+                form["sections_data"]["sample_information"]["description"] = f"edit {i}"
+                tmp_path = full.with_suffix(".part")
+                tmp_path.write_text(_dumps(form), encoding="utf-8")
+                os.replace(tmp_path, full)
+            dumped = (time.perf_counter() - t) / args.edits
+
+            t = time.perf_counter()
+            session.compact()
+            compact_ms = (time.perf_counter() - t) * 1e3
+            # read back from disk through a fresh store
+            restored = AutosaveStore(tmp).session(session.id).form
+            assert restored == form
+            print(f"{full.stat().st_size / 1024:8.0f} KB draft: journal {journaled * 1e6:7.0f} us/save "
+                  f"({written / args.edits:.0f} B), full dump {dumped * 1e6:7.0f} us/save, "
+                  f"compaction {compact_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,352 @@
+"""
+Indexed draft repository: the JSON files in data/drafts stay the source of
+truth, a SQLite index next to the caches makes listing and searching them
+cheap.
+
+    python -m storage.drafts --drafts 5000     # benchmark sync/list/search on synthetic drafts
+
+Every listing first syncs the index with the directory: a scandir (skipped
+while the directory is unchanged, see SCAN_INTERVAL_S), and only files whose
+mtime or size changed are parsed again. Search is by word prefix over sample
+ID, customer, standard, laser, authors and file name.
+"""
+
+# === Imports ===
+import argparse
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_DRAFTS_DIR = ROOT / "data" / "drafts"
+DEFAULT_INDEX_PATH = ROOT / "data" / "cache" / "drafts" / "index.sqlite3"
+
+# bump when the indexed fields or the schema change; the index is rebuilt
+INDEX_VERSION = 1
+PAGE_SIZE = 20
+# Adding, removing or atomically replacing a draft bumps the directory's
+# mtime and is picked up at once; a file edited in place is noticed by the
+# next full stat scan, done at most this often while the directory is unchanged.
+SCAN_INTERVAL_S = 2.0
+SORT_ORDERS = {
+    "modified": "mtime_ns DESC, name",
+    "sample": "sample COLLATE NOCASE, mtime_ns DESC",
+    "customer": "customer COLLATE NOCASE, mtime_ns DESC",
+    "name": "name",
+}
+
+# as written by pdf.context.build_sections
+LASER_SECTION = "Laser and Environmental Conditions"
+LASER_ITEM = "Laser Type"
+
+_SCHEMA = """
+CREATE TABLE drafts (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL UNIQUE,
+    mtime_ns    INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    sample      TEXT NOT NULL DEFAULT '',
+    customer    TEXT NOT NULL DEFAULT '',
+    standard    TEXT NOT NULL DEFAULT '',
+    laser       TEXT NOT NULL DEFAULT '',
+    prepared_by TEXT NOT NULL DEFAULT '',
+    error       TEXT
+);
+CREATE INDEX drafts_mtime ON drafts (mtime_ns);
+CREATE TABLE terms (
+    term     TEXT NOT NULL,
+    draft_id INTEGER NOT NULL
+);
+CREATE INDEX terms_term ON terms (term, draft_id);
+CREATE INDEX terms_draft ON terms (draft_id);
+"""
+
+_FIELDS = ("sample", "customer", "standard", "laser", "prepared_by")
+
+DraftEntry = namedtuple("DraftEntry", "name mtime_ns size sample customer standard laser prepared_by error")
+DraftPage = namedtuple("DraftPage", "entries total offset limit")
+SyncResult = namedtuple("SyncResult", "added updated removed")
+
+
+# ---------------- Indexed fields ----------------
+
+def _laser(draft):
+    for section in draft.get("sections") or []:
+        if isinstance(section, dict) and section.get("title") == LASER_SECTION:
+            for item in section.get("items") or []:
+                if len(item) == 2 and item[0] == LASER_ITEM:
+                    return str(item[1] or "")
+    laser = ((draft.get("sections_data") or {}).get("laser_environmental") or {}).get("laser") or {}
+    return str(laser.get("laser_type") or "")
+
+
+def draft_summary(draft):
+    """The indexed fields of a draft dict."""
+    prepared_by = draft.get("prepared_by") or []
+    if isinstance(prepared_by, str):
+        prepared_by = [prepared_by]
+    return {
+        "sample": str(draft.get("sample") or ""),
+        "customer": str(draft.get("customer") or ""),
+        "standard": str(draft.get("standard") or ""),
+        "laser": _laser(draft),
+        "prepared_by": "; ".join(str(p) for p in prepared_by),
+    }
+
+
+_WORD = re.compile(r"\w+")
+
+
+def _terms(name, summary):
+    # every word, plus each whole value, so "fs-ar-10" matches "FS-AR-1064-S1"
+    terms = {Path(name).stem.lower()}
+    for value in summary.values():
+        value = value.lower().strip()
+        if value:
+            terms.add(value)
+            terms.update(value.split())
+            terms.update(_WORD.findall(value))
+    return terms
+
+
+def _prefix_range(prefix):
+    return prefix, prefix + "\U0010ffff"
+
+
+# ---------------- Repository ----------------
+
+class DraftRepository:
+    """
+    Drafts of one directory, with a SQLite index of their summary fields.
+    Thread-safe (one connection behind a lock), so a single instance can be
+    shared by every session of the app. The index is a cache: deleting it,
+    or a schema change (INDEX_VERSION), only costs one full re-parse.
+    """
+
+    def __init__(self, drafts_dir=DEFAULT_DRAFTS_DIR, index_path=DEFAULT_INDEX_PATH):
+        self.drafts_dir = Path(drafts_dir)
+        self.index_path = Path(index_path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._scanned = (None, float("-inf"))  # directory mtime, monotonic time of the last scan
+        self.last_sync = SyncResult(0, 0, 0)
+
+    # ---- index ----
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            conn = self._open()
+        except sqlite3.DatabaseError:
+            # a corrupt index is only a cache: start over
+            self.index_path.unlink(missing_ok=True)
+            conn = self._open()
+        self._conn = conn
+        return conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            with conn:
+                conn.execute("BEGIN")
+                conn.execute("DROP TABLE IF EXISTS terms")
+                conn.execute("DROP TABLE IF EXISTS drafts")
+                for statement in _SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={INDEX_VERSION}")
+        return conn
+
+    def _scan(self):
+        found = {}
+        try:
+            with os.scandir(self.drafts_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        st = entry.stat()
+                        found[entry.name] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+        return found
+
+    def _parse(self, name):
+        try:
+            draft = json.loads((self.drafts_dir / name).read_text(encoding="utf-8"))
+            if not isinstance(draft, dict):
+                raise ValueError("not a JSON object")
+            return draft_summary(draft), None
+        except (OSError, ValueError) as e:
+            return dict.fromkeys(_FIELDS, ""), f"{type(e).__name__}: {e}"
+
+    def sync(self, force=False):
+        """Bring the index in line with the directory; returns a SyncResult."""
+        try:
+            dir_mtime = self.drafts_dir.stat().st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        now = time.monotonic()
+        last_mtime, last_scan = self._scanned
+        if not force and dir_mtime == last_mtime and now - last_scan < SCAN_INTERVAL_S:
+            return SyncResult(0, 0, 0)
+        on_disk = self._scan()
+        with self._lock:
+            self._scanned = (dir_mtime, now)
+            conn = self._connect()
+            indexed = {name: (mtime, size, draft_id) for draft_id, name, mtime, size in
+                       conn.execute("SELECT id, name, mtime_ns, size FROM drafts")}
+            changed = [name for name, stamp in on_disk.items() if indexed.get(name, (None, None))[:2] != stamp]
+            removed = [indexed[name][2] for name in indexed if name not in on_disk]
+            if not changed and not removed:
+                self.last_sync = SyncResult(0, 0, 0)
+                return self.last_sync
+
+            parsed = [(name, *self._parse(name)) for name in changed]
+            with conn:
+                conn.execute("BEGIN")
+                for draft_id in removed:
+                    conn.execute("DELETE FROM terms WHERE draft_id = ?", (draft_id,))
+                    conn.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+                for name, summary, error in parsed:
+                    mtime, size = on_disk[name]
+                    row = conn.execute(
+                        "INSERT INTO drafts (name, mtime_ns, size, sample, customer, standard, laser, prepared_by, error)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (name) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size,"
+                        " sample = excluded.sample, customer = excluded.customer, standard = excluded.standard,"
+                        " laser = excluded.laser, prepared_by = excluded.prepared_by, error = excluded.error"
+                        " RETURNING id",
+                        (name, mtime, size, *(summary[f] for f in _FIELDS), error),
+                    ).fetchone()
+                    conn.execute("DELETE FROM terms WHERE draft_id = ?", (row[0],))
+                    conn.executemany("INSERT INTO terms (term, draft_id) VALUES (?, ?)",
+                                     [(t, row[0]) for t in _terms(name, summary)])
+            added = sum(1 for name in changed if name not in indexed)
+            self.last_sync = SyncResult(added, len(changed) - added, len(removed))
+            return self.last_sync
+
+    # ---- queries ----
+
+    def search(self, query="", offset=0, limit=PAGE_SIZE, sort="modified", sync=True):
+        """
+        One page of drafts matching `query`: every whitespace-separated
+        token must be a prefix of some word (or whole value) of the indexed
+        fields, case-insensitively. An empty query lists everything.
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort: {sort!r} (expected one of {tuple(SORT_ORDERS)})")
+        if sync:
+            self.sync()
+        where, params = [], []
+        for token in dict.fromkeys(query.lower().split()):
+            where.append("id IN (SELECT draft_id FROM terms WHERE term >= ? AND term < ?)")
+            params.extend(_prefix_range(token))
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM drafts {clause}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(DraftEntry._fields)} FROM drafts {clause}"
+                f" ORDER BY {SORT_ORDERS[sort]} LIMIT ? OFFSET ?",
+                (*params, int(limit), max(0, int(offset))),
+            ).fetchall()
+        return DraftPage([DraftEntry(*r) for r in rows], total, offset, limit)
+
+    def get(self, name):
+        """Index entry of one draft file (None if unknown), without syncing."""
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(DraftEntry._fields)} FROM drafts WHERE name = ?", (name,)).fetchone()
+        return DraftEntry(*row) if row else None
+
+    def path(self, name):
+        path = (self.drafts_dir / name).resolve()
+        if path.parent != self.drafts_dir.resolve():
+            raise ValueError(f"Not a draft of {self.drafts_dir}: {name!r}")
+        return path
+
+    def load(self, name):
+        """The parsed draft dict."""
+        return json.loads(self.path(name).read_text(encoding="utf-8"))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ---------------- Benchmark ----------------
+
+def _synthetic_draft(i):
+    customers = ("Thorlabs", "Layertec", "Edmund Optics", "Optoman", "Meopta", "Crytur", "Eksma")
+    standards = ("ISO 21254", "ISO 21254-2", "ISO 21254-3")
+    lasers = ("Perla 100", "Bivoj", "Yb:YAG thin-disk", "Nd:YAG 1064")
+    people = ("Ing. Martin Mydlář", "Mgr. Liliia Uvarova, Ph.D.", "Arindom Phukan, Ph.D.")
+    return {
+        "sample": f"S{i:05d}-{('FS', 'BK7', 'CaF2', 'YAG')[i % 4]}-AR",
+        "customer": customers[i % len(customers)],
+        "standard": standards[i % len(standards)],
+        "prepared_by": [people[i % len(people)]],
+        "sections": [{"title": LASER_SECTION, "items": [[LASER_ITEM, lasers[i % len(lasers)]]]},
+                     {"title": "Notes", "items": [["Text", "x" * 2000]]}],
+    }
+
+
+def _best_ms(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1e3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m storage.drafts",
+                                     description="Benchmark the draft index on synthetic drafts.")
+    parser.add_argument("--drafts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="lidt-drafts-") as tmp:
+        drafts_dir = Path(tmp) / "drafts"
+        drafts_dir.mkdir()
+        for i in range(args.drafts):
+            (drafts_dir / f"draft_{i:05d}.json").write_text(json.dumps(_synthetic_draft(i)), encoding="utf-8")
+        repo = DraftRepository(drafts_dir, Path(tmp) / "index.sqlite3")
+
+        t = time.perf_counter()
+        repo.sync()
+        print(f"{args.drafts} drafts")
+        print(f"  first sync (parse all)   {(time.perf_counter() - t) * 1e3:8.1f} ms")
+        print(f"  sync, directory unchanged{_best_ms(repo.sync, args.repeat):8.1f} ms")
+        print(f"  sync, full stat scan     {_best_ms(lambda: repo.sync(force=True), args.repeat):8.1f} ms")
+        touched = drafts_dir / "draft_00007.json"
+        touched.write_text(json.dumps(_synthetic_draft(7) | {"customer": "Renamed"}), encoding="utf-8")
+        os.utime(touched, ns=(time.time_ns(), time.time_ns()))
+        t = time.perf_counter()
+        repo.sync(force=True)
+        print(f"  sync, one file changed   {(time.perf_counter() - t) * 1e3:8.1f} ms  {repo.last_sync}")
+        for label, query in [("list page 1", ""), ("list page 50", None), ("search 'thor'", "thor"),
+                             ("search 's0012'", "s0012"), ("search 'iso 21254-3 bivoj'", "iso 21254-3 bivoj")]:
+            offset = 49 * PAGE_SIZE if query is None else 0
+            page = repo.search(query or "", offset=offset)
+            ms = _best_ms(lambda: repo.search(query or "", offset=offset), args.repeat)
+            print(f"  {label:<24} {ms:8.1f} ms  ({page.total} matches, incl. sync)")
+        repo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,192 @@
+# === Imports ===
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+CHUNK_SIZE = 1024 * 1024
+ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
+
+# store root -> last GC timestamp, shared by all reruns/sessions of the process
+_LAST_GC = {}
+_GC_LOCK = threading.Lock()
+
+
+# ---------------- Content-addressed upload store ----------------
+
+class UploadStore:
+    """
+    Uploaded images stored once per unique content, as <sha256>.<ext>.
+    Re-uploading (or a Streamlit rerun re-submitting) the same bytes costs a
+    hash over the in-memory upload and no disk write.
+    A blob stays alive while a draft references it or while a session keeps
+    touching it (see `touch`); `gc` removes the rest once they are older
+    than `max_age_s`.
+    """
+
+    def __init__(self, root, max_age_s=7 * 24 * 3600):
+        self.root = Path(root)
+        self.max_age_s = max_age_s
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _blob_path(self, digest, ext):
+        return self.root / f"{digest}.{ext}"
+
+    @staticmethod
+    def _normalize_ext(filename):
+        ext = Path(filename).suffix.lstrip(".").lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"Unsupported upload type: {filename!r}")
+        return "jpg" if ext == "jpeg" else ext
+
+    def put(self, stream, filename):
+        """
+        Store the bytes of a readable binary stream (e.g. a Streamlit
+        UploadedFile) and return the blob path. Data is read in chunks.
+        """
+        ext = self._normalize_ext(filename)
+
+        if hasattr(stream, "seek") and getattr(stream, "seekable", lambda: True)():
+            # in-memory upload: hash first, write only if the blob is new
+            stream.seek(0)
+            h = hashlib.sha256()
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+            path = self._blob_path(h.hexdigest(), ext)
+            if path.exists():
+                self.touch(path)
+                return path
+            stream.seek(0)
+            self._write_atomic(stream, path)
+            return path
+
+        # one-pass stream: hash while spooling to a temp file
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+        h = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    f.write(chunk)
+            path = self._blob_path(h.hexdigest(), ext)
+            if path.exists():
+                os.unlink(tmp)
+                self.touch(path)
+            else:
+                os.replace(tmp, path)
+            return path
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _write_atomic(self, stream, path):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    f.write(chunk)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def touch(self, path):
+        """Mark a blob as in use by a live session (bumps its mtime)."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def gc(self, referenced=(), max_age_s=None, now=None):
+        """
+        Delete blobs of the store that are not in `referenced` and have not
+        been written or touched for `max_age_s`, plus abandoned temp files.
+        Returns the removed paths. Files not named by a content hash (e.g.
+        legacy uuid uploads) are never touched.
+        """
+        max_age_s = self.max_age_s if max_age_s is None else max_age_s
+        now = time.time() if now is None else now
+        keep = {Path(p).name for p in referenced}
+        removed = []
+        for p in self.root.iterdir():
+            if not p.is_file() or p.name in keep or not _is_store_file(p):
+                continue
+            try:
+                if now - p.stat().st_mtime < max_age_s:
+                    continue
+                p.unlink()
+            except OSError:
+                continue
+            removed.append(p)
+        return removed
+
+    def maybe_gc(self, referenced_fn, interval_s=3600):
+        """Run `gc` at most once per `interval_s` per process; `referenced_fn` is only called then."""
+        key = str(self.root.resolve())
+        with _GC_LOCK:
+            now = time.time()
+            if now - _LAST_GC.get(key, 0) < interval_s:
+                return []
+            _LAST_GC[key] = now
+        return self.gc(referenced_fn(), now=now)
+
+
+def _is_store_file(path):
+    if path.suffix == ".part":
+        return True
+    stem = path.stem
+    return len(stem) == 64 and all(ch in "0123456789abcdef" for ch in stem)
+
+
+# ---------------- Reference discovery ----------------
+
+def _iter_strings(obj):
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from _iter_strings(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            yield from _iter_strings(v)
+
+
+def _json_documents(path):
+    """The JSON document in `path`, or each line of a JSON-lines `*.journal` (autosaves)."""
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError:
+        return
+    if path.suffix != ".journal":
+        lines = [text]
+    else:
+        lines = text.splitlines()
+    for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # unreadable draft, or the torn tail of a journal
+            continue
+
+
+def draft_references(drafts_dir):
+    """
+    File names referenced by any string value in the drafts' JSON, or in
+    the entries of JSON-lines journals next to them (autosaves keep their
+    latest edits there until compaction).
+    """
+    names = set()
+    drafts_dir = Path(drafts_dir)
+    for p in [*drafts_dir.glob("*.json"), *drafts_dir.glob("*.journal")]:
+        for doc in _json_documents(p):
+            for s in _iter_strings(doc):
+                # drafts may carry Windows paths; take the last component either way
+                names.add(s.replace("\\", "/").rsplit("/", 1)[-1])
+    return names
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def scratch_caches(tmp_path_factory):
+    # renders in tests must not fill the checkout's data/cache
+    from pdf import fonts
+    from pdf import generate_report as gr
+
+    scratch = tmp_path_factory.mktemp("caches")
+    fonts.configure_font_cache(scratch / "fonts")
+    gr.configure_tile_cache(spill_dir=scratch / "tiles")
+    gr.configure_banner_cache(scratch / "banners")
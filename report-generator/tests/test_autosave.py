@@ -0,0 +1,115 @@
+import os
+import time
+from datetime import date
+
+from storage.autosave import AutosaveStore
+
+
+def _form(**kwargs):
+    form = {"sample": "S-1", "customer": "", "sections_data": {"sample_information": {"date_received": date(2025, 9, 12)}}}
+    form.update(kwargs)
+    return form
+
+
+def _reopen(tmp_path, autosave_id):
+    return AutosaveStore(tmp_path).session(autosave_id).form
+
+
+def test_save_appends_only_changes_and_restores(tmp_path):
+    store = AutosaveStore(tmp_path, compact_entries=10**6)
+    session = store.session()
+    form = _form()
+    session.save(form)
+    session.compact()
+
+    form["customer"] = "ACME Optics"
+    written = session.save(form)
+    assert 0 < written < 100
+    assert session.save(form) == 0
+
+    del form["sample"]
+    session.save(form)
+    assert _reopen(tmp_path, session.id) == form
+
+
+def test_torn_journal_tail_is_dropped(tmp_path):
+    store = AutosaveStore(tmp_path, compact_entries=10**6)
+    session = store.session()
+    form = _form()
+    session.save(form)
+    session.compact()
+    form["customer"] = "ACME Optics"
+    session.save(form)
+    with open(session.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 99, "set": [[["customer"], "tor')
+
+    restored = AutosaveStore(tmp_path).session(session.id)
+    assert restored.form == form
+    form["sample"] = "S-2"
+    restored.save(form)
+    assert _reopen(tmp_path, session.id) == form
+
+
+def test_compaction_keeps_newer_entries(tmp_path):
+    store = AutosaveStore(tmp_path, compact_entries=10**6)
+    session = store.session()
+    form = _form()
+    for i in range(5):
+        form["customer"] = f"customer {i}"
+        session.save(form)
+    session.compact()
+    assert session.stats()["journal_entries"] == 0
+    form["sample"] = "S-9"
+    session.save(form)
+    assert _reopen(tmp_path, session.id) == form
+
+
+def test_list_reads_summaries_without_opening_sessions(tmp_path):
+    writer = AutosaveStore(tmp_path, compact_entries=10**6)
+    session = writer.session()
+    form = _form()
+    session.save(form)
+    session.compact()
+    form["customer"] = "ACME Optics"
+    session.save(form)  # only in the journal
+
+    reader = AutosaveStore(tmp_path)
+    (info,) = reader.list()
+    assert (info.id, info.sample, info.customer) == (session.id, "S-1", "ACME Optics")
+    assert len(reader._sessions) == 0
+
+
+def test_prune_removes_expired_autosaves_but_not_open_ones(tmp_path):
+    # written by another process, not open here
+    old = AutosaveStore(tmp_path).session()
+    old.save(_form())
+    old.compact()
+    store = AutosaveStore(tmp_path, max_age_s=3600)
+    open_old, fresh = store.session(), store.session()
+    for session in (open_old, fresh):
+        session.save(_form())
+        session.compact()
+    past = time.time() - 7200
+    for session in (old, open_old):
+        for p in tmp_path.glob(f"{session.id}.*"):
+            os.utime(p, (past, past))
+
+    assert store.prune() == [old.id]
+    assert {info.id for info in store.list()} == {open_old.id, fresh.id}
+    assert not list(tmp_path.glob(f"{old.id}.*"))
+
+
+def test_list_never_truncates_a_journal_being_appended(tmp_path):
+    writer = AutosaveStore(tmp_path, compact_entries=10**6)
+    session = writer.session()
+    session.save(_form())
+    session.meta_path.unlink()
+    # another session is mid-append: the line has no newline yet
+    with open(session.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "set": [[["customer"], "ACME')
+    before = session.journal_path.read_bytes()
+
+    (info,) = AutosaveStore(tmp_path).list()
+    assert (info.id, info.sample) == (session.id, "S-1")
+    assert session.journal_path.read_bytes() == before
+    assert not session.meta_path.exists()
@@ -0,0 +1,32 @@
+import os
+
+from PIL import Image
+
+from pdf.encoding import ImagePolicy, fit_and_encode
+
+
+def test_bytes_saved_is_counted_for_a_photographic_figure(tmp_path):
+    # noise has as many colours as pixels: photographic, so it is embedded as JPEG
+    src = tmp_path / "photo.png"
+    Image.frombytes("RGB", (400, 300), os.urandom(400 * 300 * 3)).save(src)
+    policy = ImagePolicy(track_savings=True)
+
+    encoded = fit_and_encode(src, 200, 150, policy)
+
+    stats = policy.stats
+    assert encoded.format == "JPEG"
+    assert (stats["jpeg"], stats["png"], stats["passthrough"]) == (1, 0, 0)
+    assert stats["bytes_out"] == len(encoded.data)
+    assert stats["bytes_saved"] > 0
+
+
+def test_bytes_saved_is_counted_for_a_passthrough_jpeg(tmp_path):
+    src = tmp_path / "photo.jpg"
+    Image.frombytes("RGB", (200, 150), os.urandom(200 * 150 * 3)).save(src, quality=85)
+    policy = ImagePolicy(track_savings=True)
+
+    encoded = fit_and_encode(src, 200, 150, policy)
+
+    assert encoded.data == src.read_bytes()
+    assert policy.stats["passthrough"] == 1
+    assert policy.stats["bytes_saved"] > 0
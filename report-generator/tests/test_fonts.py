@@ -0,0 +1,35 @@
+from reportlab.pdfbase.ttfonts import TTFont
+
+from pdf import fonts
+
+
+def test_cached_font_matches_parsed_font(tmp_path, monkeypatch):
+    monkeypatch.setattr(fonts, "_METRICS_CACHE", None)
+    fonts.configure_font_cache(tmp_path)
+    fonts.load_ttfont("DejaVu", fonts.FONT_PATH)
+    cached = fonts.load_ttfont("DejaVu", fonts.FONT_PATH)
+
+    assert fonts.font_cache_stats()["hits"] == 1
+    parsed = TTFont("DejaVu", str(fonts.FONT_PATH))
+    assert fonts.font_mismatch(cached, parsed) is None
+    text = "Žluťoučký kůň ±0.5 J/cm²"
+    assert cached.stringWidth(text, 10) == parsed.stringWidth(text, 10)
+
+
+def test_mismatching_rebuild_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(fonts, "_METRICS_CACHE", None)
+    fonts.configure_font_cache(tmp_path)
+    init = TTFont.__init__
+
+    def changed_init(self, *args, **kwargs):
+        # a reportlab release that sets up something the rebuild does not know about
+        init(self, *args, **kwargs)
+        self.newAttribute = True
+
+    monkeypatch.setattr(TTFont, "__init__", changed_init)
+    first = fonts.load_ttfont("DejaVu", fonts.FONT_PATH)
+    second = fonts.load_ttfont("DejaVu", fonts.FONT_PATH)
+
+    assert first.newAttribute and second.newAttribute
+    assert fonts.font_cache_stats()["hits"] == 0
+    assert not list(tmp_path.iterdir())
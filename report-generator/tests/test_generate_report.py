@@ -0,0 +1,36 @@
+import logging
+from pathlib import Path
+
+from bench.synthetic import make_context
+from configs.defaults import DEFAULT_CONTEXT
+from pdf.generate_report import _load_svg_drawing, generate_report
+
+PARAMS = {"sections": 1, "items": 2, "note_words": 0, "figures": {"template1": 1}, "image_px": 2000}
+
+
+def test_undecodable_figure_becomes_placeholder(tmp_path, caplog):
+    ctx = make_context(PARAMS, directory=tmp_path)
+    figure = next(s for s in ctx["sections"] if s.get("images"))
+    src = Path(figure["images"]["items"][0]["path"])
+    # header intact (layout can size it), pixel data cut off
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(src.read_bytes()[:5000])
+    figure["images"]["items"][0]["path"] = str(broken)
+
+    with caplog.at_level(logging.WARNING, logger="pdf.generate_report"):
+        pdf = generate_report(ctx, output_path=None)
+
+    assert pdf.startswith(b"%PDF")
+    assert any(str(broken) in r.getMessage() for r in caplog.records)
+
+
+def test_svg_drawings_are_private_copies():
+    first = _load_svg_drawing(DEFAULT_CONTEXT["logo_title"], 48)
+    height = first.height
+    first.scale(3, 3)
+    first.height *= 3
+    second = _load_svg_drawing(DEFAULT_CONTEXT["logo_title"], 48)
+
+    assert second is not first
+    assert second.height == height
+    assert second.transform != first.transform
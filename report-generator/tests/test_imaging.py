@@ -0,0 +1,60 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from pdf.imaging import BYTES_PER_BUDGET_PIXEL
+
+ROOT = Path(__file__).resolve().parents[1]
+MB = 1024 * 1024
+
+# run in a fresh interpreter: VmHWM is the process's all-time peak
+_CHILD = r"""
+import json, sys
+from pathlib import Path
+sys.path.insert(0, {root!r})
+scratch = Path({scratch!r})
+
+def vm(key):
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) * 1024 for l in f if l.startswith(key))
+
+from bench.synthetic import make_context, scenario_params
+from pdf import fonts, imaging
+from pdf import generate_report as gr
+from pdf.encoding import ImagePolicy
+
+fonts.configure_font_cache(scratch / "fonts")
+gr.configure_tile_cache(spill_dir=scratch / "tiles")
+gr.configure_banner_cache(scratch / "banners")
+figures = make_context(scenario_params("figures_20"), directory=scratch / "assets")
+gr.generate_report(make_context(scenario_params("baseline"), directory=scratch / "assets"), output_path=None)
+imaging._malloc_trim()
+base = vm("VmRSS")
+
+imaging.configure_pixel_budget({budget})
+figures["prefetch_workers"] = 8
+gr.generate_report(figures, output_path=None, image_policy=ImagePolicy(raster_dpi=300))
+print(json.dumps({{"base": base, "hwm": vm("VmHWM"), "stats": imaging.pixel_budget_stats()}}))
+"""
+
+BUDGET = 24_000_000
+# what the budget does not cover: encoded tiles, painting them into the PDF, the PDF itself
+UNBUDGETED_BYTES = 128 * MB
+
+
+@pytest.mark.skipif(not Path("/proc/self/status").exists(), reason="needs /proc (VmHWM)")
+def test_twenty_figure_report_stays_within_pixel_budget(tmp_path):
+    child = _CHILD.format(root=str(ROOT), scratch=str(tmp_path), budget=BUDGET)
+    out = subprocess.run([sys.executable, "-c", child],
+                         capture_output=True, text=True, check=True, timeout=600)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    stats = result["stats"]
+
+    # 12 MP figures on 8 workers: the budget was the limit, and nothing was dropped
+    assert stats["waits"] > 0 and stats["rejected"] == 0
+    assert stats["peak"] <= stats["max_pixels"] == BUDGET
+    growth = result["hwm"] - result["base"]
+    assert growth <= BUDGET * BYTES_PER_BUDGET_PIXEL + UNBUDGETED_BYTES, f"peak grew by {growth / MB:.0f} MB"
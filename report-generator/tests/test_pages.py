@@ -0,0 +1,72 @@
+import copy
+
+import pytest
+from reportlab import rl_config
+
+from bench.synthetic import make_context
+from pdf import pages
+from pdf.generate_report import generate_report
+from pdf.pages import PageStore
+
+PARAMS = {"sections": 6, "items": 6, "note_words": 120, "figures": {"template1": 2, "template3": 1}, "image_px": 600}
+
+
+def _edit_text(ctx):
+    ctx["sections"][3]["items"][0][1] = "Changed value"
+
+
+def _repaginate(ctx):
+    ctx["sections"][1]["notes"] += " extra words" * 400
+
+
+def _new_glyphs(ctx):
+    ctx["customer"] = "Žluťoučký kůň úpěl ďábelské ódy"
+    ctx["sections"][4]["notes"] = "Messung ÄÖÜ ß — ±0.5 J/cm²"
+
+
+@pytest.fixture
+def invariant(monkeypatch):
+    # no timestamps or random document ID, so two renders can be compared
+    monkeypatch.setattr(rl_config, "invariant", 1)
+
+
+def test_replayed_pages_match_full_render(tmp_path, invariant):
+    base = make_context(PARAMS, directory=tmp_path)
+    store = PageStore()
+    generate_report(copy.deepcopy(base), output_path=None, page_store=store)
+
+    ctx = copy.deepcopy(base)
+    for edit in (None, _edit_text, _repaginate, _new_glyphs):
+        if edit is not None:
+            edit(ctx)
+        full = generate_report(copy.deepcopy(ctx), output_path=None)
+        incremental = generate_report(copy.deepcopy(ctx), output_path=None, page_store=store)
+        assert incremental == full, edit
+    assert store.stats()["hits"] > 0
+
+
+def test_unknown_reportlab_version_paints_every_page(tmp_path, invariant, monkeypatch):
+    ctx = make_context(PARAMS, directory=tmp_path)
+    store = PageStore()
+    full = generate_report(copy.deepcopy(ctx), output_path=None)
+    monkeypatch.setattr(pages, "REPLAY_REPORTLAB_VERSIONS", ())
+    generate_report(copy.deepcopy(ctx), output_path=None, page_store=store)
+    assert generate_report(copy.deepcopy(ctx), output_path=None, page_store=store) == full
+    assert store.stats()["entries"] == 0
+
+
+def test_store_is_bounded_by_bytes_and_peeks_membership(tmp_path, invariant):
+    ctx = make_context(PARAMS, directory=tmp_path)
+    unbounded = PageStore()
+    generate_report(copy.deepcopy(ctx), output_path=None, page_store=unbounded)
+    stats = unbounded.stats()
+    assert stats["entries"] > 1 and stats["bytes"] > 0
+    # one lookup per page by replay; the prefetch membership checks are not counted
+    assert (stats["hits"], stats["misses"]) == (0, stats["entries"])
+    generate_report(copy.deepcopy(ctx), output_path=None, page_store=unbounded)
+    assert unbounded.stats()["hits"] == stats["entries"]
+
+    bounded = PageStore(max_bytes=stats["bytes"] // 2)
+    generate_report(copy.deepcopy(ctx), output_path=None, page_store=bounded)
+    assert bounded.stats()["bytes"] <= stats["bytes"] // 2
+    assert bounded.stats()["evictions"] > 0
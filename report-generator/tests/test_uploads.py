@@ -0,0 +1,44 @@
+import io
+import json
+import os
+import time
+
+from storage.uploads import UploadStore, draft_references
+
+
+def _age(path, seconds):
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+
+def test_gc_keeps_legacy_and_referenced_uploads(tmp_path):
+    store = UploadStore(tmp_path / "uploads", max_age_s=60)
+    drafts = tmp_path / "drafts"
+    drafts.mkdir()
+
+    in_draft = store.put(io.BytesIO(b"draft image"), "a.png")
+    in_journal = store.put(io.BytesIO(b"journal image"), "b.jpg")
+    orphan = store.put(io.BytesIO(b"orphan image"), "c.png")
+    legacy = store.root / "0b6f7c3e-legacy-upload.png"
+    legacy.write_bytes(b"legacy")
+    for p in (in_draft, in_journal, orphan, legacy):
+        _age(p, 3600)
+
+    (drafts / "d.json").write_text(json.dumps({"image": f"C:\\uploads\\{in_draft.name}"}), encoding="utf-8")
+    (drafts / "s.journal").write_text(
+        json.dumps({"seq": 1, "set": [[["sections_data", "test_setup", "image"], str(in_journal)]]}) + "\n"
+        + '{"seq": 2, "set": [[["tit',  # torn tail
+        encoding="utf-8",
+    )
+
+    removed = store.gc(draft_references(drafts))
+
+    assert removed == [orphan]
+    assert in_draft.exists() and in_journal.exists() and legacy.exists()
+
+
+def test_gc_spares_recent_blobs(tmp_path):
+    store = UploadStore(tmp_path, max_age_s=60)
+    fresh = store.put(io.BytesIO(b"fresh"), "x.png")
+    assert store.gc() == []
+    assert fresh.exists()